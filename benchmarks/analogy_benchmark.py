@@ -0,0 +1,53 @@
+import util
+import model_store
+import word_queries
+
+import os
+import sys
+import time
+
+
+"""
+Benchmark
+"""
+# gensim's one-query-at-a-time most_similar over the same questions, for comparison with the batched engine
+def benchmark_gensim_loop(model, questions, max_questions=2000):
+    questions = questions[:max_questions]
+    start = time.perf_counter()
+    answers = [model.wv.most_similar(positive=[b, c], negative=[a], topn=1)[0][0] for a, b, c, _ in questions]
+    elapsed = time.perf_counter() - start
+    num_correct = sum(answer == question[3] for answer, question in zip(answers, questions))
+    return {"accuracy": num_correct / len(questions), "queries_per_sec": len(questions) / elapsed}
+
+def run_benchmark(model, sections):
+    start = time.perf_counter()
+    engine = word_queries.WordQueryEngine.from_model(model)
+    print(f"Cached {len(engine.words)} unit-normalised word vectors in {time.perf_counter() - start:.2f}s")
+
+    results = {"batched": word_queries.evaluate_analogies(engine, sections)}
+    batched = results["batched"]
+    print(f"{'batched':>8}: {batched['num_in_vocabulary']}/{batched['num_questions']} questions in vocabulary")
+    if batched["num_in_vocabulary"] == 0:
+        return results
+    print(f"{'batched':>8}: accuracy {batched['accuracy']:.3f}, {batched['queries_per_sec']:10.1f} queries/sec")
+
+    questions = [question for _, section_questions in sections for question in section_questions
+                 if all(word in engine for word in question)]
+    results["gensim"] = benchmark_gensim_loop(model, questions)
+    print(f"{'gensim':>8}: accuracy {results['gensim']['accuracy']:.3f}, {results['gensim']['queries_per_sec']:10.1f} queries/sec")
+    return results
+
+
+def main():
+    filepath = sys.argv[1] if len(sys.argv) > 1 else util.DOC2VEC_MODEL_DBOW_FILE
+    if not os.path.exists(filepath):
+        print(f"No model at {filepath}; run 2_doc2vec.ipynb first or pass a model path")
+        sys.exit(1)
+    model = model_store.load_doc2vec_model(filepath)
+    sections = word_queries.read_analogy_questions()
+    print(f"Benchmarking analogy queries over {sum(len(questions) for _, questions in sections)} questions...")
+    run_benchmark(model, sections)
+
+
+if __name__ == "__main__":
+    main()
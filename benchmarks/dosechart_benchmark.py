@@ -0,0 +1,102 @@
+import scrape
+import dosechart
+from benchmarks import synthetic
+
+import argparse
+import time
+
+import numpy as np
+
+
+"""
+Constants
+"""
+NUM_REPEATS = 5
+
+
+"""
+Parsers
+"""
+# scrape's original per-label parsing: one find() over the chart's parent for each dosage level and duration type
+def parse_per_label(soup):
+    dosechart_info_dict = {}
+    for dosechart_tag in soup.find_all(class_="dosechart"):
+        roa = dosechart_tag["data-roa"].lower()
+        dosage_dict = scrape.get_dosage_dict(dosechart_tag)
+        duration_dict = scrape.get_duration_dict(dosechart_tag)
+        if len(dosage_dict) != 0 and len(duration_dict) != 0:
+            dosechart_info_dict[roa] = {
+                "dosage": dosage_dict,
+                "duration": duration_dict
+            }
+    return dosechart_info_dict
+
+def parse_single_pass(soup):
+    return dosechart.to_dosechart_info_dict(dosechart.parse_dosecharts(soup))
+
+def time_parser(parse, soups, num_repeats):
+    timings = []
+    for _ in range(num_repeats):
+        start = time.perf_counter()
+        results = {drug: parse(soup) for drug, soup in soups.items()}
+        timings.append(time.perf_counter() - start)
+    return min(timings), results
+
+
+"""
+Benchmark
+"""
+def run_benchmark(num_repeats=NUM_REPEATS, verbose=True):
+    from bs4 import BeautifulSoup
+
+    pages = synthetic.generate_psychonaut_wiki_drug_pages()
+    soups = {drug: BeautifulSoup(page, "html.parser") for drug, page in pages.items()}
+
+    per_label_sec, per_label_results = time_parser(parse_per_label, soups, num_repeats)
+    single_pass_sec, single_pass_results = time_parser(parse_single_pass, soups, num_repeats)
+    mismatches = [drug for drug in soups if per_label_results[drug] != single_pass_results[drug]]
+
+    start = time.perf_counter()
+    table = dosechart.build_table({drug: dosechart.parse_dosecharts(soup) for drug, soup in soups.items()})
+    table_sec = time.perf_counter() - start
+
+    # a vectorised query over every chart at once: the heaviest common dose (mg) of any route per drug
+    start = time.perf_counter()
+    common = dosechart.select(table, kind="dosage", level="common")
+    drugs, drug_indices = np.unique(common["drug"], return_inverse=True)
+    max_common_mg = np.full(len(drugs), -np.inf)
+    np.maximum.at(max_common_mg, drug_indices.ravel(), common["low"])
+    query_sec = time.perf_counter() - start
+
+    results = {
+        "num_pages": len(soups),
+        "num_rows": len(table),
+        "per_label_sec": per_label_sec,
+        "single_pass_sec": single_pass_sec,
+        "speedup": per_label_sec / single_pass_sec,
+        "mismatches": mismatches,
+        "table_sec": table_sec,
+        "query_sec": query_sec,
+        "table_bytes": table.nbytes
+    }
+    if verbose:
+        print(f"{results['num_pages']} pages, {results['num_rows']} rows")
+        print(f"   per-label parsing: {1000 * per_label_sec:8.1f} ms ({len(soups) / per_label_sec:8.1f} pages/sec)")
+        print(f" single-pass parsing: {1000 * single_pass_sec:8.1f} ms ({len(soups) / single_pass_sec:8.1f} pages/sec), {results['speedup']:.2f}x")
+        print(f" parse + build table: {1000 * table_sec:8.1f} ms, {results['table_bytes']} bytes ({table.dtype.itemsize} bytes/row)")
+        print(f"  max common dose/drug: {1000 * query_sec:8.3f} ms")
+        print(f"          mismatches: {mismatches or 'none'}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-label vs single-pass dosechart parsing on synthetic Psychonaut Wiki pages")
+    parser.add_argument("--num-repeats", type=int, default=NUM_REPEATS)
+    args = parser.parse_args()
+    results = run_benchmark(args.num_repeats)
+    if results["mismatches"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import util
+import extract
+from benchmarks import synthetic
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+
+"""
+Fixtures
+"""
+# copy up to num_pages raw report pages out of the crawl store so the benchmark can run offline
+def save_fixtures_from_crawl_store(num_pages=500, fixtures_dir=util.EROWID_REPORT_FIXTURES_DIR):
+    import crawl
+    os.makedirs(fixtures_dir, exist_ok=True)
+    store = crawl.CrawlStore()
+    num_saved = 0
+    for report_id, raw_body in store.iter_raw_bodies():
+        if num_saved >= num_pages: break
+        with open(os.path.join(fixtures_dir, f"{report_id}.html"), "wb") as f:
+            f.write(raw_body)
+        num_saved += 1
+    store.close()
+    return num_saved
+
+# the pages shipped in fixtures_dir cover the markup edge cases (bare "<", script/style, entities, cp1252); synthetic
+# report pages add volume
+def load_fixtures(fixtures_dir=util.EROWID_REPORT_FIXTURES_DIR):
+    pages = []
+    for filepath in sorted(glob.glob(os.path.join(fixtures_dir, "*.html"))):
+        with open(filepath, "rb") as f:
+            pages.append(f.read())
+    return pages
+
+
+"""
+Benchmark
+"""
+# whitespace differences are not significant downstream (spaCy tokenization), so compare normalised text too
+def normalise_whitespace(text):
+    return " ".join(text.split())
+
+def benchmark_backend(pages, backend, repeat=3):
+    best = float("inf")
+    outputs = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        outputs = [extract.extract_trip_report(page, backend=backend) for page in pages]
+        best = min(best, time.perf_counter() - start)
+    return outputs, len(pages) / best
+
+def run_benchmark(pages, backends=("reference", "fast", "html.parser", "lxml"), repeat=3):
+    results = {}
+    reference_outputs = None
+    for backend in backends:
+        try:
+            outputs, pages_per_sec = benchmark_backend(pages, backend, repeat=repeat)
+        except ImportError as e:
+            print(f"Skipping backend {backend}: {e}")
+            continue
+        if reference_outputs is None:
+            reference_outputs = outputs
+        num_exact = sum(a == b for a, b in zip(outputs, reference_outputs))
+        num_normalised = sum(normalise_whitespace(a) == normalise_whitespace(b) for a, b in zip(outputs, reference_outputs))
+        results[backend] = {
+            "pages_per_sec": pages_per_sec,
+            "exact_match": num_exact / len(pages),
+            "whitespace_normalised_match": num_normalised / len(pages)
+        }
+        print(f"{backend:>12}: {pages_per_sec:10.1f} pages/sec, "
+              f"exact match {num_exact}/{len(pages)}, whitespace-normalised match {num_normalised}/{len(pages)}")
+    return results
+
+
+def load_synthetic_pages(num_pages, seed=synthetic.SEED):
+    texts, labels = synthetic.generate_corpus(num_pages, seed=seed)
+    return synthetic.generate_erowid_report_pages(texts, labels)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Erowid body extraction backends against the BeautifulSoup reference")
+    parser.add_argument("--num-synthetic-pages", type=int, default=500)
+    parser.add_argument("--from-crawl-store", type=int, default=0, metavar="NUM_PAGES",
+                        help="first copy this many real pages from the crawl store into the fixtures directory")
+    args = parser.parse_args()
+
+    if args.from_crawl_store:
+        save_fixtures_from_crawl_store(args.from_crawl_store)
+    pages = load_fixtures() + load_synthetic_pages(args.num_synthetic_pages)
+    if len(pages) == 0:
+        print("No pages to benchmark")
+        sys.exit(1)
+    print(f"Benchmarking body extraction over {len(pages)} pages...")
+    run_benchmark(pages)
+
+
+if __name__ == "__main__":
+    main()
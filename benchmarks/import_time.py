@@ -0,0 +1,57 @@
+import re
+import subprocess
+import sys
+
+
+"""
+Constants
+"""
+# entry points whose startup should stay fast, with their cumulative import time budget (ms)
+IMPORT_TIME_BUDGETS_MS = {
+    "scrape": 500,
+    "predict": 500,
+    "util": 100
+}
+
+# heavy packages that none of the entry points above may import at module level
+FORBIDDEN_MODULES = ("pandas", "sklearn", "matplotlib", "seaborn", "gensim", "spacy", "bs4", "langdetect")
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+"""
+Measurement
+"""
+# run `python -X importtime -c "import <module>"` in a fresh interpreter and parse its stderr into
+# {module: cumulative microseconds} for every module imported along the way
+def get_import_times(module, repeat=3):
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                capture_output=True, text=True, check=True)
+        import_times = {}
+        for line in result.stderr.splitlines():
+            match = IMPORT_TIME_LINE.match(line)
+            if match:
+                import_times[match.group(4)] = int(match.group(2))
+        if best is None or import_times[module] < best[module]:
+            best = import_times
+    return best
+
+def check_import_time(module, budget_ms, forbidden_modules=FORBIDDEN_MODULES):
+    import_times = get_import_times(module)
+    elapsed_ms = import_times[module] / 1000
+    imported = sorted(name for name in import_times if name.split(".")[0] in forbidden_modules and "." not in name)
+    ok = elapsed_ms <= budget_ms and len(imported) == 0
+    print(f"{module:>10}: {elapsed_ms:8.1f} ms (budget {budget_ms} ms)" + (f", imports {', '.join(imported)}" if imported else "")
+          + ("" if ok else "  FAILED"))
+    return ok
+
+
+def main():
+    results = [check_import_time(module, budget_ms) for module, budget_ms in IMPORT_TIME_BUDGETS_MS.items()]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import util
+import extract
+import langfilter
+import vocab
+import features
+import kfold
+import instrument
+from benchmarks import synthetic
+
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+
+import numpy as np
+
+
+"""
+Constants
+"""
+NUM_DOCS = 2000
+NUM_EPOCHS = 5
+K_FOLD = 5
+
+
+"""
+Stages
+"""
+def fallback_tokenize(texts, custom_stop_words):
+    return [[token for token in text.lower().replace(".", " ").split() if token not in custom_stop_words] for text in texts]
+
+def run_benchmark(num_docs=NUM_DOCS, num_epochs=NUM_EPOCHS, k_fold=K_FOLD, num_processes=None, seed=synthetic.SEED, verbose=True):
+    results = {}
+    def record(stage):
+        results[stage.name] = stage.result
+        if verbose:
+            print(f"{stage.name:>34}: {stage.result['wall_sec']:8.2f}s, {stage.result['items_per_sec'] or 0:10.1f} docs/sec, "
+                  f"peak RSS {stage.result['peak_rss_mb']:.0f} MB")
+
+    texts, labels = synthetic.generate_corpus(num_docs, seed=seed)
+    pages = synthetic.generate_erowid_report_pages(texts, labels)
+
+    with instrument.Stage("extraction", len(pages)) as stage:
+        texts = [extract.extract_trip_report(page) for page in pages]
+    record(stage)
+
+    drug_to_trip_reports_dict = {}
+    for text, drug in zip(texts, labels):
+        drug_to_trip_reports_dict.setdefault(drug, []).append(text)
+    with instrument.Stage("language_filter", len(texts)) as stage:
+        filtered_dict, _ = langfilter.filter_language(drug_to_trip_reports_dict, num_processes=num_processes, use_cache=False, seed=seed)
+    record(stage)
+    labels = [drug for drug, trip_reports in filtered_dict.items() for _ in trip_reports]
+    texts = [trip_report for trip_reports in filtered_dict.values() for trip_report in trip_reports]
+
+    custom_stop_words = vocab.load_custom_stop_words()
+    with instrument.Stage("tokenization", len(texts)) as stage:
+        try:
+            import preprocessing
+            token_lists = list(preprocessing.tokenize_trip_reports(
+                [preprocessing.preprocess(text) for text in texts], custom_stop_words, n_process=num_processes or os.cpu_count()))
+        except (ImportError, OSError) as e:
+            # spaCy (or its English model) is not installed: tokenize_trip_reports loads the pipeline in this process
+            # before starting any worker, so this is raised up front; record the stage as skipped and carry on with
+            # whitespace tokens
+            stage.attrs["skipped"] = f"{e.__class__.__name__}: {e}"
+            token_lists = fallback_tokenize(texts, custom_stop_words)
+    record(stage)
+
+    with instrument.Stage("vocabulary", len(token_lists)) as stage:
+        vocabulary = vocab.Vocabulary().add_documents(token_lists)
+        kept_tokens = vocabulary.get_kept_tokens()
+        token_lists = [vocabulary.filter_tokens(tokens) for tokens in token_lists]
+    stage.result["vocabulary_size"] = len(kept_tokens)
+    record(stage)
+
+    import gensim
+    docs = [gensim.models.doc2vec.TaggedDocument(tokens, [f"DOC_{i}"]) for i, tokens in enumerate(token_lists)]
+    model = gensim.models.doc2vec.Doc2Vec(vector_size=100, window=10, min_count=1, workers=num_processes or os.cpu_count(), dm=1, seed=seed)
+    model.build_vocab(docs)
+    epoch_results = []
+    for epoch in range(num_epochs):
+        with instrument.Stage(f"doc2vec_epoch_{epoch + 1}", len(docs)) as stage:
+            model.train(docs, total_examples=model.corpus_count, epochs=1)
+        epoch_results.append(stage.result)
+        record(stage)
+    results["doc2vec"] = {
+        "num_epochs": num_epochs,
+        "wall_sec": sum(result["wall_sec"] for result in epoch_results),
+        "items_per_sec": float(np.mean([result["items_per_sec"] for result in epoch_results])),
+        "peak_rss_mb": max(result["peak_rss_mb"] for result in epoch_results)
+    }
+
+    y = np.array(labels)
+    indices = np.arange(len(y))
+    rng = np.random.RandomState(seed)
+    rng.shuffle(indices)
+    train_indices, test_indices = np.sort(indices[:int(0.8 * len(y))]), np.sort(indices[int(0.8 * len(y)):])
+    with tempfile.TemporaryDirectory() as features_dir:
+        with instrument.Stage("feature_extraction", len(y)) as stage:
+            features.write_feature_store(model, y, np.ones(len(y), dtype=bool), train_indices, test_indices, "benchmark", features_dir=features_dir)
+            feature_store = features.load_feature_store("benchmark", features_dir=features_dir)
+            X_train, X_test, y_train, y_test = feature_store.get_train_test_split()
+        record(stage)
+
+        from sklearn.naive_bayes import GaussianNB
+        from sklearn.linear_model import LogisticRegression
+        for clf in (GaussianNB(), LogisticRegression(max_iter=200)):
+            with instrument.Stage(f"classifier_fit_{clf.__class__.__name__}", len(y_train)) as stage:
+                clf.fit(X_train, y_train)
+            record(stage)
+
+        with instrument.Stage("k_fold", len(y)) as stage:
+            aggregate = kfold.run_k_fold(feature_store.X, feature_store.y, GaussianNB(), k_fold=k_fold, num_processes=num_processes)
+        stage.result["f_score_mean"] = aggregate["f_score_mean"]
+        record(stage)
+        del feature_store, X_train, X_test
+
+    return results
+
+
+"""
+Results
+"""
+def get_environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count()
+    }
+
+def save_results(results, config, results_dir=util.BENCHMARK_RESULTS_DIR):
+    os.makedirs(results_dir, exist_ok=True)
+    filepath = os.path.join(results_dir, f"pipeline_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(filepath, "w") as f:
+        json.dump({"config": config, "environment": get_environment(), "stages": results}, f, indent=4)
+    return filepath
+
+# docs/sec and peak RSS of every stage relative to an earlier run (ratios above 1 mean faster or larger)
+def compare_results(results, baseline_filepath):
+    with open(baseline_filepath) as f:
+        baseline = json.load(f)["stages"]
+    for name, result in results.items():
+        if name not in baseline or not result.get("items_per_sec") or not baseline[name].get("items_per_sec"):
+            continue
+        speedup = result["items_per_sec"] / baseline[name]["items_per_sec"]
+        rss_ratio = result["peak_rss_mb"] / baseline[name]["peak_rss_mb"]
+        print(f"{name:>34}: {speedup:6.2f}x docs/sec, {rss_ratio:6.2f}x peak RSS")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline per-stage benchmark of the pipeline on a synthetic corpus")
+    parser.add_argument("--num-docs", type=int, default=NUM_DOCS)
+    parser.add_argument("--num-epochs", type=int, default=NUM_EPOCHS)
+    parser.add_argument("--k-fold", type=int, default=K_FOLD)
+    parser.add_argument("--num-processes", type=int, default=None)
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    print(f"Benchmarking the pipeline on {args.num_docs} synthetic trip reports...")
+    results = run_benchmark(args.num_docs, args.num_epochs, args.k_fold, args.num_processes)
+    filepath = save_results(results, vars(args))
+    print(f"Results written to {filepath}")
+    if args.compare:
+        compare_results(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
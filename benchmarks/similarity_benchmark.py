@@ -0,0 +1,74 @@
+import similarity
+
+import sys
+import time
+
+import numpy as np
+
+
+"""
+Data
+"""
+def load_vectors(name="dm"):
+    import features
+    try:
+        return np.asarray(features.load_feature_store(name).X)
+    except FileNotFoundError:
+        return None
+
+# clustered random vectors roughly shaped like the doc vectors, for when no feature store has been written yet
+def make_synthetic_vectors(num_docs=100000, vector_size=100, num_topics=50, random_state=0):
+    rng = np.random.RandomState(random_state)
+    topics = rng.normal(size=(num_topics, vector_size))
+    return (topics[rng.randint(num_topics, size=num_docs)] + rng.normal(scale=0.5, size=(num_docs, vector_size))).astype(np.float32)
+
+
+"""
+Benchmark
+"""
+def recall_at_k(ids, exact_ids):
+    return np.mean([len(np.intersect1d(a, b)) / len(b) for a, b in zip(ids, exact_ids)])
+
+def time_search(search, repeat=3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = search()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+def run_benchmark(X, num_queries=1000, k=10, n_probes=(1, 2, 4, 8, 16, 32), n_clusters=None, random_state=0):
+    query_ids = np.random.RandomState(random_state).choice(len(X), min(num_queries, len(X)), replace=False)
+    results = {}
+
+    exact_index = similarity.ExactIndex(X)
+    (exact_ids, _), exact_sec = time_search(lambda: exact_index.search_by_ids(query_ids, k))
+    results["exact"] = {"recall": 1.0, "ms_per_query": exact_sec / len(query_ids) * 1000}
+    print(f"{'exact':>12}: recall@{k} 1.000, {results['exact']['ms_per_query']:8.3f} ms/query")
+
+    start = time.perf_counter()
+    ivf_index = similarity.IVFIndex.build(X, n_clusters=n_clusters, random_state=random_state)
+    print(f"Built IVF index with {len(ivf_index.centroids)} clusters in {time.perf_counter() - start:.1f}s")
+    for n_probe in n_probes:
+        if n_probe > len(ivf_index.centroids): break
+        (ids, _), sec = time_search(lambda: ivf_index.search_by_ids(query_ids, k, n_probe))
+        name = f"ivf_probe_{n_probe}"
+        results[name] = {"recall": float(recall_at_k(ids, exact_ids)), "ms_per_query": sec / len(query_ids) * 1000}
+        print(f"{name:>12}: recall@{k} {results[name]['recall']:.3f}, {results[name]['ms_per_query']:8.3f} ms/query")
+    return results
+
+
+def main():
+    X = load_vectors()
+    if X is None:
+        print("No feature store found; benchmarking on synthetic vectors")
+        X = make_synthetic_vectors()
+    if len(X) == 0:
+        sys.exit(1)
+    print(f"Benchmarking top-k similarity search over {X.shape[0]} vectors of size {X.shape[1]}...")
+    run_benchmark(X)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import util
+import scrape
+
+import html
+import os
+import pickle
+
+import numpy as np
+
+
+"""
+Constants
+"""
+SEED = 0
+
+WORDS_PER_DOC = 600
+
+# share of each synthetic report drawn from its drug's own effect words, so the drugs are (weakly) separable
+DRUG_WORD_SHARE = 0.15
+NUM_DRUG_WORDS = 40
+
+NON_ENGLISH_SHARE = 0.03
+
+ENGLISH_WORDS = """
+i we it was the a and to of in that my felt feel like about after before then time very really more some
+could would started began first hour hours minutes later still around into back out up down over again body mind
+friend friends room music light lights eyes closed open face hands floor bed couch outside walk walked trees sky
+thought thoughts think thinking remember memory experience trip dose took taking swallowed drank ate smoked tea
+visual visuals pattern patterns colors colours geometry shapes breathing breathing waves wave warm cold stomach
+nausea anxiety fear calm peace happy laughing laughed cried crying love connection everything nothing reality
+self ego time space world universe energy sound voices talking conversation strange weird intense mild strong
+beautiful wonderful terrible difficult confusing clear understanding realized realised insight peak comedown
+sleep slept tired awake morning night evening afternoon day next week people person someone anyone something
+""".split()
+
+NON_ENGLISH_SENTENCES = [
+    "la experiencia fue muy intensa y sentí que el tiempo se detenía por completo durante horas",
+    "ich hatte das gefühl dass die musik durch meinen körper floss und alles leuchtete",
+    "je me suis allongé sur le lit et les couleurs ont commencé à danser devant mes yeux",
+    "a experiência foi muito bonita e eu me senti conectado com tudo ao meu redor"
+]
+
+EFFECT_WORDS = """
+euphoria stimulation sedation introspection empathy closed_eye open_eye hallucination tracers drifting breathing
+morphing synesthesia dissociation derealization depersonalization anxiety paranoia nausea vasoconstriction jaw
+clenching bruxism appetite thirst insomnia fatigue headache muscle tension body_high spiritual mystical ego_death
+time_distortion thought_loops déjà_vu conceptual_thinking creativity music_enhancement color_enhancement
+pattern_recognition giggling laughter emotionality wakefulness dreams afterglow comedown sleepiness itching
+""".split()
+
+
+"""
+Corpus
+"""
+def read_drugs():
+    psychedelics = util.read_psychedelics_file()
+    return psychedelics["psychonaut_wiki_id"]
+
+def read_custom_stop_words():
+    with open(util.CUSTOM_STOP_WORDS_FILE) as f:
+        return [line.strip() for line in f if line.strip()]
+
+# num_docs synthetic trip reports over the real drug list, drugs drawn with a long-tailed (Zipf-like) frequency like
+# the real crawl; each report mixes common English words, words specific to its drug and the custom stop words (drug
+# names, routes of administration...) that tokenization is expected to remove. A small share is not English at all
+def generate_corpus(num_docs, words_per_doc=WORDS_PER_DOC, non_english_share=NON_ENGLISH_SHARE, seed=SEED):
+    rng = np.random.RandomState(seed)
+    drugs = read_drugs()
+    stop_words = read_custom_stop_words()
+    drug_weights = 1.0 / np.arange(1, len(drugs) + 1)
+    labels = [drugs[i] for i in rng.choice(len(drugs), num_docs, p=drug_weights / drug_weights.sum())]
+    drug_to_words_dict = {drug: list(rng.choice(EFFECT_WORDS + ENGLISH_WORDS, NUM_DRUG_WORDS, replace=False)) for drug in drugs}
+
+    texts = []
+    for drug in labels:
+        if rng.rand() < non_english_share:
+            sentences = rng.choice(NON_ENGLISH_SENTENCES, max(1, words_per_doc // 15))
+            texts.append(". ".join(sentences) + ".")
+            continue
+        num_words = max(20, int(rng.normal(words_per_doc, words_per_doc / 4)))
+        num_drug_words = int(num_words * DRUG_WORD_SHARE)
+        num_stop_words = int(num_words * 0.02)
+        words = (list(rng.choice(ENGLISH_WORDS, num_words - num_drug_words - num_stop_words))
+                 + list(rng.choice(drug_to_words_dict[drug], num_drug_words))
+                 + list(rng.choice(stop_words, num_stop_words)) + [drug])
+        rng.shuffle(words)
+        sentences = [" ".join(words[i:i+12]).capitalize() for i in range(0, len(words), 12)]
+        texts.append(". ".join(sentences) + ".")
+    return texts, labels
+
+
+"""
+Erowid pages
+"""
+# an Erowid experience page in the same shape the crawler sees: windows-1252 encoded, the report between the body
+# comment markers, with paragraph breaks, entities and a dose chart table before it
+def generate_erowid_report_page(report_id, drug, text):
+    paragraphs = text.split(". ")
+    body = "<BR>\n<BR>\n".join(html.escape(". ".join(paragraphs[i:i+5])) for i in range(0, len(paragraphs), 5))
+    page = f"""<html><head><meta http-equiv="Content-Type" content="text/html; charset=windows-1252">
+<title>{html.escape(drug)} - Erowid Exp - {report_id}</title></head>
+<body><div class="report-text-surround">
+<table class="dosechart"><tr><td class="dosechart-amount">1 hit</td><td class="dosechart-substance">{html.escape(drug)}</td></tr></table>
+<!-- Start Body -->
+{body}
+<!-- End Body -->
+<table class="footdata"><tr><td class="footdata-expyear">Exp Year: 2015</td><td>ExpID: {report_id}</td></tr></table>
+</div></body></html>"""
+    return page.encode("cp1252", errors="replace")
+
+def generate_erowid_report_pages(texts, labels):
+    return [generate_erowid_report_page(100000 + i, drug, text) for i, (text, drug) in enumerate(zip(texts, labels))]
+
+
+"""
+Psychonaut Wiki pages
+"""
+def load_dosechart_info(filepath=util.DRUG_TO_DOSECHART_INFO_DICT_FILE):
+    with open(filepath, "rb") as f:
+        return pickle.load(f)
+
+def format_number(value):
+    return f"{value:g}"
+
+def _row(href, title, value):
+    return (f'<tr><td class="RowTitle"><a href="{href}" title="{title}">{title}</a></td>'
+            f'<td class="RowValues">{value}</td></tr>')
+
+# one route of administration's dose chart with the same row structure get_dosage_dict and get_duration_dict walk:
+# a RowTitle cell linking to the level's wiki anchor followed by a RowValues cell with the range and unit
+def generate_dosechart(roa, dosechart_info):
+    rows = []
+    dosage = dosechart_info["dosage"]
+    levels = [level for level in scrape.DOSAGE_LEVELS if level in dosage]
+    for i, level in enumerate(levels):
+        low, unit = dosage[level]
+        if i + 1 < len(levels):
+            value = f"{format_number(low)} - {format_number(dosage[levels[i+1]][0])} {unit}"
+        else:
+            value = f"{format_number(low)} {unit} +"
+        rows.append(_row(f"/wiki/Dosage_classification#{level.capitalize()}", level.capitalize(), value))
+    for duration_type, ((low, high), unit) in dosechart_info["duration"].items():
+        value = f"{format_number(low)} - {format_number(high)} {unit}" if low != high else f"{format_number(low)} {unit}"
+        rows.append(_row(f"/wiki/Duration#{duration_type.capitalize()}", duration_type.replace("_", " ").capitalize(), value))
+    return (f'<div class="dosechart-wrapper"><table class="dosechart ROA{roa.capitalize()}" data-roa="{roa.capitalize()}">'
+            f'<tbody>{"".join(rows)}</tbody></table></div>')
+
+# a drug page with the real dose charts of the drug (from the pickled scrape output) padded with article text
+def generate_psychonaut_wiki_drug_page(drug, drug_dosechart_info, num_filler_paragraphs=40, seed=SEED):
+    rng = np.random.RandomState(seed)
+    filler = "".join(f"<p>{' '.join(rng.choice(ENGLISH_WORDS, 80))}</p>" for _ in range(num_filler_paragraphs))
+    dosecharts = "".join(generate_dosechart(roa, info) for roa, info in drug_dosechart_info.items())
+    return (f'<html><head><title>{html.escape(drug)} - PsychonautWiki</title></head><body><div id="mw-content-text">'
+            f'{filler[:len(filler)//2]}{dosecharts}{filler[len(filler)//2:]}</div></body></html>').encode("utf-8")
+
+def generate_psychonaut_wiki_drug_pages(drug_to_dosechart_info_dict=None):
+    drug_to_dosechart_info_dict = drug_to_dosechart_info_dict or load_dosechart_info()
+    return {drug: generate_psychonaut_wiki_drug_page(drug, info) for drug, info in drug_to_dosechart_info_dict.items()}
+
+
+"""
+Writing
+"""
+def write_fixtures(num_docs, directory, seed=SEED):
+    texts, labels = generate_corpus(num_docs, seed=seed)
+    erowid_dir = os.path.join(directory, "erowid_reports")
+    psychonaut_wiki_dir = os.path.join(directory, "psychonaut_wiki")
+    os.makedirs(erowid_dir, exist_ok=True)
+    os.makedirs(psychonaut_wiki_dir, exist_ok=True)
+    for i, page in enumerate(generate_erowid_report_pages(texts, labels)):
+        with open(os.path.join(erowid_dir, f"{100000 + i}.html"), "wb") as f:
+            f.write(page)
+    for drug, page in generate_psychonaut_wiki_drug_pages().items():
+        with open(os.path.join(psychonaut_wiki_dir, f"{drug}.html"), "wb") as f:
+            f.write(page)
+    return texts, labels
@@ -0,0 +1,227 @@
+import util
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+
+"""
+Constants
+"""
+# time after which a cached response must be revalidated with the server (None means never)
+DEFAULT_TTL = 30 * 24 * 60 * 60
+
+# individual Erowid trip reports never change once published, while listing pages gain new reports over time
+URL_PREFIX_TTLS = {
+    "https://www.erowid.org//experiences/exp.php": None,
+    "https://www.erowid.org/experiences/exp.php": None,
+    "https://www.erowid.org/experiences/exp.cgi": 24 * 60 * 60
+}
+
+MAX_SIZE_BYTES = 2 * 1024 ** 3
+
+COMPRESSION_LEVEL = 6
+
+
+"""
+Cached page
+"""
+class CachedPage:
+    # minimal stand-in for requests.Response covering the attributes the scraper uses
+    def __init__(self, url, status_code, content, headers=None):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.from_cache = True
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+
+"""
+Response cache
+"""
+class ResponseCache:
+    # content-addressed, zlib-compressed response bodies under `directory`/objects, indexed by URL in SQLite.
+    # Bodies shared by several URLs are stored once; entries are evicted least-recently-used first once the
+    # compressed size exceeds max_size_bytes.
+    def __init__(self, directory=util.RESPONSE_CACHE_DIR, default_ttl=DEFAULT_TTL, url_prefix_ttls=URL_PREFIX_TTLS,
+                 max_size_bytes=MAX_SIZE_BYTES, clock=time.time):
+        self.directory = directory
+        self.objects_dir = os.path.join(directory, "objects")
+        self.default_ttl = default_ttl
+        self.url_prefix_ttls = url_prefix_ttls
+        self.max_size_bytes = max_size_bytes
+        self.clock = clock
+        self.lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(directory, "index.sqlite"), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                status_code INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS objects (
+                content_hash TEXT PRIMARY KEY,
+                size INTEGER NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS host_budgets (
+                host TEXT PRIMARY KEY,
+                window_start REAL NOT NULL,
+                count INTEGER NOT NULL
+            )
+        """)
+        self.db.commit()
+
+    def _object_path(self, content_hash):
+        return os.path.join(self.objects_dir, content_hash[:2], content_hash + ".z")
+
+    def _read_object(self, content_hash):
+        with open(self._object_path(content_hash), "rb") as f:
+            return zlib.decompress(f.read())
+
+    def _write_object(self, content_hash, content):
+        path = self._object_path(content_hash)
+        compressed = zlib.compress(content, COMPRESSION_LEVEL)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(compressed)
+            os.replace(tmp_path, path)
+        return len(compressed)
+
+    def get_ttl(self, url):
+        for prefix, ttl in self.url_prefix_ttls.items():
+            if url.startswith(prefix):
+                return ttl
+        return self.default_ttl
+
+    # returns (page, is_fresh, validator_headers), or (None, False, {}) on a miss
+    def lookup(self, url):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT content_hash, status_code, etag, last_modified, fetched_at FROM responses WHERE url = ?",
+                (url,)
+            ).fetchone()
+            if row is None:
+                return None, False, {}
+            content_hash, status_code, etag, last_modified, fetched_at = row
+            try:
+                content = self._read_object(content_hash)
+            except (OSError, zlib.error):
+                self.db.execute("DELETE FROM responses WHERE url = ?", (url,))
+                self.db.commit()
+                return None, False, {}
+            self.db.execute("UPDATE responses SET accessed_at = ? WHERE url = ?", (self.clock(), url))
+            self.db.commit()
+
+        ttl = self.get_ttl(url)
+        is_fresh = ttl is None or self.clock() - fetched_at < ttl
+        validator_headers = {}
+        if etag:
+            validator_headers["If-None-Match"] = etag
+        if last_modified:
+            validator_headers["If-Modified-Since"] = last_modified
+        page = CachedPage(url, status_code, content, {"ETag": etag, "Last-Modified": last_modified})
+        return page, is_fresh, validator_headers
+
+    def store(self, url, page):
+        content = page.content
+        content_hash = hashlib.sha256(content).hexdigest()
+        size = self._write_object(content_hash, content)
+        now = self.clock()
+        with self.lock:
+            previous = self.db.execute("SELECT content_hash FROM responses WHERE url = ?", (url,)).fetchone()
+            self.db.execute("INSERT OR IGNORE INTO objects (content_hash, size) VALUES (?, ?)", (content_hash, size))
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, content_hash, page.status_code, page.headers.get("ETag"), page.headers.get("Last-Modified"), now, now)
+            )
+            if previous is not None and previous[0] != content_hash:
+                self._remove_object_if_unreferenced(previous[0])
+            self.db.commit()
+            self._evict()
+
+    # called after a 304 Not Modified response to restart the entry's TTL
+    def refresh(self, url):
+        now = self.clock()
+        with self.lock:
+            self.db.execute("UPDATE responses SET fetched_at = ?, accessed_at = ? WHERE url = ?", (now, now, url))
+            self.db.commit()
+
+    # fetch.HostBudget state, kept next to the responses so a restart does not reset a host's daily request budget
+    def load_budget(self, host):
+        with self.lock:
+            return self.db.execute("SELECT window_start, count FROM host_budgets WHERE host = ?", (host,)).fetchone()
+
+    def save_budget(self, host, window_start, count):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO host_budgets VALUES (?, ?, ?)", (host, window_start, count))
+            self.db.commit()
+
+    def size(self):
+        with self.lock:
+            total, = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()
+        return total
+
+    def _remove_unreferenced_objects(self):
+        orphans = self.db.execute(
+            "SELECT content_hash FROM objects WHERE content_hash NOT IN (SELECT content_hash FROM responses)"
+        ).fetchall()
+        for content_hash, in orphans:
+            try:
+                os.remove(self._object_path(content_hash))
+            except FileNotFoundError:
+                pass
+            self.db.execute("DELETE FROM objects WHERE content_hash = ?", (content_hash,))
+
+    def _remove_object_if_unreferenced(self, content_hash):
+        referenced = self.db.execute("SELECT 1 FROM responses WHERE content_hash = ? LIMIT 1", (content_hash,)).fetchone()
+        if referenced:
+            return 0
+        size, = self.db.execute("SELECT size FROM objects WHERE content_hash = ?", (content_hash,)).fetchone()
+        try:
+            os.remove(self._object_path(content_hash))
+        except FileNotFoundError:
+            pass
+        self.db.execute("DELETE FROM objects WHERE content_hash = ?", (content_hash,))
+        return size
+
+    def _evict(self):
+        total, = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()
+        if total <= self.max_size_bytes:
+            return
+        rows = self.db.execute("SELECT url, content_hash FROM responses ORDER BY accessed_at ASC").fetchall()
+        for url, content_hash in rows:
+            self.db.execute("DELETE FROM responses WHERE url = ?", (url,))
+            total -= self._remove_object_if_unreferenced(content_hash)
+            if total <= self.max_size_bytes:
+                break
+        self.db.commit()
+
+    def clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM responses")
+            self._remove_unreferenced_objects()
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,289 @@
+import util
+import evaluation
+import kfold
+import search_log
+
+import concurrent.futures
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import time
+import warnings
+
+import numpy as np
+
+
+"""
+Constants
+"""
+CV = 5
+
+# successive halving keeps the best 1/ETA of the candidates at each rung and gives the survivors ETA times the data
+ETA = 3
+
+# training samples per fold at the first rung is never below MIN_RESOURCES_PER_CLASS * num_classes
+MIN_RESOURCES_PER_CLASS = 10
+
+SEED = 0
+
+# rows of X hashed per update when fingerprinting, so that a memory-mapped X is never copied whole
+FINGERPRINT_BLOCK_SIZE = 8192
+
+
+"""
+Candidates
+"""
+def get_candidate_id(clf_name, params):
+    return f"{clf_name}:{json.dumps(params, sort_keys=True, default=search_log.to_builtin)}"
+
+def get_candidates(clfs, clf_to_gs_params_dict):
+    from sklearn.model_selection import ParameterGrid
+
+    candidates = {}
+    for clf in clfs:
+        clf_name = clf.__class__.__name__
+        candidates[clf_name] = [
+            (get_candidate_id(clf_name, params), params) for params in ParameterGrid(clf_to_gs_params_dict[clf.__class__])
+        ]
+    return candidates
+
+# training samples per fold at each rung: the last rung uses the whole training fold, and every earlier rung 1/ETA of
+# the next one, with as many rungs as halving the candidates needs (fewer if the first rung would get too little data)
+def get_rung_resources(num_candidates, max_resources, min_resources, eta=ETA):
+    num_rungs = 1 + math.ceil(math.log(num_candidates, eta)) if num_candidates > 1 else 1
+    while num_rungs > 1 and max_resources // eta ** (num_rungs - 1) < min_resources:
+        num_rungs -= 1
+    return [max_resources // eta ** (num_rungs - 1 - rung) for rung in range(num_rungs)]
+
+
+"""
+Fold splits
+"""
+def update_array_digest(h, X, block_size=FINGERPRINT_BLOCK_SIZE):
+    h.update(json.dumps([str(X.dtype), list(X.shape)]).encode("utf-8"))
+    for start in range(0, len(X), block_size):
+        h.update(np.ascontiguousarray(X[start:start+block_size]))
+
+# fingerprint of the feature matrices, training labels and CV settings, so that cached splits and scores are only
+# reused for the same search (e.g. not after the doc2vec model and feature store have been regenerated)
+def get_search_fingerprint(X_train, X_test, y_train, cv, seed):
+    h = hashlib.sha1()
+    h.update(json.dumps([cv, seed]).encode("utf-8"))
+    update_array_digest(h, X_train)
+    update_array_digest(h, X_test)
+    h.update("\n".join(str(label) for label in y_train).encode("utf-8"))
+    return h.hexdigest()[:12]
+
+# each training fold is stored shuffled, so that its first n indices are the random subsample used at a rung of size n
+def load_or_create_fold_splits(y_train, cv, seed, filepath):
+    from sklearn.model_selection import StratifiedKFold
+
+    if os.path.exists(filepath):
+        splits = np.load(filepath)
+        return [(splits[f"train_{fold}"], splits[f"test_{fold}"]) for fold in range(cv)]
+    rng = np.random.RandomState(seed)
+    skf = StratifiedKFold(n_splits=cv, shuffle=True, random_state=seed)
+    folds = [(rng.permutation(train_indices), test_indices) for train_indices, test_indices in skf.split(np.zeros(len(y_train)), y_train)]
+    arrays = {}
+    for fold, (train_indices, test_indices) in enumerate(folds):
+        arrays[f"train_{fold}"] = train_indices
+        arrays[f"test_{fold}"] = test_indices
+    np.savez(filepath, **arrays)
+    return folds
+
+
+"""
+Workers
+"""
+_worker_state = {}
+
+def _init_worker(X_file, y, folds):
+    try:
+        from threadpoolctl import threadpool_limits
+        _worker_state["threadpool_limits"] = threadpool_limits(limits=1)
+    except ImportError:
+        pass
+    _worker_state["X"] = np.load(X_file, mmap_mode="r")
+    _worker_state["y"] = y
+    _worker_state["folds"] = folds
+
+def _fit_and_score(task):
+    from sklearn.base import clone
+
+    clf_untrained, params, n_resources, fold = task["clf"], task["params"], task["n_resources"], task["fold"]
+    X, y = _worker_state["X"], _worker_state["y"]
+    train_indices, test_indices = _worker_state["folds"][fold]
+    train_indices = np.sort(train_indices[:n_resources])
+    start = time.perf_counter()
+    record = {key: task[key] for key in ("candidate", "classifier", "rung", "n_resources", "fold")}
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            clf = clone(clf_untrained).set_params(**params)
+            clf.fit(X[train_indices], y[train_indices])
+            result = evaluation.evaluate_classifier(clf, X[test_indices], y[test_indices], np.unique(y), max_k=0)
+        record["f_score"] = float(np.mean(result["report"]["f_score"]))
+    except Exception as e:
+        # e.g. a penalty the solver does not support; the candidate simply loses
+        record["f_score"] = None
+        record["error"] = f"{e.__class__.__name__}: {e}"
+    record["fit_sec"] = time.perf_counter() - start
+    return record
+
+def _fit_final(clf_untrained, params, num_train, test_indices):
+    from sklearn.base import clone
+
+    X, y = _worker_state["X"], _worker_state["y"]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        clf = clone(clf_untrained).set_params(**params)
+        clf.fit(X[:num_train], y[:num_train])
+        labels = np.unique(y[:num_train])
+        report = evaluation.test_classifier(clf, X[test_indices], y[test_indices], labels)
+    return clf, float(np.mean(report["f_score"])), report
+
+
+"""
+Search
+"""
+class _ClassifierBracket:
+    # successive halving state of one classifier's candidates
+    def __init__(self, clf, candidates, rung_resources, eta):
+        self.clf = clf
+        self.clf_name = clf.__class__.__name__
+        self.params = dict(candidates)
+        self.survivors = [candidate_id for candidate_id, _ in candidates]
+        self.rung_resources = rung_resources
+        self.eta = eta
+        self.rung = 0
+        self.num_pending = 0
+        self.best = None # (candidate_id, cv f_score) after the last rung
+        self.finished_sec = None
+
+    @property
+    def is_done(self):
+        return self.rung >= len(self.rung_resources)
+
+    def get_rung_tasks(self, num_folds):
+        return [
+            {"clf": self.clf, "classifier": self.clf_name, "candidate": candidate_id, "params": self.params[candidate_id],
+             "rung": self.rung, "n_resources": self.rung_resources[self.rung], "fold": fold}
+            for candidate_id in self.survivors for fold in range(num_folds)
+        ]
+
+    def finish_rung(self, scores, num_folds):
+        n_resources = self.rung_resources[self.rung]
+        mean_scores = {}
+        for candidate_id in self.survivors:
+            fold_scores = [scores[(candidate_id, n_resources, fold)] for fold in range(num_folds)]
+            mean_scores[candidate_id] = -1.0 if any(s is None for s in fold_scores) else float(np.mean(fold_scores))
+        ranked = sorted(self.survivors, key=lambda candidate_id: mean_scores[candidate_id], reverse=True)
+        self.rung += 1
+        if self.is_done:
+            self.best = (ranked[0], mean_scores[ranked[0]])
+            self.survivors = ranked[:1]
+        else:
+            self.survivors = ranked[:max(1, math.ceil(len(ranked) / self.eta))]
+        return mean_scores
+
+
+def get_search_dir(search_dir=util.CLASSIFIER_SEARCH_DIR):
+    os.makedirs(search_dir, exist_ok=True)
+    return search_dir
+
+# successive halving over every classifier's hyperparameter grid, with all classifiers' (candidate, rung, fold) fits
+# sharing one process pool of num_processes cores; every fold score is appended to a JSON lines log and the fold
+# splits are saved, so an interrupted search picks up where it left off. Each classifier's winner is refit on the whole
+# training set and tested on the test set, like grid_search_classifiers; returns (best_clf, f_score_avg, report,
+# params, summary) with summary["time_to_best_sec"] the time at which the eventual winner's search had finished
+def search_classifiers(X_train, X_test, y_train, y_test, clfs, clf_to_gs_params_dict, cv=CV, eta=ETA, num_processes=None,
+                       seed=SEED, search_dir=util.CLASSIFIER_SEARCH_DIR, verbose=True):
+    start = time.perf_counter()
+    y_train, y_test = np.asarray(y_train), np.asarray(y_test)
+    search_dir = get_search_dir(search_dir)
+    fingerprint = get_search_fingerprint(X_train, X_test, y_train, cv, seed)
+    folds = load_or_create_fold_splits(y_train, cv, seed, os.path.join(search_dir, f"folds_{fingerprint}.npz"))
+    trial_log = search_log.TrialLog(os.path.join(search_dir, f"trials_{fingerprint}.jsonl"))
+    scores = {(record["candidate"], record["n_resources"], record["fold"]): record["f_score"] for record in trial_log.records}
+    num_cached = len(scores)
+
+    max_resources = min(len(train_indices) for train_indices, _ in folds)
+    min_resources = MIN_RESOURCES_PER_CLASS * len(np.unique(y_train))
+    brackets = []
+    for clf in clfs:
+        candidates = get_candidates([clf], clf_to_gs_params_dict)[clf.__class__.__name__]
+        rung_resources = get_rung_resources(len(candidates), max_resources, min_resources, eta)
+        brackets.append(_ClassifierBracket(clf, candidates, rung_resources, eta))
+        if verbose: print(f"{clf.__class__.__name__}: {len(candidates)} candidates, rung sizes {rung_resources}")
+
+    history = [] # (elapsed_sec, classifier, cv f_score) each time the best cross-validated score improves
+    num_processes = num_processes or multiprocessing.cpu_count()
+    X_file, temp_directory = kfold.publish_array(np.vstack([X_train, X_test]))
+    test_indices = np.arange(len(X_train), len(X_train) + len(X_test))
+    y = np.concatenate([y_train, y_test])
+    try:
+        with concurrent.futures.ProcessPoolExecutor(num_processes, initializer=_init_worker, initargs=(X_file, y, folds)) as executor:
+            futures = {}
+
+            # submit the uncached fits of a bracket's current rung, finishing rungs that are already fully cached
+            def advance(bracket):
+                while not bracket.is_done:
+                    tasks = [task for task in bracket.get_rung_tasks(cv) if (task["candidate"], task["n_resources"], task["fold"]) not in scores]
+                    if len(tasks) > 0:
+                        for task in tasks:
+                            futures[executor.submit(_fit_and_score, task)] = bracket
+                        bracket.num_pending = len(tasks)
+                        return
+                    mean_scores = bracket.finish_rung(scores, cv)
+                    if verbose: print(f"\t{bracket.clf_name} rung {bracket.rung}/{len(bracket.rung_resources)}: best CV F-score {max(mean_scores.values()):.4f}")
+                    if bracket.is_done:
+                        bracket.finished_sec = time.perf_counter() - start
+                        if len(history) == 0 or bracket.best[1] > history[-1][2]:
+                            history.append((bracket.finished_sec, bracket.clf_name, bracket.best[1]))
+
+            for bracket in brackets:
+                advance(bracket)
+            while futures:
+                done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    bracket = futures.pop(future)
+                    record = future.result()
+                    trial_log.append(record)
+                    scores[(record["candidate"], record["n_resources"], record["fold"])] = record["f_score"]
+                    bracket.num_pending -= 1
+                    if bracket.num_pending == 0:
+                        advance(bracket)
+
+            # refit each classifier's winner on the whole training set and test it, concurrently
+            final_tasks = {
+                executor.submit(_fit_final, bracket.clf, bracket.params[bracket.best[0]], len(X_train), test_indices): bracket
+                for bracket in brackets
+            }
+            finals = [(final_tasks[future], future.result()) for future in concurrent.futures.as_completed(final_tasks)]
+    finally:
+        if temp_directory is not None:
+            shutil.rmtree(temp_directory, ignore_errors=True)
+
+    finals.sort(key=lambda final: final[1][1], reverse=True)
+    best_bracket, (best_clf, best_f_score_avg, best_report) = finals[0]
+    summary = {
+        "classifiers": {
+            bracket.clf_name: {"params": bracket.params[bracket.best[0]], "cv_f_score": bracket.best[1], "test_f_score": f_score_avg}
+            for bracket, (_, f_score_avg, _) in finals
+        },
+        "num_fits": len(scores) - num_cached,
+        "num_cached_fits": num_cached,
+        "history": history,
+        "time_to_best_sec": best_bracket.finished_sec,
+        "total_sec": time.perf_counter() - start
+    }
+    return best_clf, best_f_score_avg, best_report, best_bracket.params[best_bracket.best[0]], summary
+
+def print_summary(summary):
+    for clf_name, result in summary["classifiers"].items():
+        print(f"\t{clf_name}: CV F-score {result['cv_f_score']:.4f}, test F-score {result['test_f_score']:.4f}, params {result['params']}")
+    print(f"\t{summary['num_fits']} fits ({summary['num_cached_fits']} cached) in {summary['total_sec']:.1f}s; "
+          f"time to best F-score: {summary['time_to_best_sec']:.1f}s")
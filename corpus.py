@@ -0,0 +1,208 @@
+import util
+import vocab
+
+import itertools
+import json
+import os
+
+import numpy as np
+
+
+"""
+Constants
+"""
+FORMAT_VERSION = 1
+
+TOKEN_DTYPE = np.int32
+OFFSET_DTYPE = np.int64
+LABEL_DTYPE = np.int32
+
+METADATA_FILENAME = "metadata.json"
+VOCABULARY_FILENAME = "vocabulary.txt"
+LABELS_FILENAME = "labels.txt"
+TOKENS_FILENAME = "tokens.int32"
+OFFSETS_FILENAME = "offsets.int64"
+LABEL_IDS_FILENAME = "label_ids.int32"
+TEXTS_FILENAME = "texts.utf8"
+TEXT_OFFSETS_FILENAME = "text_offsets.int64"
+
+
+"""
+Writing
+"""
+class CorpusWriter:
+    # streams documents to disk one at a time: token IDs are appended to a flat int32 file and per-document
+    # offsets, label IDs and (optionally) raw text are written alongside, so memory use does not grow with the corpus.
+    # Token IDs are those of `vocabulary` (a vocab.Vocabulary, which gains an ID for any token it has not seen yet),
+    # so the corpus and the vocabulary share one ID space
+    def __init__(self, directory=util.CORPUS_DIR, vocabulary=None, store_texts=True):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.vocabulary = vocabulary if vocabulary is not None else vocab.Vocabulary()
+        self.label_to_id_dict = {}
+        self.id_to_label = []
+        self.store_texts = store_texts
+        self.num_docs = 0
+        self.num_tokens = 0
+        self.text_offset = 0
+        self.tokens_file = open(os.path.join(directory, TOKENS_FILENAME), "wb")
+        self.label_ids_file = open(os.path.join(directory, LABEL_IDS_FILENAME), "wb")
+        self.offsets_file = open(os.path.join(directory, OFFSETS_FILENAME), "wb")
+        self.offsets_file.write(np.zeros(1, dtype=OFFSET_DTYPE).tobytes())
+        if store_texts:
+            self.texts_file = open(os.path.join(directory, TEXTS_FILENAME), "wb")
+            self.text_offsets_file = open(os.path.join(directory, TEXT_OFFSETS_FILENAME), "wb")
+            self.text_offsets_file.write(np.zeros(1, dtype=OFFSET_DTYPE).tobytes())
+
+    def _get_label_id(self, label):
+        label_id = self.label_to_id_dict.get(label)
+        if label_id is None:
+            label_id = len(self.id_to_label)
+            self.label_to_id_dict[label] = label_id
+            self.id_to_label.append(label)
+        return label_id
+
+    def add_document(self, tokens, label, text=None):
+        add_token = self.vocabulary.add_token
+        token_ids = np.fromiter((add_token(token) for token in tokens), dtype=TOKEN_DTYPE)
+        self.add_document_ids(token_ids, label, text)
+
+    # for callers that already hold integer token IDs from the writer's vocabulary
+    def add_document_ids(self, token_ids, label, text=None):
+        token_ids = np.asarray(token_ids, dtype=TOKEN_DTYPE)
+        self.tokens_file.write(token_ids.tobytes())
+        self.num_tokens += len(token_ids)
+        self.offsets_file.write(np.array([self.num_tokens], dtype=OFFSET_DTYPE).tobytes())
+        self.label_ids_file.write(np.array([self._get_label_id(label)], dtype=LABEL_DTYPE).tobytes())
+        if self.store_texts:
+            encoded = (text or "").encode("utf-8")
+            self.texts_file.write(encoded)
+            self.text_offset += len(encoded)
+            self.text_offsets_file.write(np.array([self.text_offset], dtype=OFFSET_DTYPE).tobytes())
+        self.num_docs += 1
+
+    def close(self):
+        files = [self.tokens_file, self.label_ids_file, self.offsets_file]
+        if self.store_texts:
+            files += [self.texts_file, self.text_offsets_file]
+        for f in files:
+            f.close()
+        with open(os.path.join(self.directory, VOCABULARY_FILENAME), "w", encoding="utf-8") as f:
+            f.writelines(token + "\n" for token in self.vocabulary.id_to_token)
+        with open(os.path.join(self.directory, LABELS_FILENAME), "w", encoding="utf-8") as f:
+            f.writelines(label + "\n" for label in self.id_to_label)
+        metadata = {
+            "format_version": FORMAT_VERSION,
+            "num_docs": self.num_docs,
+            "num_tokens": self.num_tokens,
+            "vocabulary_size": len(self.vocabulary),
+            "num_labels": len(self.id_to_label),
+            "has_texts": self.store_texts
+        }
+        with open(os.path.join(self.directory, METADATA_FILENAME), "w") as f:
+            json.dump(metadata, f, indent=4)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def write_corpus(token_lists, labels, texts=None, directory=util.CORPUS_DIR, vocabulary=None):
+    with CorpusWriter(directory, vocabulary=vocabulary, store_texts=texts is not None) as writer:
+        texts = texts if texts is not None else itertools.repeat(None)
+        for tokens, label, text in zip(token_lists, labels, texts):
+            writer.add_document(tokens, label, text)
+    return directory
+
+
+"""
+Reading
+"""
+def _memmap(directory, filename, dtype, length):
+    if length == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(os.path.join(directory, filename), dtype=dtype, mode="r", shape=(length,))
+
+def _read_lines(filepath):
+    with open(filepath, encoding="utf-8") as f:
+        return [line.rstrip("\n") for line in f]
+
+
+class Corpus:
+    # read-only, memory-mapped view of a corpus written by CorpusWriter
+    def __init__(self, directory=util.CORPUS_DIR):
+        self.directory = directory
+        with open(os.path.join(directory, METADATA_FILENAME)) as f:
+            self.metadata = json.load(f)
+        assert self.metadata["format_version"] == FORMAT_VERSION
+        num_docs = self.metadata["num_docs"]
+        self.vocabulary = _read_lines(os.path.join(directory, VOCABULARY_FILENAME))
+        self.label_names = np.array(_read_lines(os.path.join(directory, LABELS_FILENAME)), dtype=object)
+        self.tokens = _memmap(directory, TOKENS_FILENAME, TOKEN_DTYPE, self.metadata["num_tokens"])
+        self.offsets = _memmap(directory, OFFSETS_FILENAME, OFFSET_DTYPE, num_docs + 1)
+        self.label_ids = _memmap(directory, LABEL_IDS_FILENAME, LABEL_DTYPE, num_docs)
+        if self.metadata["has_texts"]:
+            self.text_offsets = _memmap(directory, TEXT_OFFSETS_FILENAME, OFFSET_DTYPE, num_docs + 1)
+            self.texts = _memmap(directory, TEXTS_FILENAME, np.uint8, int(self.text_offsets[-1]))
+
+    def __len__(self):
+        return self.metadata["num_docs"]
+
+    @property
+    def labels(self):
+        return self.label_names[self.label_ids]
+
+    def get_lengths(self):
+        return np.diff(self.offsets)
+
+    def get_token_ids(self, i):
+        return self.tokens[self.offsets[i]:self.offsets[i+1]]
+
+    # the returned strings are the vocabulary's own objects, so no new strings are created per token
+    def get_tokens(self, i):
+        vocabulary = self.vocabulary
+        return [vocabulary[token_id] for token_id in self.get_token_ids(i).tolist()]
+
+    def get_text(self, i):
+        return self.texts[self.text_offsets[i]:self.text_offsets[i+1]].tobytes().decode("utf-8")
+
+    def get_indices(self, mask=None):
+        if mask is None:
+            return np.arange(len(self))
+        mask = np.asarray(mask)
+        return np.flatnonzero(mask) if mask.dtype == bool else mask
+
+    def iter_documents(self, mask=None):
+        for i in self.get_indices(mask):
+            yield self.get_tokens(i)
+
+    def tagged_documents(self, mask=None):
+        return TaggedCorpus(self, mask)
+
+    def to_dataframe(self, include_tokens=True):
+        import pandas as pd
+        df = pd.DataFrame({"drug": self.labels})
+        if self.metadata["has_texts"]:
+            df["trip_report"] = [self.get_text(i) for i in range(len(self))]
+        if include_tokens:
+            df["trip_report_tokenized"] = list(self.iter_documents())
+        return df
+
+
+class TaggedCorpus:
+    # restartable iterable of gensim TaggedDocuments tagged DOC_{i} by position within the mask, as label_docs does
+    def __init__(self, corpus, mask=None):
+        self.corpus = corpus
+        self.indices = corpus.get_indices(mask)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        from gensim.models.doc2vec import TaggedDocument
+        for i, doc_index in enumerate(self.indices):
+            yield TaggedDocument(words=self.corpus.get_tokens(doc_index), tags=[f"DOC_{i}"])
+
+def load_corpus(directory=util.CORPUS_DIR):
+    return Corpus(directory)
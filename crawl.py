@@ -0,0 +1,133 @@
+import util
+
+import sqlite3
+import threading
+import time
+import zlib
+
+
+"""
+Constants
+"""
+# number of newly fetched reports between commits; a crash loses at most this many fetches
+CHECKPOINT_INTERVAL = 25
+
+COMPRESSION_LEVEL = 6
+
+# reports read per query when iterating over raw bodies, bounding how many compressed bodies are in memory at once
+ITER_PAGE_SIZE = 100
+
+
+"""
+Erowid crawl store
+"""
+class CrawlStore:
+    # append-only SQLite store with one row per Erowid report ID (compressed raw body, extracted text, fetch time)
+    # plus a link table recording which drug listings each report appeared in
+    def __init__(self, filepath=util.CRAWL_STORE_FILE):
+        self.filepath = filepath
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(filepath, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS reports (
+                report_id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL,
+                raw_body BLOB NOT NULL,
+                trip_report TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS report_drugs (
+                report_id INTEGER NOT NULL,
+                drug TEXT NOT NULL,
+                PRIMARY KEY (report_id, drug)
+            )
+        """)
+        self.db.commit()
+        self.num_uncommitted = 0
+
+    def get_report_ids(self):
+        with self.lock:
+            return set(report_id for report_id, in self.db.execute("SELECT report_id FROM reports"))
+
+    def get_drug_report_ids(self, drug):
+        with self.lock:
+            rows = self.db.execute("SELECT report_id FROM report_drugs WHERE drug = ?", (drug,))
+            return set(report_id for report_id, in rows)
+
+    # record that report_ids appear in drug's listing; reports already fetched for another drug are reused
+    def link_reports(self, drug, report_ids):
+        with self.lock:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO report_drugs (report_id, drug) VALUES (?, ?)",
+                [(report_id, drug) for report_id in report_ids]
+            )
+            self.db.commit()
+
+    def append_report(self, report_id, url, raw_body, trip_report, fetched_at=None):
+        fetched_at = fetched_at if fetched_at is not None else time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR IGNORE INTO reports (report_id, url, raw_body, trip_report, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (report_id, url, zlib.compress(raw_body, COMPRESSION_LEVEL), trip_report, fetched_at)
+            )
+            self.num_uncommitted += 1
+            if self.num_uncommitted >= CHECKPOINT_INTERVAL:
+                self._checkpoint()
+
+    def _checkpoint(self):
+        self.db.commit()
+        self.num_uncommitted = 0
+
+    def checkpoint(self):
+        with self.lock:
+            self._checkpoint()
+
+    def get_raw_body(self, report_id):
+        with self.lock:
+            row = self.db.execute("SELECT raw_body FROM reports WHERE report_id = ?", (report_id,)).fetchone()
+        return zlib.decompress(row[0]) if row is not None else None
+
+    # yields (report_id, raw_body) for every stored report, e.g. to re-run extraction without refetching; rows are
+    # paged by report ID, so the lock is never held while the caller works (it may update_trip_report in between)
+    def iter_raw_bodies(self, page_size=ITER_PAGE_SIZE):
+        last_report_id = -1
+        while True:
+            with self.lock:
+                rows = self.db.execute(
+                    "SELECT report_id, raw_body FROM reports WHERE report_id > ? ORDER BY report_id LIMIT ?",
+                    (last_report_id, page_size)
+                ).fetchall()
+            for report_id, raw_body in rows:
+                yield report_id, zlib.decompress(raw_body)
+            if len(rows) < page_size:
+                return
+            last_report_id = rows[-1][0]
+
+    def update_trip_report(self, report_id, trip_report):
+        with self.lock:
+            self.db.execute("UPDATE reports SET trip_report = ? WHERE report_id = ?", (trip_report, report_id))
+            self.num_uncommitted += 1
+            if self.num_uncommitted >= CHECKPOINT_INTERVAL:
+                self._checkpoint()
+
+    # returns drug -> list of extracted trip reports, in report ID order
+    def get_drug_to_trip_reports_dict(self, drugs=None):
+        with self.lock:
+            rows = self.db.execute("""
+                SELECT report_drugs.drug, reports.trip_report
+                FROM report_drugs JOIN reports ON reports.report_id = report_drugs.report_id
+                ORDER BY report_drugs.drug, reports.report_id
+            """).fetchall()
+        drug_to_trip_reports_dict = {drug: [] for drug in drugs} if drugs is not None else {}
+        for drug, trip_report in rows:
+            if drugs is not None and drug not in drug_to_trip_reports_dict: continue
+            drug_to_trip_reports_dict.setdefault(drug, []).append(trip_report)
+        return drug_to_trip_reports_dict
+
+    def close(self):
+        with self.lock:
+            self._checkpoint()
+            self.db.close()
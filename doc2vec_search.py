@@ -0,0 +1,489 @@
+import util
+import corpus
+import features
+import instrument
+import search_log
+
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+
+"""
+Constants
+"""
+MODEL_TYPES = {
+    0: "dbow",
+    1: "dm"
+}
+
+
+"""
+Training and scoring
+"""
+# train doc2vec model by num_epochs
+def train_doc2vec_model(model, docs, num_epochs, lr_step, lr_min=0.0, verbose=True):
+    for epoch in range(1, num_epochs+1):
+        if verbose: print(f"Epoch: {epoch}")
+        with instrument.stage("train_doc2vec_model_epoch", num_items=model.corpus_count, epoch=epoch, dm=int(model.dm)):
+            model.train(docs, total_examples=model.corpus_count, epochs=1)
+        model.alpha -= lr_step  # decrease the learning rate
+        model.min_alpha = lr_min
+
+def score_doc_vectors(X, y, train_indices, test_indices):
+    from sklearn.naive_bayes import GaussianNB
+
+    # train a simple Gaussian naive Bayes classifier whose test set predictions' average f_score
+    # will be the measure for a given doc2vec model's quality
+    X_train, X_test = X[train_indices, :], X[test_indices, :]
+    y_train, y_test = y[train_indices], y[test_indices]
+    clf = GaussianNB()
+    clf.fit(X_train, y_train)
+    labels = np.unique(y_train)
+    report = util.test_classifier(clf, X_test, y_test, labels)
+    f_score_avg = float(np.mean(report["f_score"]))
+    return f_score_avg, report
+
+
+"""
+Fingerprints
+"""
+# identifies the labelled documents a split or search is for; the corpus is shuffled when it is rebuilt, so a split
+# or trial log made for an earlier corpus has a different fingerprint even if it has the same number of documents
+def get_labels_fingerprint(y, doc_indices=None):
+    h = hashlib.sha1()
+    h.update("\n".join(str(label) for label in y).encode("utf-8"))
+    if doc_indices is not None:
+        h.update(np.ascontiguousarray(doc_indices, dtype=np.int64).tobytes())
+    return h.hexdigest()[:16]
+
+def get_search_fingerprint(doc_indices, y, train_indices, test_indices, corpus_dir=util.CORPUS_DIR):
+    h = hashlib.sha1(get_labels_fingerprint(y, doc_indices).encode("ascii"))
+    for indices in (train_indices, test_indices):
+        h.update(np.ascontiguousarray(indices, dtype=np.int64).tobytes())
+    metadata_file = os.path.join(corpus_dir, corpus.METADATA_FILENAME)
+    if os.path.exists(metadata_file):
+        with open(metadata_file, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+"""
+Train/test split
+"""
+# the split is persisted so that resumed searches score every trial on the same test set; it is only reused for the
+# same labels and documents (see get_labels_fingerprint)
+def load_or_create_train_test_split_indices(y, train_size=0.8, filepath=util.TRAIN_TEST_SPLIT_FILE, doc_indices=None):
+    from sklearn.model_selection import train_test_split
+
+    fingerprint = get_labels_fingerprint(y, doc_indices)
+    if os.path.exists(filepath):
+        split = np.load(filepath)
+        if "fingerprint" in split and str(split["fingerprint"]) == fingerprint:
+            return split["train_indices"], split["test_indices"]
+    indices = np.arange(len(y))
+    train_indices, test_indices = train_test_split(indices, train_size=train_size, stratify=y)
+    np.savez(filepath, train_indices=train_indices, test_indices=test_indices, fingerprint=fingerprint)
+    return train_indices, test_indices
+
+
+"""
+Trial log
+"""
+def get_trial_id(dm, vector_size, window, lr, lr_step, training_session_epochs, num_training_sessions):
+    return f"{MODEL_TYPES[dm]}_vs{vector_size}_w{window}_lr{lr}_step{lr_step}_ep{training_session_epochs}_s{num_training_sessions}"
+
+def write_best_record(best_model_file, record):
+    tmp_file = f"{best_model_file}.json.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(record, f, default=search_log.to_builtin)
+    os.replace(tmp_file, f"{best_model_file}.json")
+
+# wall clock of every run of a search that trained something, logged next to its trial log so that the total time
+# spent on a search (across interruptions) can be compared with another search's
+def get_runs_file(trial_log_file):
+    return f"{os.path.splitext(trial_log_file)[0]}_runs.jsonl"
+
+def log_run(trial_log_file, wall_clock_sec, **info):
+    search_log.TrialLog(get_runs_file(trial_log_file)).append(dict(wall_clock_sec=wall_clock_sec, **info))
+
+def get_total_wall_clock_sec(trial_log_file):
+    runs = search_log.TrialLog(get_runs_file(trial_log_file)).records
+    return sum(run["wall_clock_sec"] for run in runs) if len(runs) > 0 else None
+
+def read_best_record(best_model_file):
+    if not (os.path.exists(best_model_file) and os.path.exists(f"{best_model_file}.json")):
+        return None
+    with open(f"{best_model_file}.json") as f:
+        return json.load(f)
+
+
+"""
+Parallel, resumable executor
+"""
+_worker_state = {}
+
+def _init_worker(corpus_dir, doc_indices, y, train_indices, test_indices, best_f_score_avg, best_lock, best_model_file):
+    _worker_state["docs"] = corpus.Corpus(corpus_dir).tagged_documents(doc_indices)
+    _worker_state["y"] = y
+    _worker_state["train_indices"] = train_indices
+    _worker_state["test_indices"] = test_indices
+    _worker_state["best_f_score_avg"] = best_f_score_avg
+    _worker_state["best_lock"] = best_lock
+    _worker_state["best_model_file"] = best_model_file
+
+# gensim may store large arrays next to the model file as "<file>.<attribute>.npy", so move those along with it
+def _replace_model_files(src_file, dst_file):
+    directory = os.path.dirname(src_file) or "."
+    prefix = os.path.basename(src_file)
+    for name in os.listdir(directory):
+        if name == prefix or name.startswith(prefix + "."):
+            os.replace(os.path.join(directory, name), dst_file + name[len(prefix):])
+
+def _remove_model_files(model_file):
+    directory = os.path.dirname(model_file) or "."
+    prefix = os.path.basename(model_file)
+    for name in os.listdir(directory):
+        if name == prefix or name.startswith(prefix + "."):
+            os.remove(os.path.join(directory, name))
+
+def _save_if_best(model, record):
+    # only the process holding the lock may compare and replace the best model file; the record written next to it
+    # identifies which trial and session the saved model came from, even if the run is interrupted before logging
+    best_f_score_avg = _worker_state["best_f_score_avg"]
+    with _worker_state["best_lock"]:
+        if record["f_score_avg"] < best_f_score_avg.value:
+            return False
+        best_model_file = _worker_state["best_model_file"]
+        tmp_file = f"{best_model_file}.{os.getpid()}.tmp"
+        model.save(tmp_file)
+        _replace_model_files(tmp_file, best_model_file)
+        write_best_record(best_model_file, dict(record, saved_as_best=True))
+        best_f_score_avg.value = record["f_score_avg"]
+        return True
+
+def _run_trial(trial):
+    import gensim
+
+    docs = _worker_state["docs"]
+    start = time.time()
+    model = gensim.models.doc2vec.Doc2Vec(docs, workers=trial["gensim_workers"], dm=trial["dm"], vector_size=trial["vector_size"],
+                                          window=trial["window"], alpha=trial["lr"], dm_concat=1)
+    epochs_trained = 0
+    session_records = []
+    for session in range(trial["num_training_sessions"]):
+        train_doc2vec_model(model, docs, trial["training_session_epochs"], trial["lr_step"], verbose=False)
+        epochs_trained += trial["training_session_epochs"]
+
+        X = features.get_doc_vectors(model)
+        f_score_avg, report = score_doc_vectors(X, _worker_state["y"], _worker_state["train_indices"], _worker_state["test_indices"])
+        record = {
+            "trial_id": trial["trial_id"],
+            "dm": trial["dm"],
+            "vector_size": trial["vector_size"],
+            "window": trial["window"],
+            "lr": trial["lr"],
+            "lr_step": trial["lr_step"],
+            "epochs_trained": epochs_trained,
+            "f_score_avg": f_score_avg,
+            "elapsed_sec": time.time() - start,
+            "report": report.to_dict(orient="list")
+        }
+        record["saved_as_best"] = _save_if_best(model, record)
+        session_records.append(record)
+    return session_records
+
+# trial log and best model files of a search, keyed by get_search_fingerprint() so a search over other data starts over
+def get_search_files(dm, fingerprint, trials_dir=util.DOC2VEC_TRIALS_DIR, search="grid"):
+    model_type = MODEL_TYPES[dm]
+    prefix = "" if search == "grid" else f"{search}_"
+    return (os.path.join(trials_dir, f"{prefix}trials_{model_type}_{fingerprint}.jsonl"),
+            os.path.join(trials_dir, f"{prefix}best_model_{model_type}_{fingerprint}.model"))
+
+# budget gensim worker threads per trial so parallel trials do not oversubscribe the cores
+def get_parallelism(num_parallel_trials=None):
+    num_cpus = multiprocessing.cpu_count()
+    num_parallel_trials = num_parallel_trials or max(1, num_cpus // 4)
+    gensim_workers = max(1, num_cpus // num_parallel_trials)
+    return num_parallel_trials, gensim_workers
+
+def get_trials(dm, vector_sizes, windows, lrs_and_lr_steps, training_session_epochs, num_training_sessions, gensim_workers):
+    trials = []
+    for vector_size, window, (lr, lr_step) in itertools.product(vector_sizes, windows, lrs_and_lr_steps):
+        trials.append({
+            "trial_id": get_trial_id(dm, vector_size, window, lr, lr_step, training_session_epochs, num_training_sessions),
+            "dm": dm,
+            "vector_size": vector_size,
+            "window": window,
+            "lr": lr,
+            "lr_step": lr_step,
+            "training_session_epochs": training_session_epochs,
+            "num_training_sessions": num_training_sessions,
+            "gensim_workers": gensim_workers
+        })
+    return trials
+
+def load_best_model(best_model_file, dm, verbose=True):
+    import gensim
+
+    best_record = read_best_record(best_model_file)
+    if best_record is None:
+        raise FileNotFoundError(f"No best model has been saved as {best_model_file} (with its {best_model_file}.json record); "
+                                f"run the search again to train one")
+    model = gensim.models.doc2vec.Doc2Vec.load(best_model_file)
+    f_score_avg = best_record["f_score_avg"]
+    report = pd.DataFrame(best_record["report"])
+    hyperparams = {
+        "epochs_trained": best_record["epochs_trained"],
+        "vector_size": best_record["vector_size"],
+        "window": best_record["window"],
+        "lr": best_record["lr"],
+        "lr_step": best_record["lr_step"]
+    }
+    if verbose:
+        print_best_model(f_score_avg, report, hyperparams, dm)
+    return model, f_score_avg, report, hyperparams
+
+def grid_search_doc2vec_models(doc_indices, y, train_indices, test_indices, vector_sizes, windows, lrs_and_lr_steps,
+                               training_session_epochs, num_training_sessions, dm=0, num_parallel_trials=None,
+                               corpus_dir=util.CORPUS_DIR, trials_dir=util.DOC2VEC_TRIALS_DIR):
+    # If dm=0, distributed bag of words (PV-DBOW) is used.
+    # If dm=1, ‘distributed memory’ (PV-DM) is used.
+    start = time.time()
+    os.makedirs(trials_dir, exist_ok=True)
+    fingerprint = get_search_fingerprint(doc_indices, y, train_indices, test_indices, corpus_dir)
+    trial_log_file, best_model_file = get_search_files(dm, fingerprint, trials_dir)
+    trial_log = search_log.TrialLog(trial_log_file)
+    finished_trial_ids = trial_log.get_finished_trial_ids()
+
+    num_parallel_trials, gensim_workers = get_parallelism(num_parallel_trials)
+    trials = get_trials(dm, vector_sizes, windows, lrs_and_lr_steps, training_session_epochs, num_training_sessions, gensim_workers)
+    num_trials = len(trials)
+    trials = [trial for trial in trials if trial["trial_id"] not in finished_trial_ids]
+    print(f"{num_trials - len(trials)} / {num_trials} trials already finished, running {len(trials)} "
+          f"({num_parallel_trials} in parallel, {gensim_workers} gensim workers each)")
+
+    best_record = read_best_record(best_model_file)
+    best_f_score_avg = multiprocessing.Value("d", best_record["f_score_avg"] if best_record is not None else -1.0)
+    best_lock = multiprocessing.Lock()
+
+    initargs = (corpus_dir, np.asarray(doc_indices), np.asarray(y), np.asarray(train_indices), np.asarray(test_indices),
+                best_f_score_avg, best_lock, best_model_file)
+    num_trials_finished = num_trials - len(trials)
+    if len(trials) > 0:
+        # logged even when interrupted, so that the total wall clock covers every run
+        try:
+            with multiprocessing.Pool(num_parallel_trials, initializer=_init_worker, initargs=initargs) as pool:
+                for session_records in pool.imap_unordered(_run_trial, trials):
+                    for record in session_records:
+                        trial_log.append(record)
+                        if record["saved_as_best"]:
+                            print(f"New best f-score average: {record['f_score_avg']}")
+                    trial_log.append({"trial_id": session_records[0]["trial_id"], "done": True})
+
+                    # print progress
+                    num_trials_finished += 1
+                    last = session_records[-1]
+                    print(f"{num_trials_finished} / {num_trials} trials finished: ({last['epochs_trained']}, {last['vector_size']}, "
+                          f"{last['window']}, {last['lr']}, {last['lr_step']}) in {last['elapsed_sec']:.1f}s")
+        finally:
+            log_run(trial_log_file, time.time() - start, num_trials=num_trials_finished - (num_trials - len(trials)))
+
+    print("\nDone")
+
+    return load_best_model(best_model_file, dm)
+
+
+"""
+Successive halving
+"""
+def get_rung_sessions(num_training_sessions, eta=3, min_sessions=1):
+    # cumulative training sessions at each rung, e.g. [1, 3, 5] for 5 sessions with eta=3
+    rung_sessions = [min_sessions]
+    while rung_sessions[-1] < num_training_sessions:
+        rung_sessions.append(min(rung_sessions[-1] * eta, num_training_sessions))
+    return rung_sessions
+
+# one checkpoint per configuration and number of sessions trained, so that resuming always continues from the
+# checkpoint of the last logged rung
+def get_checkpoint_file(checkpoints_dir, trial, sessions_trained):
+    return os.path.join(checkpoints_dir, f"{trial['trial_id']}_after{sessions_trained}.model")
+
+def _run_rung(task):
+    import gensim
+
+    trial = task["trial"]
+    docs = _worker_state["docs"]
+    start = time.time()
+    if task["start_sessions"] == 0:
+        model = gensim.models.doc2vec.Doc2Vec(docs, workers=trial["gensim_workers"], dm=trial["dm"], vector_size=trial["vector_size"],
+                                              window=trial["window"], alpha=trial["lr"], dm_concat=1)
+    else:
+        model = gensim.models.doc2vec.Doc2Vec.load(get_checkpoint_file(task["checkpoints_dir"], trial, task["start_sessions"]))
+        model.workers = trial["gensim_workers"]
+
+    num_sessions = task["target_sessions"] - task["start_sessions"]
+    train_doc2vec_model(model, docs, num_sessions * trial["training_session_epochs"], trial["lr_step"], verbose=False)
+
+    X = features.get_doc_vectors(model)
+    f_score_avg, report = score_doc_vectors(X, _worker_state["y"], _worker_state["train_indices"], _worker_state["test_indices"])
+    record = {
+        "trial_id": trial["trial_id"],
+        "dm": trial["dm"],
+        "vector_size": trial["vector_size"],
+        "window": trial["window"],
+        "lr": trial["lr"],
+        "lr_step": trial["lr_step"],
+        "sessions_trained": task["target_sessions"],
+        "epochs_trained": task["target_sessions"] * trial["training_session_epochs"],
+        "epochs_this_rung": num_sessions * trial["training_session_epochs"],
+        "f_score_avg": f_score_avg,
+        "elapsed_sec": time.time() - start,
+        "report": report.to_dict(orient="list")
+    }
+    record["saved_as_best"] = _save_if_best(model, record)
+
+    # keep a checkpoint so that a surviving configuration continues from here at the next rung; the one this rung
+    # started from is left alone, so a rung interrupted before its record is logged reruns from the same state
+    if task["target_sessions"] < trial["num_training_sessions"]:
+        model.save(get_checkpoint_file(task["checkpoints_dir"], trial, task["target_sessions"]))
+    return record
+
+def successive_halving_doc2vec_models(doc_indices, y, train_indices, test_indices, vector_sizes, windows, lrs_and_lr_steps,
+                                      training_session_epochs, num_training_sessions, dm=0, eta=3, num_parallel_trials=None,
+                                      corpus_dir=util.CORPUS_DIR, trials_dir=util.DOC2VEC_TRIALS_DIR):
+    # Every configuration trains for the first rung's sessions and is scored with the same GaussianNB F-score as the
+    # grid search; only the top 1/eta continue training to the next rung, so the epochs saved on weak configurations
+    # go to the promising ones. Rung results are logged, so an interrupted search resumes at the rung it reached.
+    start = time.time()
+    fingerprint = get_search_fingerprint(doc_indices, y, train_indices, test_indices, corpus_dir)
+    checkpoints_dir = os.path.join(trials_dir, f"halving_checkpoints_{MODEL_TYPES[dm]}_{fingerprint}")
+    os.makedirs(checkpoints_dir, exist_ok=True)
+    trial_log_file, best_model_file = get_search_files(dm, fingerprint, trials_dir, search="halving")
+    trial_log = search_log.TrialLog(trial_log_file)
+    logged = {(record["trial_id"], record["sessions_trained"]): record for record in trial_log.get_session_records()}
+
+    num_parallel_trials, gensim_workers = get_parallelism(num_parallel_trials)
+    survivors = get_trials(dm, vector_sizes, windows, lrs_and_lr_steps, training_session_epochs, num_training_sessions, gensim_workers)
+    rung_sessions = get_rung_sessions(num_training_sessions, eta)
+
+    best_record = read_best_record(best_model_file)
+    best_f_score_avg = multiprocessing.Value("d", best_record["f_score_avg"] if best_record is not None else -1.0)
+    best_lock = multiprocessing.Lock()
+    initargs = (corpus_dir, np.asarray(doc_indices), np.asarray(y), np.asarray(train_indices), np.asarray(test_indices),
+                best_f_score_avg, best_lock, best_model_file)
+
+    epochs_trained = 0
+    trial_sec = 0.0
+    try:
+        with multiprocessing.Pool(num_parallel_trials, initializer=_init_worker, initargs=initargs) as pool:
+            start_sessions = 0
+            for rung, target_sessions in enumerate(rung_sessions):
+                tasks = []
+                rung_records = []
+                for trial in survivors:
+                    key = (trial["trial_id"], target_sessions)
+                    if key in logged:
+                        rung_records.append(logged[key])
+                        continue
+                    tasks.append({
+                        "trial": trial,
+                        "start_sessions": start_sessions,
+                        "target_sessions": target_sessions,
+                        "checkpoints_dir": checkpoints_dir
+                    })
+                print(f"Rung {rung+1}/{len(rung_sessions)}: {len(survivors)} configurations to {target_sessions} sessions "
+                      f"({len(rung_records)} already logged)")
+                for record in pool.imap_unordered(_run_rung, tasks):
+                    trial_log.append(record)
+                    rung_records.append(record)
+                    epochs_trained += record["epochs_this_rung"]
+                    trial_sec += record["elapsed_sec"]
+                    if record["saved_as_best"]:
+                        print(f"New best f-score average: {record['f_score_avg']}")
+
+                # promote the top 1/eta configurations; now that the whole rung is logged, the checkpoints it started from
+                # and those of the configurations that stop here are no longer needed
+                num_promoted = max(1, int(np.ceil(len(survivors) / eta)))
+                promoted_ids = set(record["trial_id"] for record in sorted(rung_records, key=lambda record: record["f_score_avg"], reverse=True)[:num_promoted])
+                for trial in survivors:
+                    if start_sessions > 0:
+                        _remove_model_files(get_checkpoint_file(checkpoints_dir, trial, start_sessions))
+                    if trial["trial_id"] not in promoted_ids or target_sessions == rung_sessions[-1]:
+                        _remove_model_files(get_checkpoint_file(checkpoints_dir, trial, target_sessions))
+                survivors = [trial for trial in survivors if trial["trial_id"] in promoted_ids]
+                start_sessions = target_sessions
+    finally:
+        # logged even when interrupted, so that the total wall clock covers every run
+        wall_clock_sec = time.time() - start
+        if epochs_trained > 0:
+            log_run(trial_log_file, wall_clock_sec, epochs_trained=epochs_trained)
+
+    print("\nDone")
+    summary = {
+        "wall_clock_sec": wall_clock_sec,
+        "total_wall_clock_sec": get_total_wall_clock_sec(trial_log_file),
+        "trial_sec": trial_sec,
+        "epochs_trained": epochs_trained,
+        "best_f_score_avg": best_f_score_avg.value,
+        "fingerprint": fingerprint
+    }
+    return load_best_model(best_model_file, dm) + (summary,)
+
+# summarise an exhaustive grid search over the same data from its trial log (this run or an earlier one) next to a
+# halving summary; the wall clock of each search is summed over its runs, which is the time a user actually waits,
+# while trial-seconds add up the time of every trial even when several ran in parallel
+def compare_with_grid_search(halving_summary, dm, trials_dir=util.DOC2VEC_TRIALS_DIR):
+    trial_log_file, _ = get_search_files(dm, halving_summary["fingerprint"], trials_dir)
+    grid_records = search_log.TrialLog(trial_log_file).get_session_records()
+    trial_id_to_last_record_dict = {}
+    for record in grid_records:
+        trial_id_to_last_record_dict[record["trial_id"]] = record
+    grid_summary = None
+    if len(grid_records) > 0:
+        grid_summary = {
+            "wall_clock_sec": get_total_wall_clock_sec(trial_log_file),
+            "trial_sec": sum(record["elapsed_sec"] for record in trial_id_to_last_record_dict.values()),
+            "epochs_trained": sum(record["epochs_trained"] for record in trial_id_to_last_record_dict.values()),
+            "best_f_score_avg": max(record["f_score_avg"] for record in grid_records)
+        }
+
+    def format_wall_clock(wall_clock_sec):
+        return f"{wall_clock_sec:.1f}s wall clock" if wall_clock_sec is not None else "wall clock not logged"
+
+    halving_wall_clock_sec = halving_summary["total_wall_clock_sec"]
+    print(f"Successive halving: best F-score {halving_summary['best_f_score_avg']:.4f}, "
+          f"{halving_summary['epochs_trained']} epochs, {format_wall_clock(halving_wall_clock_sec)}, "
+          f"{halving_summary['trial_sec']:.1f} trial-seconds")
+    if grid_summary is None:
+        print("Exhaustive grid: no trial log found, run grid_search_doc2vec_models to compare")
+        return grid_summary
+    print(f"Exhaustive grid:    best F-score {grid_summary['best_f_score_avg']:.4f}, "
+          f"{grid_summary['epochs_trained']} epochs, {format_wall_clock(grid_summary['wall_clock_sec'])}, "
+          f"{grid_summary['trial_sec']:.1f} trial-seconds")
+    if grid_summary["wall_clock_sec"] is not None and halving_wall_clock_sec:
+        print(f"Wall-clock speedup of successive halving: {grid_summary['wall_clock_sec'] / halving_wall_clock_sec:.2f}x")
+    return grid_summary
+
+def print_best_model(f_score_avg, report, hyperparams, dm):
+    print(f"\nBest model: ")
+    print(f"\tF-score average: {f_score_avg}")
+    if dm == 0:
+        print("\tType of model: PV-DBOW")
+    elif dm == 1:
+        print("\tType of model: PV-DM")
+    print(f"\tEpochs trained: {hyperparams['epochs_trained']}")
+    print(f"\tVector size: {hyperparams['vector_size']}")
+    print(f"\tWindow size: {hyperparams['window']}")
+    print(f"\tLearning rate: {hyperparams['lr']}")
+    print(f"\tLearning rate step decrease: {hyperparams['lr_step']}")
+    print(f"\tAverage F-score: {f_score_avg}")
+    print("\tClassification report:\n")
+    print(report)
+    print("")
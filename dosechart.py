@@ -0,0 +1,175 @@
+import util
+
+import re
+
+import numpy as np
+
+
+"""
+Constants
+"""
+DOSAGE_LEVELS = [
+    "threshold",
+    "light",
+    "common",
+    "strong",
+    "heavy"
+]
+DURATION_TYPES = [
+    "total",
+    "onset",
+    "come_up",
+    "peak",
+    "offset",
+    "after_effects"
+]
+
+# every value is stored in one unit per kind, so that rows of different drugs compare directly
+DOSAGE_UNIT_TO_MG = {
+    "µg": 1.0e-3,
+    "mg": 1.0
+}
+DURATION_UNIT_TO_MINUTES = {
+    "seconds": 1.0 / 60.0,
+    "minutes": 1.0,
+    "hours": 60.0,
+    "days": 24.0 * 60.0
+}
+KIND_TO_UNITS = {
+    "dosage": DOSAGE_UNIT_TO_MG,
+    "duration": DURATION_UNIT_TO_MINUTES
+}
+KIND_TO_NORMALISED_UNIT = {
+    "dosage": "mg",
+    "duration": "minutes"
+}
+
+# row label link -> (kind, level), e.g. "/wiki/Duration#Come_up" -> ("duration", "come_up")
+HREF_TO_ROW = dict(
+    [(f"/wiki/Dosage_classification#{level.capitalize()}", ("dosage", level)) for level in DOSAGE_LEVELS]
+    + [(f"/wiki/Duration#{duration_type.capitalize()}", ("duration", duration_type)) for duration_type in DURATION_TYPES]
+)
+ROW_HREF_RE = re.compile(r"^/wiki/(Dosage_classification|Duration)#")
+
+QUANTITY_RE = re.compile(r"[-+]?\d*\.\d+|\d+")
+
+DOSECHART_DTYPE = np.dtype([
+    ("drug", "U24"),
+    ("roa", "U16"),
+    ("kind", "U8"),
+    ("level", "U13"),
+    ("low", "f8"),
+    ("high", "f8"),
+    ("unit", "U7")
+])
+
+
+"""
+Parsing
+"""
+def get_unit(text, possible_units):
+    units = [unit for unit in possible_units if unit in text]
+    return units[0] if len(units) == 1 else None
+
+# one labelled row's value text -> (low, high, unit) in the page's own unit; high is None for single values (e.g. a
+# "300 µg +" heavy dose) and None is returned for rows without a number or an unambiguous unit
+def parse_row_value(kind, text):
+    quantities = QUANTITY_RE.findall(text)
+    unit = get_unit(text, KIND_TO_UNITS[kind])
+    if len(quantities) == 0 or len(quantities) > 2 or unit is None:
+        return None
+    low = float(quantities[0])
+    high = float(quantities[1]) if len(quantities) == 2 else None
+    return low, high, unit
+
+# every labelled row of a dosechart from a single find_all over its parent, instead of one subtree search per dosage
+# level and per duration type; only the first row for each label counts, as with the per-label find()
+def parse_dosechart(dosechart):
+    roa = dosechart["data-roa"].lower()
+    rows = []
+    seen = set()
+    for a in dosechart.parent.find_all("a", href=ROW_HREF_RE):
+        row = HREF_TO_ROW.get(a["href"])
+        if row is None or row in seen: continue
+        seen.add(row)
+        values_tag = a.parent.find_next_sibling(class_="RowValues")
+        if values_tag is None or len(values_tag.contents) == 0: continue
+        kind, level = row
+        value = parse_row_value(kind, str(values_tag.contents[0]))
+        if value is None: continue
+        low, high, unit = value
+        rows.append({"roa": roa, "kind": kind, "level": level, "low": low, "high": high, "unit": unit})
+    return rows
+
+def parse_dosecharts(soup):
+    return [row for dosechart in soup.find_all(class_="dosechart") for row in parse_dosechart(dosechart)]
+
+
+"""
+Legacy dictionaries
+"""
+# the nested {roa: {"dosage": {level: (low, unit)}, "duration": {type: ((low, high), unit)}}} dictionary that
+# scrape.get_dosage_dict and scrape.get_duration_dict produce, built from parsed rows
+def to_dosechart_info_dict(rows):
+    roa_to_dicts = {}
+    for row in rows:
+        dosage_dict, duration_dict = roa_to_dicts.setdefault(row["roa"], ({}, {}))
+        if row["kind"] == "dosage":
+            dosage_dict[row["level"]] = (row["low"], row["unit"])
+        else:
+            high = row["high"] if row["high"] is not None else row["low"]
+            duration_dict[row["level"]] = ((row["low"], high), row["unit"])
+
+    dosechart_info_dict = {}
+    for roa, (dosage_dict, duration_dict) in roa_to_dicts.items():
+        dosage_rows = [row for row in rows if row["roa"] == roa and row["kind"] == "dosage"]
+        # a chart with a single level gives the upper end of its range to the next level
+        if len(dosage_dict) == 1 and dosage_rows[0]["high"] is not None and dosage_rows[0]["level"] != DOSAGE_LEVELS[-1]:
+            next_level = DOSAGE_LEVELS[DOSAGE_LEVELS.index(dosage_rows[0]["level"]) + 1]
+            dosage_dict[next_level] = (dosage_rows[0]["high"], dosage_rows[0]["unit"])
+        if len(dosage_dict) != 0 and len(duration_dict) != 0:
+            dosechart_info_dict[roa] = {
+                "dosage": {level: dosage_dict[level] for level in DOSAGE_LEVELS if level in dosage_dict},
+                "duration": {duration_type: duration_dict[duration_type] for duration_type in DURATION_TYPES if duration_type in duration_dict}
+            }
+    return dosechart_info_dict
+
+
+"""
+Table
+"""
+# one typed row per (drug, roa, kind, level) with low/high converted to mg or minutes (high is NaN for single values)
+def build_table(drug_to_rows_dict):
+    records = []
+    for drug, rows in drug_to_rows_dict.items():
+        for row in rows:
+            scale = KIND_TO_UNITS[row["kind"]][row["unit"]]
+            high = row["high"] * scale if row["high"] is not None else np.nan
+            records.append((drug, row["roa"], row["kind"], row["level"], row["low"] * scale, high, KIND_TO_NORMALISED_UNIT[row["kind"]]))
+    return np.array(records, dtype=DOSECHART_DTYPE)
+
+def save_table(table, filepath=util.DOSECHART_TABLE_FILE):
+    np.save(filepath, table)
+    return filepath
+
+def load_table(filepath=util.DOSECHART_TABLE_FILE, mmap_mode=None):
+    return np.load(filepath, mmap_mode=mmap_mode)
+
+def select(table, drug=None, roa=None, kind=None, level=None):
+    mask = np.ones(len(table), dtype=bool)
+    for field, value in (("drug", drug), ("roa", roa), ("kind", kind), ("level", level)):
+        if value is not None:
+            mask &= table[field] == value
+    return table[mask]
+
+# the (drug, roa) charts of one kind and a (charts x levels) matrix of one of their fields, NaN where a chart lacks the
+# level, e.g. pivot(table, "duration", "high")[1][:, DURATION_TYPES.index("total")] for every chart's longest total
+def pivot(table, kind, field="low"):
+    levels = DOSAGE_LEVELS if kind == "dosage" else DURATION_TYPES
+    rows = table[table["kind"] == kind]
+    charts, chart_indices = np.unique(rows[["drug", "roa"]], return_inverse=True)
+    level_indices = np.searchsorted(np.array(sorted(levels)), rows["level"])
+    level_order = np.argsort(levels)
+    matrix = np.full((len(charts), len(levels)), np.nan)
+    matrix[chart_indices.ravel(), level_order[level_indices]] = rows[field]
+    return charts, matrix
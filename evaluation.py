@@ -0,0 +1,148 @@
+import instrument
+
+import numpy as np
+import pandas as pd
+
+
+"""
+Constants
+"""
+MAX_K = 5
+
+
+"""
+Label encoding
+"""
+# map labels onto 0..len(labels)-1; anything not in labels becomes -1 and is ignored by the counts below
+def encode_labels(y, labels):
+    labels = np.asarray(labels)
+    y = np.asarray(y)
+    order = np.argsort(labels)
+    positions = np.searchsorted(labels, y, sorter=order)
+    positions = np.minimum(positions, len(labels) - 1)
+    indices = order[positions]
+    return np.where(labels[indices] == y, indices, -1)
+
+
+"""
+Metrics
+"""
+# rank of the true class in every row of predict_proba from a single argsort, then the cumulative share of rows
+# whose true class is ranked within the top k, for every k from 1 to max_k at once
+def get_top_k_accuracies(probs, classes, y_true, max_k=MAX_K):
+    max_k = min(max_k, probs.shape[1])
+    true_indices = encode_labels(y_true, classes)
+    ranked = np.argsort(-probs, axis=1, kind="stable")[:, :max_k]
+    hits = ranked == true_indices[:, None]
+    ranks = np.where(hits.any(axis=1), hits.argmax(axis=1), max_k)
+    return np.cumsum(np.bincount(ranks, minlength=max_k + 1)[:max_k]) / len(y_true)
+
+# number of samples of each label, ignoring anything not in labels
+def get_label_counts(y, labels):
+    indices = encode_labels(y, labels)
+    return np.bincount(indices[indices >= 0], minlength=len(labels))
+
+# like sklearn's confusion_matrix(labels=...), samples whose true or predicted label is not in labels are left out
+def get_confusion_matrix(y_true, y_pred, labels, normalise=False):
+    true_indices, pred_indices = encode_labels(y_true, labels), encode_labels(y_pred, labels)
+    valid = (true_indices >= 0) & (pred_indices >= 0)
+    num_labels = len(labels)
+    cm = np.bincount(true_indices[valid] * num_labels + pred_indices[valid], minlength=num_labels * num_labels)
+    cm = cm.reshape(num_labels, num_labels)
+    return normalise_confusion_matrix(cm) if normalise else cm
+
+# each row divided by its support; rows of classes absent from the test set stay zero
+def normalise_confusion_matrix(cm):
+    support = cm.sum(axis=1, keepdims=True)
+    return np.divide(cm, support, out=np.zeros(cm.shape, dtype=np.float64), where=support > 0)
+
+def _safe_divide(a, b):
+    return np.divide(a, b, out=np.zeros(len(a), dtype=np.float64), where=b > 0)
+
+# per-class precision/recall/F/support read off the confusion matrix (matches sklearn's
+# precision_recall_fscore_support(labels=labels, average=None) with zero_division=0); the confusion matrix leaves out
+# samples with a label outside labels, so pass the full support and predicted counts (get_label_counts of y_true and
+# y_pred) for predictions of other classes' samples to still count as false positives and misses
+def get_per_class_scores(cm, labels, support=None, predicted=None):
+    true_positives = np.diag(cm).astype(np.float64)
+    support = cm.sum(axis=1) if support is None else np.asarray(support)
+    predicted = cm.sum(axis=0) if predicted is None else np.asarray(predicted)
+    precision = _safe_divide(true_positives, predicted)
+    recall = _safe_divide(true_positives, support)
+    f_score = _safe_divide(2 * precision * recall, precision + recall)
+    return pd.DataFrame({
+        "class": labels,
+        "precision": precision,
+        "recall": recall,
+        "f_score": f_score,
+        "support": support
+    })
+
+
+"""
+Evaluation
+"""
+def evaluate_classifier(clf, X_test, y_test, labels, max_k=MAX_K, probs=None):
+    y_test = np.asarray(y_test)
+    # predict() rather than the argmax of predict_proba, which can disagree (e.g. SVC's Platt scaling)
+    y_pred = clf.predict(X_test)
+    if probs is None and max_k > 0 and hasattr(clf, "predict_proba"):
+        probs = clf.predict_proba(X_test)
+    cm = get_confusion_matrix(y_test, y_pred, labels)
+    return {
+        "report": get_per_class_scores(cm, labels, get_label_counts(y_test, labels), get_label_counts(y_pred, labels)),
+        "confusion_matrix": cm,
+        "top_k_accuracy": None if probs is None else get_top_k_accuracies(probs, clf.classes_, y_test, max_k),
+        "num_samples": len(y_test)
+    }
+
+# combine evaluate_classifier results from several folds: per-class mean/std of each score, top-k accuracy weighted by
+# fold size and the summed (then row-normalised) confusion matrix
+def aggregate_folds(results, labels):
+    reports = [result["report"] for result in results]
+    aggregate = pd.DataFrame({"class": labels})
+    for column in ("precision", "recall", "f_score"):
+        scores = np.vstack([report[column].values for report in reports])
+        aggregate[f"{column}_mean"] = scores.mean(axis=0)
+        aggregate[f"{column}_std"] = scores.std(axis=0)
+    aggregate["support"] = np.sum([report["support"].values for report in reports], axis=0)
+
+    cm = np.sum([result["confusion_matrix"] for result in results], axis=0)
+    top_k_accuracy = None
+    if all(result["top_k_accuracy"] is not None for result in results):
+        weights = np.array([result["num_samples"] for result in results], dtype=np.float64)
+        max_k = min(len(result["top_k_accuracy"]) for result in results)
+        top_k_accuracy = np.average([result["top_k_accuracy"][:max_k] for result in results], axis=0, weights=weights)
+    fold_f_scores = np.array([report["f_score"].mean() for report in reports])
+    return {
+        "report": aggregate,
+        "confusion_matrix": normalise_confusion_matrix(cm),
+        "top_k_accuracy": top_k_accuracy,
+        "f_score_mean": float(fold_f_scores.mean()),
+        "f_score_std": float(fold_f_scores.std())
+    }
+
+
+"""
+Classifier testing
+"""
+# test given classifier on test set
+@instrument.traced(count=lambda args, kwargs, report: int(report["support"].sum()))
+def test_classifier(clf, X_test, y_test, labels, top_n=3, show_top_n_accuracy=False, show_confusion_matrix=False):
+    result = evaluate_classifier(clf, X_test, y_test, labels, max_k=top_n if show_top_n_accuracy else 0)
+    
+    if show_top_n_accuracy:
+        print(f"Top-{top_n} accuracy: {result['top_k_accuracy'][-1]}")
+    
+    if show_confusion_matrix:
+        import plotting
+        plotting.plot_confusion_matrix(normalise_confusion_matrix(result["confusion_matrix"]), labels)
+        
+    return result["report"]
+
+# train and test using all data with k-fold, folds running in parallel over a shared memmap of X (see kfold.run_k_fold)
+def train_and_test_classifier_k_fold(X, y, clf_untrained, k_fold=10, num_processes=None):
+    import kfold
+
+    aggregate = kfold.run_k_fold(X, y, clf_untrained, k_fold=k_fold, num_processes=num_processes, max_k=0)
+    return [(result["report"], np.mean(result["report"]["f_score"])) for result in aggregate["folds"]]
@@ -0,0 +1,130 @@
+import html
+import html.parser
+import re
+
+
+"""
+Constants
+"""
+START_BODY_MARKER = b"<!-- Start Body -->"
+END_BODY_MARKER = b"<!-- End Body -->"
+
+DEFAULT_BACKEND = "fast"
+
+# every ASCII control character except NUL becomes a space, as in the original per-character replace loop
+CONTROL_CHARACTERS_TRANSLATE_TABLE = {char: " " for char in range(1, 32)}
+
+CHARSET_RE = re.compile(rb"""<meta[^>]+charset=["']?([A-Za-z0-9_\-]+)""", re.IGNORECASE)
+# the markup html.parser (and so the BeautifulSoup reference) recognises: comments, script/style elements whose content
+# is dropped, and tags or declarations, which start with a letter, "/" + letter, "!" or "?" after the "<". Any other
+# "<" (e.g. "3 < 5", "<3.5g") is text
+NON_TEXT_ELEMENTS = ("script", "style")
+TAG_OR_COMMENT_RE = re.compile(
+    r"<!--.*?-->|<(script|style)\b[^>]*>.*?</\1\s*>|</?[A-Za-z][^>]*>|<[!?][^>]*>",
+    re.DOTALL | re.IGNORECASE
+)
+
+
+"""
+Raw bytes helpers
+"""
+def detect_encoding(content):
+    match = CHARSET_RE.search(content, 0, 2048)
+    if match:
+        encoding = match.group(1).decode("ascii").lower()
+        try:
+            "".encode(encoding)
+            return encoding
+        except LookupError:
+            pass
+    return "utf-8"
+
+def decode(content, encoding=None):
+    encoding = encoding or detect_encoding(content)
+    try:
+        return content.decode(encoding)
+    except UnicodeDecodeError:
+        return content.decode("cp1252", errors="replace")
+
+# slice the report body out of the raw page without parsing the rest of the document
+def get_body_bytes(content):
+    start = content.find(START_BODY_MARKER)
+    start = start + len(START_BODY_MARKER) if start != -1 else 0
+    end = content.rfind(END_BODY_MARKER)
+    end = end if end != -1 else len(content)
+    return content[start:end]
+
+def remove_control_characters(text):
+    return text.translate(CONTROL_CHARACTERS_TRANSLATE_TABLE)
+
+
+"""
+Backends
+"""
+def strip_tags_fast(body):
+    return html.unescape(TAG_OR_COMMENT_RE.sub("", body))
+
+
+class _TextCollector(html.parser.HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.chunks = []
+        self.non_text_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in NON_TEXT_ELEMENTS:
+            self.non_text_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in NON_TEXT_ELEMENTS and self.non_text_depth > 0:
+            self.non_text_depth -= 1
+
+    def handle_data(self, data):
+        if self.non_text_depth == 0:
+            self.chunks.append(data)
+
+def strip_tags_html_parser(body):
+    collector = _TextCollector()
+    collector.feed(body)
+    collector.close()
+    return "".join(collector.chunks)
+
+def strip_tags_lxml(body):
+    import lxml.html
+    if not body.strip():
+        return ""
+    fragment = lxml.html.fragment_fromstring(body, create_parent="div")
+    for element in fragment.xpath("|".join(f".//{tag}" for tag in NON_TEXT_ELEMENTS)):
+        element.drop_tree()
+    return fragment.text_content()
+
+# the original two-pass BeautifulSoup extraction, kept as the reference for equivalence checks
+def extract_trip_report_reference(content):
+    from bs4 import BeautifulSoup
+    soup_trip_report = BeautifulSoup(content, "html.parser")
+    start = START_BODY_MARKER.decode()
+    end = END_BODY_MARKER.decode()
+    s = str(soup_trip_report)
+    s = s[s.find(start)+len(start):s.rfind(end)]
+    trip_report = BeautifulSoup(s, "html.parser").text
+    escapes = "".join([chr(char) for char in range(1, 32)])
+    for escape in escapes:
+        trip_report = trip_report.replace(escape, " ")
+    return trip_report
+
+BACKENDS = {
+    "fast": strip_tags_fast,
+    "html.parser": strip_tags_html_parser,
+    "lxml": strip_tags_lxml
+}
+
+
+"""
+Extraction
+"""
+def extract_trip_report(content, backend=DEFAULT_BACKEND):
+    if backend == "reference":
+        return extract_trip_report_reference(content)
+    body = decode(get_body_bytes(content), detect_encoding(content))
+    trip_report = BACKENDS[backend](body)
+    return remove_control_characters(trip_report)
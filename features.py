@@ -0,0 +1,88 @@
+import util
+
+import json
+import os
+
+import numpy as np
+
+
+"""
+Constants
+"""
+DOC_VECTORS_FILENAME = "doc_vectors.npy"
+LABELS_FILENAME = "labels.npy"
+MASK_FILENAME = "mask.npy"
+TRAIN_INDICES_FILENAME = "train_indices.npy"
+TEST_INDICES_FILENAME = "test_indices.npy"
+METADATA_FILENAME = "metadata.json"
+
+
+"""
+Doc vectors
+"""
+# the doc vector matrix itself (rows in DOC_{i} tag order), without copying vectors one by one
+def get_doc_vectors(model):
+    if hasattr(model, "dv"):
+        return model.dv.vectors
+    return model.docvecs.vectors_docs
+
+
+"""
+Feature store
+"""
+def get_feature_store_dir(name, features_dir=util.FEATURES_DIR):
+    return os.path.join(features_dir, name)
+
+# write the doc vector matrix next to its labels, the corpus mask it was trained on and the train/test split, so that
+# downstream stages can memory-map the features without unpickling the Doc2Vec model or importing gensim; mask is over
+# the whole corpus and must select exactly the documents the model has vectors for, one per row of X and label in y
+def write_feature_store(model, y, mask, train_indices, test_indices, name, hyperparams=None, features_dir=util.FEATURES_DIR):
+    X = get_doc_vectors(model)
+    mask = np.asarray(mask, dtype=bool)
+    if len(y) != len(X):
+        raise ValueError(f"{len(y)} labels for {len(X)} doc vectors")
+    if mask.sum() != len(X):
+        raise ValueError(f"mask selects {mask.sum()} of {len(mask)} documents for {len(X)} doc vectors")
+    directory = get_feature_store_dir(name, features_dir)
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, DOC_VECTORS_FILENAME), X)
+    np.save(os.path.join(directory, LABELS_FILENAME), np.asarray(y, dtype=str))
+    np.save(os.path.join(directory, MASK_FILENAME), mask)
+    np.save(os.path.join(directory, TRAIN_INDICES_FILENAME), np.asarray(train_indices, dtype=np.int64))
+    np.save(os.path.join(directory, TEST_INDICES_FILENAME), np.asarray(test_indices, dtype=np.int64))
+    metadata = {
+        "num_docs": int(X.shape[0]),
+        "vector_size": int(X.shape[1]),
+        "dtype": str(X.dtype),
+        "hyperparams": hyperparams or {}
+    }
+    with open(os.path.join(directory, METADATA_FILENAME), "w") as f:
+        json.dump(metadata, f, indent=4)
+    return directory
+
+
+class FeatureStore:
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, METADATA_FILENAME)) as f:
+            self.metadata = json.load(f)
+        self.X = np.load(os.path.join(directory, DOC_VECTORS_FILENAME), mmap_mode="r")
+        self.y = np.load(os.path.join(directory, LABELS_FILENAME), mmap_mode="r")
+        self.mask = np.load(os.path.join(directory, MASK_FILENAME), mmap_mode="r")
+        self.train_indices = np.load(os.path.join(directory, TRAIN_INDICES_FILENAME))
+        self.test_indices = np.load(os.path.join(directory, TEST_INDICES_FILENAME))
+
+    def __len__(self):
+        return len(self.y)
+
+    @property
+    def labels(self):
+        return np.unique(self.y)
+
+    def get_train_test_split(self):
+        X_train, X_test = self.X[self.train_indices, :], self.X[self.test_indices, :]
+        y_train, y_test = self.y[self.train_indices], self.y[self.test_indices]
+        return X_train, X_test, y_train, y_test
+
+def load_feature_store(name, features_dir=util.FEATURES_DIR):
+    return FeatureStore(get_feature_store_dir(name, features_dir))
@@ -0,0 +1,214 @@
+import util
+import cache
+
+import collections
+import concurrent.futures
+import itertools
+import threading
+import time
+import urllib.parse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+"""
+Constants
+"""
+HEADERS = {
+    'User-Agent': 'Ian Scott Knight',
+    'From': 'ianscottknight@protonmail.com'
+}
+
+NUM_WORKERS = 8
+
+# requests Fetcher.map keeps in flight (and bodies it holds) per worker, ahead of the consumer
+MAX_IN_FLIGHT_PER_WORKER = 2
+
+# Erowid only permits up to 5000 requests per day, otherwise they ban your IP, so we stay a little under that.
+# Each entry is host -> (requests per second, burst size, requests per budget window, budget window in seconds).
+# Hosts not listed here fall back to DEFAULT_HOST_LIMITS.
+HOST_LIMITS = {
+    "www.erowid.org": (2.0, 4, 4900, 24 * 60 * 60),
+    "psychonautwiki.org": (4.0, 8, None, None)
+}
+DEFAULT_HOST_LIMITS = (4.0, 8, None, None)
+
+
+"""
+Rate limiting
+"""
+class TokenBucket:
+    # refills at `rate` tokens per second up to `capacity`; acquire() blocks until a token is available
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+
+class HostBudget:
+    # allows at most `max_requests` per `window` seconds; once spent, acquire() pauses until the window rolls over.
+    # With a budget_store (e.g. cache.ResponseCache) the window and count survive restarts
+    def __init__(self, host, max_requests, window, budget_store=None, clock=time.time, sleep=time.sleep):
+        self.host = host
+        self.max_requests = max_requests
+        self.window = window
+        self.budget_store = budget_store
+        self.clock = clock
+        self.sleep = sleep
+        self.window_start = clock()
+        self.count = 0
+        self.lock = threading.Lock()
+        saved = budget_store.load_budget(host) if budget_store is not None else None
+        if saved is not None:
+            self.window_start, self.count = saved
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = self.clock()
+                if now - self.window_start >= self.window:
+                    self.window_start = now
+                    self.count = 0
+                if self.count < self.max_requests:
+                    self.count += 1
+                    if self.budget_store is not None:
+                        self.budget_store.save_budget(self.host, self.window_start, self.count)
+                    return
+                resume_at = self.window_start + self.window
+            print(f"Request budget for {self.host} spent ({self.max_requests} per {self.window}s), "
+                  f"pausing until {time.ctime(resume_at)}...")
+            self.sleep(max(0.0, resume_at - self.clock()))
+
+
+class RateLimiter:
+    # global registry of per-host token buckets and budgets, shared by all workers of a Fetcher
+    def __init__(self, host_limits=HOST_LIMITS, default_host_limits=DEFAULT_HOST_LIMITS, budget_store=None):
+        self.host_limits = host_limits
+        self.default_host_limits = default_host_limits
+        self.budget_store = budget_store
+        self.buckets = {}
+        self.budgets = {}
+        self.lock = threading.Lock()
+
+    def _get_host_limiters(self, host):
+        with self.lock:
+            if host not in self.buckets:
+                rate, burst, max_requests, window = self.host_limits.get(host, self.default_host_limits)
+                self.buckets[host] = TokenBucket(rate, burst) if rate else None
+                self.budgets[host] = HostBudget(host, max_requests, window, self.budget_store) if max_requests else None
+            return self.buckets[host], self.budgets[host]
+
+    def acquire(self, url):
+        host = urllib.parse.urlsplit(url).netloc
+        bucket, budget = self._get_host_limiters(host)
+        if budget is not None:
+            budget.acquire()
+        if bucket is not None:
+            bucket.acquire()
+
+
+"""
+Fetch engine
+"""
+class Fetcher:
+    # pass response_cache=None to always go to the network; the default rate limiter keeps its host budgets in the cache
+    def __init__(self, num_workers=NUM_WORKERS, rate_limiter=None, response_cache=None, headers=HEADERS, timeout=30, max_retries=3,
+                 max_in_flight=None):
+        self.num_workers = num_workers
+        self.max_in_flight = max_in_flight or MAX_IN_FLIGHT_PER_WORKER * num_workers
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter(budget_store=response_cache)
+        self.response_cache = response_cache
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=num_workers, pool_maxsize=num_workers, max_retries=max_retries)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.stats = collections.Counter()
+
+    def get(self, url, **kwargs):
+        cached_page, is_fresh, validator_headers = None, False, {}
+        if self.response_cache is not None:
+            cached_page, is_fresh, validator_headers = self.response_cache.lookup(url)
+            if is_fresh:
+                # served from disk without spending any of the host's request budget
+                self.stats["cache_hit"] += 1
+                if util.DEBUG:
+                    print(f"URL: {url}\n\tCache hit")
+                return cached_page
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        headers.update(validator_headers)
+        self.rate_limiter.acquire(url)
+        page = self.session.get(url, headers=headers, timeout=self.timeout, **kwargs)
+        self.stats[page.status_code] += 1
+        if util.DEBUG:
+            print(f"URL: {url}\n\tStatus code: {page.status_code}")
+
+        if self.response_cache is not None:
+            if page.status_code == 304 and cached_page is not None:
+                self.stats["cache_revalidated"] += 1
+                self.response_cache.refresh(url)
+                return cached_page
+            if page.status_code == 200:
+                self.response_cache.store(url, page)
+        return page
+
+    # fetch urls concurrently, yielding (url, page) pairs in the same order as urls. At most max_in_flight requests
+    # are submitted ahead of the consumer, and closing the generator early cancels those not yet started
+    def map(self, urls, **kwargs):
+        urls = iter(urls)
+        in_flight = collections.deque()
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.num_workers)
+        try:
+            for url in itertools.islice(urls, self.max_in_flight):
+                in_flight.append((url, executor.submit(self.get, url, **kwargs)))
+            while in_flight:
+                url, future = in_flight.popleft()
+                page = future.result()
+                for next_url in itertools.islice(urls, 1):
+                    in_flight.append((next_url, executor.submit(self.get, next_url, **kwargs)))
+                yield url, page
+        finally:
+            for _, future in in_flight:
+                future.cancel()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def close(self):
+        self.session.close()
+
+
+_default_fetcher = None
+_default_fetcher_lock = threading.Lock()
+
+def get_default_fetcher():
+    global _default_fetcher
+    with _default_fetcher_lock:
+        if _default_fetcher is None:
+            _default_fetcher = Fetcher(response_cache=cache.ResponseCache())
+        return _default_fetcher
+
+def set_default_fetcher(fetcher):
+    global _default_fetcher
+    with _default_fetcher_lock:
+        _default_fetcher = fetcher
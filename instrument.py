@@ -0,0 +1,330 @@
+import util
+
+import cProfile
+import csv
+import functools
+import itertools
+import json
+import os
+import re
+import resource
+import sys
+import threading
+import time
+
+
+"""
+Constants
+"""
+RSS_SAMPLE_INTERVAL_SEC = 0.01
+
+CSV_FIELDS = ["stage", "started_at", "wall_sec", "cpu_sec", "children_cpu_sec", "num_items", "items_per_sec", "peak_rss_mb",
+              "children_max_rss_mb", "pid", "error", "attrs"]
+
+# setting this environment variable to a .jsonl or .csv path turns instrumentation on at import time
+TRACE_FILE_ENV_VAR = "PIPELINE_TRACE_FILE"
+
+
+"""
+Memory
+"""
+def get_rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # ru_maxrss is the lifetime peak (in KiB on Linux), the best available without /proc
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class RSSSampler:
+    # the lifetime ru_maxrss cannot be reset per stage, so the peak RSS of each open stage is sampled instead; a single
+    # background thread serves every open stage (nested, or on other threads) and only runs while at least one is open
+    def __init__(self, interval_sec=RSS_SAMPLE_INTERVAL_SEC):
+        self.interval_sec = interval_sec
+        self._lock = threading.Lock()
+        self._peaks = {} # watch id -> peak RSS (bytes) since the watch started
+        self._watch_ids = itertools.count()
+        self._stop = None
+        self._thread = None
+
+    def _sample(self, stop):
+        while not stop.wait(self.interval_sec):
+            rss = get_rss_bytes()
+            with self._lock:
+                for watch_id, peak_rss in self._peaks.items():
+                    self._peaks[watch_id] = max(peak_rss, rss)
+
+    def start_watch(self):
+        rss = get_rss_bytes()
+        with self._lock:
+            watch_id = next(self._watch_ids)
+            self._peaks[watch_id] = rss
+            if self._thread is None:
+                self._stop = threading.Event()
+                self._thread = threading.Thread(target=self._sample, args=(self._stop,), name="rss-sampler", daemon=True)
+                self._thread.start()
+        return watch_id
+
+    # the peak RSS since start_watch returned watch_id
+    def stop_watch(self, watch_id):
+        rss = get_rss_bytes()
+        thread = None
+        with self._lock:
+            # a stage entered before a fork and exited in the child has no watch in the child's fresh sampler
+            peak_rss = max(self._peaks.pop(watch_id, rss), rss)
+            if len(self._peaks) == 0 and self._thread is not None:
+                self._stop.set()
+                thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+        return peak_rss
+
+_rss_sampler = RSSSampler()
+
+
+"""
+State
+"""
+class _State:
+    def __init__(self):
+        self.enabled = False
+        self.trace_file = None
+        self.profile_dir = None
+        self.sample_memory = True
+        self.records = []
+        self.lock = threading.Lock()
+        self.profiling = False
+        self.profile_counts = {}
+
+_state = _State()
+
+# a forked child has no sampler thread, and a lock some other thread held at fork time would never be released in it;
+# a profile the parent was taking is never dumped from the child, so the child's own outermost stages profile afresh
+def _reset_after_fork():
+    global _rss_sampler
+    _rss_sampler = RSSSampler()
+    _state.lock = threading.Lock()
+    if _state.profiling:
+        sys.setprofile(None)
+    _state.profiling = False
+    _state.profile_counts = {}
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+# record every stage in memory, appending each record to trace_file (.csv, otherwise JSON lines) as it completes and
+# dumping a cProfile of each outermost profiled stage into profile_dir when given
+def enable(trace_file=None, profile_dir=None, sample_memory=True):
+    _state.trace_file = trace_file
+    _state.profile_dir = profile_dir
+    _state.sample_memory = sample_memory
+    for directory in (os.path.dirname(trace_file) if trace_file else None, profile_dir):
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    _state.enabled = True
+
+def disable():
+    _state.enabled = False
+
+def is_enabled():
+    return _state.enabled
+
+def get_records():
+    with _state.lock:
+        return list(_state.records)
+
+def clear_records():
+    with _state.lock:
+        _state.records.clear()
+
+
+"""
+Stages
+"""
+class _NullStage:
+    # what stage() returns while instrumentation is off: every hook is a no-op, and attrs and result are fresh dicts on
+    # every access, so that what callers write into them is dropped instead of piling up on the shared instance
+    num_items = None
+
+    @property
+    def attrs(self):
+        return {}
+
+    @property
+    def result(self):
+        return {}
+
+    def add_items(self, num_items):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+
+class Stage:
+    # wall time, CPU time (own and of child processes), item count and peak RSS of one pipeline stage;
+    # children_max_rss_mb is RUSAGE_CHILDREN's ru_maxrss, the peak RSS of the largest child process this process has
+    # waited for so far, over its whole lifetime rather than this stage (it cannot be reset or attributed per stage)
+    def __init__(self, name, num_items=None, profile=True, sample_memory=True, **attrs):
+        self.name = name
+        self.num_items = num_items
+        self.attrs = attrs
+        self.profile = profile
+        self.sample_memory = sample_memory
+        self.result = {}
+        self._rss_watch_id = None
+        self._profiler = None
+
+    def add_items(self, num_items):
+        self.num_items = (self.num_items or 0) + num_items
+
+    def __enter__(self):
+        if self.sample_memory:
+            self._rss_watch_id = _rss_sampler.start_watch()
+        if self.profile and _state.profile_dir:
+            # cProfile cannot nest, so only the outermost profiled stage (of all threads) gets a profile
+            with _state.lock:
+                is_outermost = not _state.profiling
+                _state.profiling = True
+            if is_outermost:
+                self._profiler = cProfile.Profile()
+                self._profiler.enable()
+        self._started_at = time.time()
+        self._cpu_start = time.process_time()
+        self._children_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall_sec = time.perf_counter() - self._start
+        cpu_sec = time.process_time() - self._cpu_start
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._dump_profile()
+            with _state.lock:
+                _state.profiling = False
+        self.result = {
+            "stage": self.name,
+            "started_at": self._started_at,
+            "wall_sec": wall_sec,
+            "cpu_sec": cpu_sec,
+            "children_cpu_sec": (children.ru_utime + children.ru_stime) - (self._children_start.ru_utime + self._children_start.ru_stime),
+            "num_items": self.num_items,
+            "items_per_sec": self.num_items / wall_sec if self.num_items is not None and wall_sec > 0 else None,
+            "peak_rss_mb": _rss_sampler.stop_watch(self._rss_watch_id) / 2**20 if self._rss_watch_id is not None else None,
+            "children_max_rss_mb": children.ru_maxrss / 2**10,
+            "pid": os.getpid(),
+            "attrs": self.attrs
+        }
+        if exc_info[0] is not None:
+            self.result["error"] = exc_info[0].__name__
+        _record(self.result)
+        return False
+
+    def _dump_profile(self):
+        name = re.sub(r"[^\w\-]+", "_", self.name)
+        with _state.lock:
+            count = _state.profile_counts.get(name, 0)
+            _state.profile_counts[name] = count + 1
+        self._profiler.dump_stats(os.path.join(_state.profile_dir, f"{name}_{os.getpid()}_{count}.prof"))
+
+def stage(name, num_items=None, profile=True, **attrs):
+    if not _state.enabled:
+        return _NULL_STAGE
+    return Stage(name, num_items, profile=profile, sample_memory=_state.sample_memory, **attrs)
+
+# decorator form of stage(); count(args, kwargs, result) returns the number of items the call processed
+def traced(name=None, count=None, profile=True):
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return func(*args, **kwargs)
+            with stage(stage_name, profile=profile) as s:
+                result = func(*args, **kwargs)
+                if count is not None:
+                    s.num_items = count(args, kwargs, result)
+            return result
+        return wrapper
+    return decorator
+
+def count_result(args, kwargs, result):
+    return len(result)
+
+def count_first_arg(args, kwargs, result):
+    return len(args[0])
+
+
+"""
+Traces
+"""
+def _record(result):
+    with _state.lock:
+        _state.records.append(result)
+        if _state.trace_file:
+            _append_to_trace_file(_state.trace_file, result)
+
+def _to_csv_row(result):
+    row = {field: result.get(field) for field in CSV_FIELDS}
+    row["attrs"] = json.dumps(result.get("attrs") or {}, default=str)
+    return row
+
+# records are appended as soon as a stage ends (and from forked worker processes too), so a crashed or interrupted run
+# still leaves a trace behind
+def _append_to_trace_file(filepath, result):
+    if filepath.endswith(".csv"):
+        is_new = not os.path.exists(filepath) or os.path.getsize(filepath) == 0
+        with open(filepath, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            if is_new:
+                writer.writeheader()
+            writer.writerow(_to_csv_row(result))
+    else:
+        with open(filepath, "a") as f:
+            f.write(json.dumps(result, default=str) + "\n")
+
+def write_trace(filepath, records=None):
+    records = get_records() if records is None else records
+    if filepath.endswith(".csv"):
+        with open(filepath, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            writer.writerows(_to_csv_row(record) for record in records)
+    else:
+        with open(filepath, "w") as f:
+            for record in records:
+                f.write(json.dumps(record, default=str) + "\n")
+    return filepath
+
+def get_default_trace_file():
+    return os.path.join(util.TRACES_DIR, f"trace_{time.strftime('%Y%m%d_%H%M%S')}.jsonl")
+
+# total wall/CPU time and items per stage name, largest first
+def summarise(records=None):
+    records = get_records() if records is None else records
+    totals = {}
+    for record in records:
+        total = totals.setdefault(record["stage"], {"calls": 0, "wall_sec": 0.0, "cpu_sec": 0.0, "num_items": 0, "peak_rss_mb": 0.0})
+        total["calls"] += 1
+        total["wall_sec"] += record["wall_sec"]
+        total["cpu_sec"] += record["cpu_sec"]
+        total["num_items"] += record["num_items"] or 0
+        total["peak_rss_mb"] = max(total["peak_rss_mb"], record["peak_rss_mb"] or 0.0)
+    return dict(sorted(totals.items(), key=lambda item: item[1]["wall_sec"], reverse=True))
+
+def print_summary(records=None):
+    for name, total in summarise(records).items():
+        print(f"{name:>32}: {total['calls']:5d} calls, {total['wall_sec']:9.2f}s wall, {total['cpu_sec']:9.2f}s CPU, "
+              f"{total['num_items']:9d} items, peak RSS {total['peak_rss_mb']:.0f} MB")
+
+
+if os.environ.get(TRACE_FILE_ENV_VAR):
+    enable(trace_file=os.environ[TRACE_FILE_ENV_VAR])
@@ -0,0 +1,116 @@
+import evaluation
+import instrument
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+
+"""
+Constants
+"""
+K_FOLD = 10
+
+
+"""
+Shared feature matrix
+"""
+# a whole-array memmap opened from an .npy file (e.g. FeatureStore.X) can be reopened by the workers as is
+def get_npy_source(X):
+    if not isinstance(X, np.memmap) or not X.filename or not X.filename.endswith(".npy") or not X.flags.c_contiguous:
+        return None
+    source = np.load(X.filename, mmap_mode="r")
+    if source.shape != X.shape or source.dtype != X.dtype or source.offset != X.offset:
+        return None
+    return X.filename
+
+# publish X once as a read-only .npy memmap that every worker maps, instead of pickling a copy per worker or per fold;
+# returns the file path and the temporary directory to remove afterwards (None when X already lives in an .npy file)
+def publish_array(X, temp_dir=None):
+    filepath = get_npy_source(X)
+    if filepath is not None:
+        return filepath, None
+    directory = tempfile.mkdtemp(prefix="kfold_", dir=temp_dir)
+    filepath = os.path.join(directory, "X.npy")
+    np.save(filepath, np.asarray(X))
+    return filepath, directory
+
+
+"""
+Workers
+"""
+_worker_state = {}
+
+def _init_worker(X_file, y, clf_untrained, labels, max_k):
+    # each worker fits one fold at a time, so keep BLAS single-threaded to avoid oversubscribing the cores
+    try:
+        from threadpoolctl import threadpool_limits
+        _worker_state["threadpool_limits"] = threadpool_limits(limits=1)
+    except ImportError:
+        pass
+    _worker_state["X"] = np.load(X_file, mmap_mode="r")
+    _worker_state["y"] = y
+    _worker_state["clf_untrained"] = clf_untrained
+    _worker_state["labels"] = labels
+    _worker_state["max_k"] = max_k
+
+# undo _init_worker when the folds ran in this process, so the caller keeps its BLAS threads and no copy of y
+def _clear_worker_state():
+    limits = _worker_state.get("threadpool_limits")
+    if limits is not None:
+        limits.restore_original_limits()
+    _worker_state.clear()
+
+def _run_fold(args):
+    from sklearn.base import clone
+
+    fold, train_indices, test_indices = args
+    X, y = _worker_state["X"], _worker_state["y"]
+    clf = clone(_worker_state["clf_untrained"])
+    # only this fold's rows are copied out of the shared memmap
+    clf.fit(X[train_indices], y[train_indices])
+    result = evaluation.evaluate_classifier(clf, X[test_indices], y[test_indices], _worker_state["labels"], _worker_state["max_k"])
+    return fold, result
+
+
+"""
+Runner
+"""
+# fit and test clf_untrained on every StratifiedKFold split in parallel, returning evaluation.aggregate_folds() of the
+# per-fold results (per-class mean/std scores, pooled confusion matrix, top-k accuracy) plus the results themselves
+def run_k_fold(X, y, clf_untrained, k_fold=K_FOLD, num_processes=None, max_k=evaluation.MAX_K, temp_dir=None):
+    from sklearn.model_selection import StratifiedKFold
+
+    y = np.asarray(y)
+    labels = np.unique(y)
+    skf = StratifiedKFold(n_splits=k_fold)
+    folds = [(fold, train_indices, test_indices) for fold, (train_indices, test_indices) in enumerate(skf.split(np.zeros(len(y)), y))]
+    num_processes = min(num_processes or multiprocessing.cpu_count(), k_fold)
+
+    with instrument.stage("k_fold", num_items=len(y), k_fold=k_fold, num_processes=num_processes, classifier=clf_untrained.__class__.__name__):
+        X_file, directory = publish_array(X, temp_dir)
+        try:
+            results = [None] * k_fold
+            initargs = (X_file, y, clf_untrained, labels, max_k)
+            if num_processes == 1:
+                _init_worker(*initargs)
+                try:
+                    for args in folds:
+                        fold, result = _run_fold(args)
+                        results[fold] = result
+                finally:
+                    _clear_worker_state()
+            else:
+                with multiprocessing.Pool(num_processes, initializer=_init_worker, initargs=initargs) as pool:
+                    for fold, result in pool.imap_unordered(_run_fold, folds):
+                        results[fold] = result
+        finally:
+            if directory is not None:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    aggregate = evaluation.aggregate_folds(results, labels)
+    aggregate["folds"] = results
+    return aggregate
@@ -0,0 +1,138 @@
+import util
+import instrument
+
+import collections
+import hashlib
+import multiprocessing
+import sqlite3
+import time
+
+
+"""
+Constants
+"""
+LANGUAGE = "en"
+
+# langdetect is probabilistic; seeding its factory makes verdicts reproducible between runs
+SEED = 0
+
+BATCH_SIZE = 64
+
+UNKNOWN_LANGUAGE = "unknown"
+
+
+"""
+Language detection
+"""
+def _init_worker(seed=SEED):
+    import langdetect
+    langdetect.DetectorFactory.seed = seed
+
+def _detect_batch(batch):
+    import langdetect
+    verdicts = []
+    for text_hash, text in batch:
+        try:
+            lang = langdetect.detect(text)
+        except langdetect.lang_detect_exception.LangDetectException:
+            lang = UNKNOWN_LANGUAGE # e.g. text without any letters
+        verdicts.append((text_hash, lang))
+    return verdicts
+
+def hash_text(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+"""
+Verdict cache
+"""
+class LanguageCache:
+    # SQLite table of text hash -> detected language, so re-filtering only runs detection on unseen reports
+    def __init__(self, filepath=util.LANGUAGE_CACHE_FILE, seed=SEED):
+        self.db = sqlite3.connect(filepath)
+        self.db.execute("CREATE TABLE IF NOT EXISTS verdicts (text_hash TEXT NOT NULL, seed INTEGER NOT NULL, lang TEXT NOT NULL, PRIMARY KEY (text_hash, seed))")
+        self.db.commit()
+        self.seed = seed
+
+    def get_many(self, text_hashes):
+        verdicts = {}
+        text_hashes = list(text_hashes)
+        for i in range(0, len(text_hashes), 500):
+            chunk = text_hashes[i:i+500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.db.execute(
+                f"SELECT text_hash, lang FROM verdicts WHERE seed = ? AND text_hash IN ({placeholders})",
+                [self.seed] + chunk
+            )
+            verdicts.update(rows)
+        return verdicts
+
+    def put_many(self, verdicts):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO verdicts (text_hash, seed, lang) VALUES (?, ?, ?)",
+            [(text_hash, self.seed, lang) for text_hash, lang in verdicts]
+        )
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+"""
+Filter stage
+"""
+def detect_languages(texts, num_processes=None, batch_size=BATCH_SIZE, language_cache=None, seed=SEED):
+    # returns text hash -> language for every text, plus the number of verdicts served from the cache
+    text_hash_to_text_dict = {hash_text(text): text for text in texts}
+    verdicts = language_cache.get_many(text_hash_to_text_dict.keys()) if language_cache is not None else {}
+    num_cached = len(verdicts)
+
+    to_detect = [(text_hash, text) for text_hash, text in text_hash_to_text_dict.items() if text_hash not in verdicts]
+    batches = [to_detect[i:i+batch_size] for i in range(0, len(to_detect), batch_size)]
+    if len(batches) > 0:
+        num_processes = num_processes or multiprocessing.cpu_count()
+        with multiprocessing.Pool(num_processes, initializer=_init_worker, initargs=(seed,)) as pool:
+            for batch_verdicts in pool.imap_unordered(_detect_batch, batches):
+                verdicts.update(batch_verdicts)
+                if language_cache is not None:
+                    language_cache.put_many(batch_verdicts)
+
+    return verdicts, num_cached
+
+def filter_language(drug_to_trip_reports_dict, language=LANGUAGE, num_processes=None, batch_size=BATCH_SIZE, use_cache=True, seed=SEED):
+    start = time.perf_counter()
+    language_cache = LanguageCache(seed=seed) if use_cache else None
+    texts = [trip_report for trip_reports in drug_to_trip_reports_dict.values() for trip_report in trip_reports]
+    with instrument.stage("language_filter", num_items=len(texts)) as stage:
+        verdicts, num_cached = detect_languages(texts, num_processes, batch_size, language_cache, seed)
+        stage.attrs["num_cached"] = num_cached
+    if language_cache is not None:
+        language_cache.close()
+
+    filtered_dict = {}
+    drug_to_stats_dict = {}
+    for drug, trip_reports in drug_to_trip_reports_dict.items():
+        langs = [verdicts[hash_text(trip_report)] for trip_report in trip_reports]
+        filtered_dict[drug] = [trip_report for trip_report, lang in zip(trip_reports, langs) if lang == language]
+        drug_to_stats_dict[drug] = {
+            "total": len(trip_reports),
+            "rejected": len(trip_reports) - len(filtered_dict[drug]),
+            "rejected_languages": dict(collections.Counter(lang for lang in langs if lang != language))
+        }
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "num_texts": len(texts),
+        "num_detected": len(verdicts) - num_cached,
+        "num_cached": num_cached,
+        "elapsed_sec": elapsed,
+        "texts_per_sec": len(texts) / elapsed if elapsed > 0 else float("inf"),
+        "drugs": drug_to_stats_dict
+    }
+    return filtered_dict, stats
+
+def print_stats(stats):
+    for drug, drug_stats in stats["drugs"].items():
+        print(f"\t{drug}: rejected {drug_stats['rejected']} / {drug_stats['total']} {drug_stats['rejected_languages']}")
+    print(f"Checked {stats['num_texts']} trip reports in {stats['elapsed_sec']:.1f}s "
+          f"({stats['texts_per_sec']:.1f} reports/sec, {stats['num_cached']} cached verdicts, {stats['num_detected']} detected)")
@@ -0,0 +1,88 @@
+import util
+
+import json
+import os
+import threading
+
+
+"""
+Constants
+"""
+FORMAT_VERSION = 1
+
+# memory-map the separately stored arrays read-only, so processes loading the same model share its pages
+DEFAULT_MMAP = "r"
+
+
+"""
+Saving
+"""
+def get_metadata_file(filepath):
+    return f"{filepath}.json"
+
+def get_array_files(filepath):
+    directory = os.path.dirname(filepath) or "."
+    prefix = os.path.basename(filepath)
+    return sorted(name for name in os.listdir(directory) if name.startswith(prefix + ".") and name.endswith(".npy"))
+
+# sep_limit=0 makes gensim store every numpy array (word vectors, doc vectors, output weights) as its own .npy file
+# next to a small pickle of the remaining model state, instead of pickling the whole model into one file
+def save_doc2vec_model(model, filepath, hyperparams=None):
+    import gensim
+
+    model.save(filepath, sep_limit=0)
+    metadata = {
+        "format_version": FORMAT_VERSION,
+        "gensim_version": gensim.__version__,
+        "dm": int(model.dm) if hasattr(model, "dm") else None,
+        "vector_size": int(model.vector_size),
+        "corpus_count": int(model.corpus_count),
+        "array_files": get_array_files(filepath),
+        "hyperparams": hyperparams or {}
+    }
+    with open(get_metadata_file(filepath), "w") as f:
+        json.dump(metadata, f, indent=4)
+    return filepath
+
+def read_model_metadata(filepath):
+    with open(get_metadata_file(filepath)) as f:
+        return json.load(f)
+
+
+"""
+Loading
+"""
+def load_doc2vec_model(filepath, mmap=DEFAULT_MMAP):
+    import gensim
+
+    return gensim.models.doc2vec.Doc2Vec.load(filepath, mmap=mmap)
+
+
+class LazyDoc2VecModel:
+    # reads only the metadata header up front; the model itself (and gensim) is loaded on first attribute access
+    def __init__(self, filepath, mmap=DEFAULT_MMAP):
+        self.filepath = filepath
+        self.mmap = mmap
+        self.metadata = read_model_metadata(filepath)
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = load_doc2vec_model(self.filepath, self.mmap)
+        return self._model
+
+    @property
+    def is_loaded(self):
+        return self._model is not None
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+def open_doc2vec_model(filepath, mmap=DEFAULT_MMAP):
+    return LazyDoc2VecModel(filepath, mmap)
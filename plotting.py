@@ -0,0 +1,15 @@
+import pandas as pd
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+
+"""
+Evaluation plots
+"""
+def plot_confusion_matrix(cm, labels):
+    df_cm = pd.DataFrame(cm, index=labels, columns=labels)
+    plt.figure(figsize=(20,20))
+    ax = sns.heatmap(df_cm, annot=False, linewidth=0.05)
+    bottom, top = ax.get_ylim()
+    ax.set_ylim(bottom + 0.5, top - 0.5)
+    return ax
@@ -0,0 +1,282 @@
+import util
+import model_store
+import preprocessing
+import vocab
+
+import collections
+import concurrent.futures
+import hashlib
+import http.server
+import json
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+"""
+Constants
+"""
+HOST = "127.0.0.1"
+PORT = 8000
+
+TOP_N = 3
+
+MAX_BATCH_SIZE = 32
+MAX_BATCH_WAIT_SEC = 0.005
+NUM_WORKERS = 4
+
+VECTOR_CACHE_SIZE = 10000
+
+# number of recent request latencies kept for the p50/p99 figures reported by /stats
+LATENCY_WINDOW = 10000
+
+
+"""
+Prediction
+"""
+def hash_text(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class VectorCache:
+    # thread-safe LRU cache of inferred doc vectors keyed by a hash of the preprocessed text
+    def __init__(self, max_size=VECTOR_CACHE_SIZE):
+        self.max_size = max_size
+        self.vectors = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            vector = self.vectors.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self.vectors.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, key, vector):
+        with self.lock:
+            self.vectors[key] = vector
+            self.vectors.move_to_end(key)
+            while len(self.vectors) > self.max_size:
+                self.vectors.popitem(last=False)
+
+
+class Predictor:
+    # loads the spaCy pipeline, custom stop words, Doc2Vec model and classifier once, then classifies batches of raw
+    # trip report text with the same preprocess -> tokenize -> infer_vector chain used to build the training features
+    def __init__(self, doc2vec_model_file=util.DOC2VEC_MODEL_DM_FILE, classifier_model_file=util.CLASSIFIER_MODEL_FILE,
+                 vector_cache_size=VECTOR_CACHE_SIZE):
+        self.spacy_pipeline = preprocessing.create_spacy_pipeline()
+        self.spacy_lock = threading.Lock()
+        self.custom_stop_words = vocab.load_custom_stop_words()
+        self.model = model_store.load_doc2vec_model(doc2vec_model_file)
+        self.clf = util.unpickle(classifier_model_file)
+        self.classes = np.asarray(self.clf.classes_)
+        self.vector_cache = VectorCache(vector_cache_size)
+
+    def infer_vectors(self, texts):
+        # exactly the preprocessing the training corpus went through (notebook 1), so whitespace is left to spaCy
+        preprocessed_texts = [preprocessing.preprocess(text) for text in texts]
+        keys = [hash_text(text) for text in preprocessed_texts]
+        vectors = [self.vector_cache.get(key) for key in keys]
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if len(missing) > 0:
+            # spaCy pipelines are not guaranteed to be thread-safe, so batches take turns tokenizing
+            with self.spacy_lock:
+                docs = list(self.spacy_pipeline.pipe([preprocessed_texts[i] for i in missing]))
+            for i, doc in zip(missing, docs):
+                tokens = preprocessing.tokenize(doc, self.spacy_pipeline, self.custom_stop_words)
+                vectors[i] = self.model.infer_vector(tokens)
+                self.vector_cache.put(keys[i], vectors[i])
+        return np.vstack(vectors)
+
+    def predict(self, texts, top_n=TOP_N):
+        X = self.infer_vectors(texts)
+        probs = self.clf.predict_proba(X)
+        top_n = min(top_n, probs.shape[1])
+        top_indices = np.argsort(-probs, axis=1)[:, :top_n]
+        return [
+            [{"drug": str(self.classes[j]), "probability": float(probs[i, j])} for j in top_indices[i]]
+            for i in range(len(texts))
+        ]
+
+
+"""
+Micro-batching
+"""
+class MicroBatcher:
+    # requests wait at most max_wait_sec to be grouped with others into one predict() call; several workers drain the
+    # queue concurrently so a slow batch does not hold up the next one
+    def __init__(self, predictor, max_batch_size=MAX_BATCH_SIZE, max_wait_sec=MAX_BATCH_WAIT_SEC, num_workers=NUM_WORKERS):
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_wait_sec = max_wait_sec
+        self.queue = queue.Queue()
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.num_requests = 0
+        self.stats_lock = threading.Lock()
+        self.started_at = time.time()
+        self.workers = [threading.Thread(target=self._worker_loop, daemon=True) for _ in range(num_workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, text, top_n=TOP_N):
+        future = concurrent.futures.Future()
+        self.queue.put((text, top_n, future, time.perf_counter()))
+        return future
+
+    def predict(self, texts, top_n=TOP_N):
+        futures = [self.submit(text, top_n) for text in texts]
+        return [future.result() for future in futures]
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait_sec
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0: break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker_loop(self):
+        while True:
+            batch = self._next_batch()
+            texts = [text for text, _, _, _ in batch]
+            max_top_n = max(top_n for _, top_n, _, _ in batch)
+            try:
+                predictions = self.predictor.predict(texts, max_top_n)
+            except Exception as e:
+                for _, _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            now = time.perf_counter()
+            with self.stats_lock:
+                for _, _, _, submitted_at in batch:
+                    self.latencies.append(now - submitted_at)
+                self.num_requests += len(batch)
+            for (_, top_n, future, _), prediction in zip(batch, predictions):
+                future.set_result(prediction[:top_n])
+
+    def get_stats(self):
+        with self.stats_lock:
+            latencies = np.array(self.latencies)
+            num_requests = self.num_requests
+        elapsed = time.time() - self.started_at
+        stats = {
+            "num_requests": num_requests,
+            "requests_per_sec": num_requests / elapsed if elapsed > 0 else 0.0,
+            "vector_cache_hits": self.predictor.vector_cache.hits,
+            "vector_cache_misses": self.predictor.vector_cache.misses
+        }
+        if len(latencies) > 0:
+            stats["latency_p50_ms"] = float(np.percentile(latencies, 50) * 1000)
+            stats["latency_p99_ms"] = float(np.percentile(latencies, 99) * 1000)
+        return stats
+
+
+"""
+HTTP endpoint
+"""
+REQUEST_FORMAT_ERROR = 'expected JSON body {"text": str} or {"texts": [str, ...]}, with an optional integer "top_n" >= 1'
+
+# the texts and top_n of a /predict request body, or a ValueError describing what is wrong with it
+def parse_predict_request(body):
+    try:
+        request = json.loads(body)
+    except json.JSONDecodeError:
+        raise ValueError(REQUEST_FORMAT_ERROR)
+    if not isinstance(request, dict):
+        raise ValueError(REQUEST_FORMAT_ERROR)
+    if "texts" in request:
+        texts = request["texts"]
+        if not isinstance(texts, list):
+            raise ValueError(REQUEST_FORMAT_ERROR)
+    elif "text" in request:
+        texts = [request["text"]]
+    else:
+        raise ValueError(REQUEST_FORMAT_ERROR)
+    if not all(isinstance(text, str) for text in texts):
+        raise ValueError(REQUEST_FORMAT_ERROR)
+    top_n = request.get("top_n", TOP_N)
+    # bool is a subclass of int, but true/false are not a number of predictions
+    if not isinstance(top_n, int) or isinstance(top_n, bool) or top_n < 1:
+        raise ValueError(f'"top_n" must be an integer >= 1, got {json.dumps(top_n)}')
+    return texts, top_n
+
+# POST /predict with {"text": "..."} or {"texts": [...], "top_n": 3}; GET /health and GET /stats
+class PredictionRequestHandler(http.server.BaseHTTPRequestHandler):
+    batcher = None
+
+    def _send_json(self, status, obj):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/stats":
+            self._send_json(200, self.batcher.get_stats())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            texts, top_n = parse_predict_request(self.rfile.read(length))
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        try:
+            predictions = self.batcher.predict(texts, top_n)
+        except Exception as e:
+            self._send_json(500, {"error": f"prediction failed: {e.__class__.__name__}: {e}"})
+            return
+        self._send_json(200, {"predictions": predictions})
+
+    def log_message(self, format, *args):
+        if util.DEBUG:
+            super().log_message(format, *args)
+
+class PredictionServer(http.server.ThreadingHTTPServer):
+    # the default listen backlog of 5 resets connections under concurrent load
+    request_queue_size = 128
+    daemon_threads = True
+
+def create_server(batcher, host=HOST, port=PORT):
+    handler = type("BoundPredictionRequestHandler", (PredictionRequestHandler,), {"batcher": batcher})
+    return PredictionServer((host, port), handler)
+
+
+def main():
+    print("Loading models...")
+    predictor = Predictor()
+    batcher = MicroBatcher(predictor)
+    server = create_server(batcher)
+    print(f"Serving predictions on http://{HOST}:{PORT}/predict")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import instrument
+
+import collections
+import concurrent.futures
+import itertools
+import multiprocessing
+
+
+"""
+Constants
+"""
+SPACY_MODEL = "en"
+
+# the dependency parser is not used by tokenization (entities come from the NER component)
+DISABLED_COMPONENTS = ["parser", "textcat"]
+
+BATCH_SIZE = 256
+
+# batches submitted to the worker pool per worker ahead of the consumer
+MAX_IN_FLIGHT_PER_WORKER = 2
+
+
+"""
+Text preprocessing
+"""
+def preprocess(text):
+    # remove zero-width space
+    text = text.replace("\u200b", " ")
+
+    return text
+
+
+"""
+spaCy pipeline
+"""
+# treat multi-word entities as individual tokens instead of multiple tokens
+class EntityRetokenizeComponent:
+    def __init__(self, pipeline):
+        pass
+
+    def __call__(self, doc):
+        with doc.retokenize() as retokenizer:
+            for ent in doc.ents:
+                retokenizer.merge(doc[ent.start:ent.end], attrs={"LEMMA": str(doc[ent.start:ent.end])})
+        return doc
+
+def create_spacy_pipeline(model=SPACY_MODEL, disable=DISABLED_COMPONENTS):
+    import spacy
+    spacy_pipeline = spacy.load(model, disable=list(disable))
+    retokenizer = EntityRetokenizeComponent(spacy_pipeline)
+    spacy_pipeline.add_pipe(retokenizer, name="merge_entities", last=True)
+    return spacy_pipeline
+
+
+"""
+Tokenization
+"""
+def tokenize(doc, spacy_pipeline, custom_stop_words):
+    tokens = []
+    for w in doc:
+        if all([
+            (w.is_alpha),
+            (w.lang_ == 'en'),
+            (w.is_ascii),
+            (not spacy_pipeline.vocab[w.text.lower()].is_stop),
+            (w.text.lower() not in custom_stop_words),
+            (w.lemma_ not in custom_stop_words),
+            (not w.is_space),
+            (not w.is_punct),
+            (not w.is_digit),
+            (w.ent_type == 0),
+            (w.lemma_ != "")
+        ]):
+            tokens.append(str(w.lemma_))
+    return tokens
+
+def _tokenize_stream(spacy_pipeline, texts, custom_stop_words, batch_size):
+    # each Doc is reduced to its token list as soon as it leaves the pipeline, so no Docs are retained
+    for doc in spacy_pipeline.pipe(texts, batch_size=batch_size):
+        yield tokenize(doc, spacy_pipeline, custom_stop_words)
+
+
+_worker_state = {}
+
+def _init_worker(model, disable, custom_stop_words, batch_size):
+    # forked workers inherit the pipeline the parent already loaded; other start methods load their own here
+    if _worker_state.get("pipeline_key") != (model, tuple(disable)):
+        _worker_state["spacy_pipeline"] = create_spacy_pipeline(model, disable)
+        _worker_state["pipeline_key"] = (model, tuple(disable))
+    _worker_state["custom_stop_words"] = custom_stop_words
+    _worker_state["batch_size"] = batch_size
+
+def _tokenize_batch(texts):
+    return list(_tokenize_stream(_worker_state["spacy_pipeline"], texts, _worker_state["custom_stop_words"], _worker_state["batch_size"]))
+
+def _batched(iterable, batch_size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+# yields one token list per text, in input order; with n_process > 1 the batches are tokenized in worker processes
+# that send back only token lists, never spaCy Docs. The pipeline is loaded in this process first, so a missing spaCy
+# package or model raises here before any worker starts, and a worker that dies raises BrokenProcessPool
+def tokenize_trip_reports(texts, custom_stop_words, n_process=1, batch_size=BATCH_SIZE, model=SPACY_MODEL, disable=DISABLED_COMPONENTS):
+    custom_stop_words = frozenset(custom_stop_words)
+    spacy_pipeline = create_spacy_pipeline(model, disable)
+    # the stage spans the whole consumption of the generator, counting documents as they are yielded
+    with instrument.stage("tokenization", num_items=0, profile=False, n_process=n_process) as stage:
+        if n_process == 1:
+            for tokens in _tokenize_stream(spacy_pipeline, texts, custom_stop_words, batch_size):
+                stage.add_items(1)
+                yield tokens
+            return
+
+        n_process = n_process if n_process > 0 else multiprocessing.cpu_count()
+        _worker_state["spacy_pipeline"] = spacy_pipeline
+        _worker_state["pipeline_key"] = (model, tuple(disable))
+        initargs = (model, disable, custom_stop_words, batch_size)
+        batches = _batched(texts, batch_size)
+        in_flight = collections.deque()
+        try:
+            with concurrent.futures.ProcessPoolExecutor(n_process, initializer=_init_worker, initargs=initargs) as executor:
+                try:
+                    for batch in itertools.islice(batches, MAX_IN_FLIGHT_PER_WORKER * n_process):
+                        in_flight.append(executor.submit(_tokenize_batch, batch))
+                    while in_flight:
+                        token_lists = in_flight.popleft().result()
+                        for batch in itertools.islice(batches, 1):
+                            in_flight.append(executor.submit(_tokenize_batch, batch))
+                        stage.add_items(len(token_lists))
+                        yield from token_lists
+                finally:
+                    for future in in_flight:
+                        future.cancel()
+        finally:
+            _worker_state.clear()
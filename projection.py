@@ -0,0 +1,159 @@
+import util
+
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+
+import numpy as np
+
+
+"""
+Constants
+"""
+TSNE_PARAMS = {
+    "metric": "cosine",
+    "method": "barnes_hut",
+    "init": "pca",
+    "perplexity": 30.0,
+    "random_state": 0
+}
+
+FIGSIZE = (32, 32)
+DPI = 72
+POINT_SIZE = 120
+BACKGROUND_COLOR = (0.8, 0.8, 0.8)
+
+
+"""
+Projection
+"""
+# hash of the vectors themselves plus the projection parameters, so that a retrained model (or different parameters)
+# never reuses a stale embedding
+def get_projection_key(X, params):
+    h = hashlib.sha1()
+    h.update(json.dumps([list(X.shape), str(X.dtype), sorted(params.items())], default=str).encode("utf-8"))
+    h.update(np.ascontiguousarray(X).tobytes())
+    return h.hexdigest()[:16]
+
+def get_subsample_indices(n, max_samples, random_state=0):
+    if max_samples is None or max_samples >= n:
+        return np.arange(n)
+    return np.sort(np.random.RandomState(random_state).choice(n, max_samples, replace=False))
+
+# 2-D t-SNE embedding of X (or of a random subsample of max_samples rows), cached on disk; PCA-initialised Barnes-Hut
+# scales to far larger corpora than the exact method. Returns (X_projected, indices) with indices the rows of X that
+# were projected
+def project(X, max_samples=None, cache_dir=util.PROJECTION_CACHE_DIR, verbose=True, **tsne_params):
+    from sklearn.manifold import TSNE
+
+    params = dict(TSNE_PARAMS, **tsne_params)
+    X = np.asarray(X)
+    key = get_projection_key(X, dict(params, max_samples=max_samples))
+    filepath = os.path.join(cache_dir, f"tsne_{key}.npz")
+    if os.path.exists(filepath):
+        if verbose: print(f"Loading cached projection {filepath}")
+        cached = np.load(filepath)
+        return cached["X_projected"], cached["indices"]
+
+    indices = get_subsample_indices(len(X), max_samples, params["random_state"])
+    X_projected = TSNE(n_components=2, **params).fit_transform(X[indices]).astype(np.float32)
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez(filepath, X_projected=X_projected, indices=indices)
+    return X_projected, indices
+
+
+"""
+Plotting
+"""
+def get_palette(num_colors):
+    import seaborn as sns
+    return np.array(sns.color_palette("hls", num_colors) + [BACKGROUND_COLOR])
+
+def add_label(ax, X, text):
+    import matplotlib.patheffects as PathEffects
+
+    xtext, ytext = np.median(X, axis=0)
+    txt = ax.text(xtext, ytext, text, fontsize=20)
+    txt.set_path_effects([PathEffects.Stroke(linewidth=5, foreground="w"), PathEffects.Normal()])
+    return txt
+
+def create_axes(figsize=FIGSIZE):
+    import matplotlib.pyplot as plt
+
+    f = plt.figure(figsize=figsize)
+    ax = plt.subplot(aspect="equal")
+    ax.axis("off")
+    return f, ax
+
+# a figure on its own Agg canvas, outside pyplot: rendering never switches the global backend or touches the figures of
+# the calling process (e.g. a notebook's inline ones), whether it runs in a pool worker or in the caller itself
+def create_offscreen_axes(figsize=FIGSIZE):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    f = Figure(figsize=figsize)
+    FigureCanvasAgg(f)
+    ax = f.add_subplot(aspect="equal")
+    ax.axis("off")
+    return f, ax
+
+# one scatter plot with every drug in drugs_to_plot in its own color and the remaining reports in gray
+def scatter(X, y, drugs_to_plot, figsize=FIGSIZE):
+    y = np.asarray(y)
+    palette = get_palette(len(drugs_to_plot))
+    drug_to_rank_dict = {drug: i for i, drug in enumerate(drugs_to_plot)}
+    color_indices = np.array([drug_to_rank_dict.get(drug, -1) for drug in y])
+
+    f, ax = create_axes(figsize)
+    sc = ax.scatter(X[:,0], X[:,1], lw=0, s=POINT_SIZE, c=palette[color_indices])
+    ax.axis("tight")
+    txts = [add_label(ax, X[color_indices == i], drug) for i, drug in enumerate(drugs_to_plot)]
+    return f, ax, sc, txts
+
+
+"""
+Batch rendering
+"""
+_worker_state = {}
+
+def _init_worker(X, y, figsize, dpi):
+    # the gray background of every report is drawn once per worker; each drug's plot only adds and then removes its
+    # own highlighted points and label on top of it
+    f, ax = create_offscreen_axes(figsize)
+    ax.scatter(X[:,0], X[:,1], lw=0, s=POINT_SIZE, c=[BACKGROUND_COLOR])
+    ax.axis("tight")
+    _worker_state.update(X=X, y=np.asarray(y), figure=f, ax=ax, dpi=dpi, color=get_palette(1)[0])
+
+def _render_drug(args):
+    drug, filepath = args
+    X, ax = _worker_state["X"], _worker_state["ax"]
+    X_drug = X[_worker_state["y"] == drug]
+    sc = ax.scatter(X_drug[:,0], X_drug[:,1], lw=0, s=POINT_SIZE, c=[_worker_state["color"]])
+    txt = add_label(ax, X_drug, drug)
+    _worker_state["figure"].savefig(filepath, dpi=_worker_state["dpi"])
+    sc.remove()
+    txt.remove()
+    return filepath
+
+# drop the figure _init_worker drew when the plots were rendered in this process
+def _clear_worker_state():
+    _worker_state.clear()
+
+def get_plot_filename(drug):
+    return re.sub(r"[^\w\-]+", "_", drug) + ".png"
+
+# write one highlighted scatter plot per drug to output_dir, rendered in parallel from a single projection
+def render_drug_scatters(X, y, drugs, output_dir=util.DRUG_SCATTERS_DIR, num_processes=None, figsize=FIGSIZE, dpi=DPI):
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(drug, os.path.join(output_dir, get_plot_filename(drug))) for drug in drugs]
+    num_processes = min(num_processes or multiprocessing.cpu_count(), len(tasks))
+    if num_processes <= 1:
+        _init_worker(X, y, figsize, dpi)
+        try:
+            return [_render_drug(task) for task in tasks]
+        finally:
+            _clear_worker_state()
+    with multiprocessing.Pool(num_processes, initializer=_init_worker, initargs=(X, y, figsize, dpi)) as pool:
+        return pool.map(_render_drug, tasks)
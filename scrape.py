@@ -1,7 +1,12 @@
 import util
+import fetch
+import crawl
+import extract
+import langfilter
+import vocab
+import instrument
+import dosechart
 
-import requests
-from bs4 import BeautifulSoup
 import re
 import collections
 import itertools
@@ -9,15 +14,12 @@ import ast
 import pickle
 import os
 import csv
-import langdetect
-import pandas as pd
+import urllib.parse
 
 
 """
 Constants
 """
-PHASE = 1
-
 DOSAGE_LEVELS = [
     "threshold",
     "light",
@@ -48,14 +50,8 @@ DURATION_UNITS = [
 """
 Get webpage HTML
 """
-def get_webpage(url):
-    headers = {
-        'User-Agent': 'Ian Scott Knight',
-        'From': 'ianscottknight@protonmail.com'
-    }
-    page = requests.get(url, headers=headers)
+def check_page(page):
     if util.DEBUG:
-        print(f"URL: {url}\n\tStatus code: {page.status_code}")
         if page.status_code == 200:
             return page
         else: 
@@ -64,7 +60,17 @@ def get_webpage(url):
         assert page.status_code == 200 # successfully retrieved 
         return page
 
+def get_webpage(url):
+    page = fetch.get_default_fetcher().get(url)
+    return check_page(page)
+
+# fetch many webpages concurrently through the shared fetcher, yielding (url, page) pairs in order
+def get_webpages(urls):
+    for url, page in fetch.get_default_fetcher().map(urls):
+        yield url, check_page(page)
+
 def get_soup(url):
+    from bs4 import BeautifulSoup
     page = get_webpage(url)
     soup = BeautifulSoup(page.content, "html.parser")
     return soup
@@ -164,46 +170,39 @@ def get_duration_dict(dosechart):
 Get dosechart info from Psychonaut Wiki 
 """
 
-def get_drug_to_dosechart_info_dict(psychonaut_wiki_ids):
+# every labelled dosage and duration row of every drug's dosecharts, parsed in one pass per chart
+def get_drug_to_dosechart_rows_dict(psychonaut_wiki_ids):
     print("Getting drug dosechart info from Psychonaut Wiki...")
-    drug_to_dosechart_info_dict = {}
+    drug_to_rows_dict = {}
     for drug in psychonaut_wiki_ids:
         print(f"\tDrug: {drug}")
         soup = get_psychonaut_wiki_general_drug_soup(drug)
-        dosecharts = soup.find_all(class_="dosechart")
-        dosechart_info_dict = {}
-        for dosechart in dosecharts:
-            roa = dosechart["data-roa"].lower()
-            dosage_dict = get_dosage_dict(dosechart)
-            duration_dict = get_duration_dict(dosechart)
-            if len(dosage_dict) != 0 and len(duration_dict) != 0:
-                dosechart_info_dict[roa] = {
-                    "dosage": dosage_dict,
-                    "duration": duration_dict
-                }
-        drug_to_dosechart_info_dict[drug] = dosechart_info_dict
-        
+        drug_to_rows_dict[drug] = dosechart.parse_dosecharts(soup)
+        if util.DEBUG:
+            print(f"\tDosechart rows: {drug_to_rows_dict[drug]}")
+
     # LSA dosage is provided in seeds on psychonaut wiki, so we resort to chemist Albert Hofmann's conclusion 
     # that pure LSA is "about a tenfold to twentyfold greater dose than LSD" and multiply the dosage levels 
     # of LSD by 15.
-    drug_to_dosechart_info_dict["LSA"] = {}
-    drug_to_dosechart_info_dict["LSA"]["oral"] = {}
-
     soup = get_psychonaut_wiki_general_drug_soup("LSA")
-    dosechart, = soup.find_all(class_="dosechart")
-    drug_to_dosechart_info_dict["LSA"]["oral"]["duration"] = get_duration_dict(dosechart)
+    lsa_dosechart, = soup.find_all(class_="dosechart")
+    lsa_duration_rows = [dict(row, roa="oral") for row in dosechart.parse_dosechart(lsa_dosechart) if row["kind"] == "duration"]
+    lsa_dosage_rows = [
+        dict(row, roa="oral", low=15.0 * row["low"], high=15.0 * row["high"] if row["high"] is not None else None)
+        for row in drug_to_rows_dict["LSD"] if row["roa"] == "sublingual" and row["kind"] == "dosage"
+    ]
+    drug_to_rows_dict["LSA"] = lsa_dosage_rows + lsa_duration_rows
 
-    drug_to_dosechart_info_dict["LSA"]["oral"]["dosage"] = drug_to_dosechart_info_dict["LSD"]["sublingual"]["dosage"].copy()
-    for level in drug_to_dosechart_info_dict["LSA"]["oral"]["dosage"]:
-        dose, unit = drug_to_dosechart_info_dict["LSA"]["oral"]["dosage"][level]
-        drug_to_dosechart_info_dict["LSA"]["oral"]["dosage"][level] = (15.0 * dose, unit)
-        
-    return drug_to_dosechart_info_dict
+    return drug_to_rows_dict
+
+def get_drug_to_dosechart_info_dict(drug_to_rows_dict):
+    return {drug: dosechart.to_dosechart_info_dict(rows) for drug, rows in drug_to_rows_dict.items()}
 
 """
 Get drug effects from Psychonaut Wiki 
 """
 def get_drug_to_effects_dict(psychonaut_wiki_ids):
+    from bs4 import BeautifulSoup
     drug_to_effects_dict = {}
 
     effects_list_url = "https://psychonautwiki.org/wiki/List/effects"
@@ -265,9 +264,7 @@ def get_drug_to_effects_dict(psychonaut_wiki_ids):
 """
 Get trip reports from Erowid
 """
-def get_erowid_trip_reports(drug):
-    trip_reports = []
-    
+def get_erowid_trip_report_urls(drug):
     # get general webpage
     url_general = "https://www.erowid.org/experiences/subs/exp_{}_General.shtml".format(drug)
     soup_general = get_soup(url_general)
@@ -278,29 +275,58 @@ def get_erowid_trip_reports(drug):
     url_all_trip_reports = f"https://www.erowid.org/experiences/exp.cgi?S={drug_id}&C=1&ShowViews=0&Cellar=0&Start=0&Max={MAXIMUM}"
     soup_all_trip_reports = get_soup(url_all_trip_reports)
     
+    # map each Erowid report ID (exp.php?ID=...) to its URL
+    report_id_to_url_dict = {}
     for a in soup_all_trip_reports.find("tr", height="8").parent.find_all("a"):
-        url_trip_report = f"https://www.erowid.org/{a['href']}"
-        soup_trip_report = get_soup(url_trip_report)
-        
-        start = "<!-- Start Body -->"
-        end = "<!-- End Body -->"
-        
-        # extract just the trip report from HTML
-        s = str(soup_trip_report)
-        s = s[s.find(start)+len(start):s.rfind(end)]
-        trip_report = BeautifulSoup(s, "html.parser").text
-        
-        # remove escape sequences from text
-        escapes = "".join([chr(char) for char in range(1, 32)])
-        for escape in escapes:
-            trip_report = trip_report.replace(escape, " ")
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(a["href"]).query)
+        if "ID" not in query: continue
+        report_id_to_url_dict[int(query["ID"][0])] = f"https://www.erowid.org/{a['href']}"
+    
+    return report_id_to_url_dict
+
+def extract_erowid_trip_report(content):
+    # single pass over the raw response bytes (see extract.py; benchmarks/extract_benchmark.py compares backends)
+    return extract.extract_trip_report(content)
+
+def is_spam_trip_report(trip_report):
+    return "concatemoji" in trip_report or "createElement" in trip_report # some outliers containing spam javascript
+
+@instrument.traced(count=instrument.count_result)
+def get_erowid_trip_reports(drug):
+    trip_reports = []
+    
+    urls_trip_reports = list(get_erowid_trip_report_urls(drug).values())
+    for url_trip_report, page_trip_report in get_webpages(urls_trip_reports):
+        if page_trip_report is None: continue
+        trip_report = extract_erowid_trip_report(page_trip_report.content)
         
-        if "concatemoji" in trip_report or "createElement" in trip_report: continue  # some outliers containing spam javascript
+        if is_spam_trip_report(trip_report): continue
         
         trip_reports.append(trip_report)
         
     return trip_reports
 
+# fetch only the reports in drug's current listing that are not yet in the crawl store, appending each to the
+# store as it arrives so that an interrupted crawl resumes from its last checkpoint
+@instrument.traced(count=lambda args, kwargs, num_new_reports: num_new_reports)
+def crawl_erowid_trip_reports(drug, store):
+    report_id_to_url_dict = get_erowid_trip_report_urls(drug)
+    stored_report_ids = store.get_report_ids()
+    new_report_ids = [report_id for report_id in report_id_to_url_dict if report_id not in stored_report_ids]
+    print(f"\t{len(report_id_to_url_dict)} trip reports listed, {len(new_report_ids)} not yet in crawl store")
+    
+    url_to_report_id_dict = {report_id_to_url_dict[report_id]: report_id for report_id in new_report_ids}
+    try:
+        for url_trip_report, page_trip_report in get_webpages(list(url_to_report_id_dict)):
+            if page_trip_report is None: continue
+            trip_report = extract_erowid_trip_report(page_trip_report.content)
+            store.append_report(url_to_report_id_dict[url_trip_report], url_trip_report, page_trip_report.content, trip_report)
+    finally:
+        store.checkpoint()
+    
+    store.link_reports(drug, report_id_to_url_dict.keys())
+    return len(new_report_ids)
+
 
 def get_drug_words_from_psychonaut_wiki(psychonaut_wiki_ids):
 
@@ -353,115 +379,71 @@ def get_drug_words_from_psychonaut_wiki(psychonaut_wiki_ids):
     return drug_words
 
 def augment_custom_stop_words(custom_stop_words): 
-
-    # add versions of stop words with prefixes and suffixes
-    additions = []
-    for prefix in ["pre-", "mid-", "post-"]:
-        additions += [prefix + w for w in custom_stop_words]
-    for suffix in ["-like", "-type", "-esque"]:
-        additions += [w + suffix for w in custom_stop_words]
-    custom_stop_words += additions
-
-    # add an -s suffix to all custom stop words to catch plurals
-    custom_stop_words += [w + 's' for w in custom_stop_words]
-
-    # reduce to unique elements
-    custom_stop_words = set(custom_stop_words)
-
-    return custom_stop_words
+    return vocab.augment_custom_stop_words(custom_stop_words)
 
 
 def main():
-    # Erowid only permits up to 5000 requests per day, otherwise they ban your IP
-    # So, we must split up scraping into two phases
-    # Instructions: 
-    # 1. Set the variable PHASE to 1 for the first day / IP and then run scrape.py
-    # 2. Wait 24 hours or switch to another IP
-    # 3. Set PHASE to 2 and then run scrape.py
-
-    assert PHASE == 1 or PHASE == 2
+    # Erowid only permits up to 5000 requests per day, otherwise they ban your IP.
+    # The fetch engine enforces that budget per host (see fetch.HOST_LIMITS) and pauses on its own until
+    # the budget window rolls over, so the whole scrape can run unattended in a single invocation.
 
     PSYCHEDELICS = util.read_psychedelics_file()
 
-    if PHASE == 1:
+    # Scrape drug dosechart info from Psychonaut Wiki
+    drug_to_dosechart_rows_dict = get_drug_to_dosechart_rows_dict(PSYCHEDELICS["psychonaut_wiki_id"])
+    drug_to_dosechart_info_dict = get_drug_to_dosechart_info_dict(drug_to_dosechart_rows_dict)
 
-        # Scrape drug dosechart info from Psychonaut Wiki
-        drug_to_dosechart_info_dict = get_drug_to_dosechart_info_dict(PSYCHEDELICS["psychonaut_wiki_id"])
+    # Save drug dosechart info, both as the nested dictionary and as a typed table in mg and minutes
+    with open(util.DRUG_TO_DOSECHART_INFO_DICT_FILE, "wb") as f:
+        pickle.dump(drug_to_dosechart_info_dict, f)
+    dosechart.save_table(dosechart.build_table(drug_to_dosechart_rows_dict))
 
-        # Save drug dosechart info
-        with open(util.DRUG_TO_DOSECHART_INFO_DICT_FILE, "wb") as f:
-            pickle.dump(drug_to_dosechart_info_dict, f)
+    # Scrape drug effects from Psychonaut Wiki
+    drug_to_effects_dict = get_drug_to_effects_dict(PSYCHEDELICS["psychonaut_wiki_id"])
 
-        # Scrape drug effects from Psychonaut Wiki
-        drug_to_effects_dict = get_drug_to_effects_dict(PSYCHEDELICS["psychonaut_wiki_id"])
+    # Save drug effects
+    with open(util.DRUG_TO_EFFECTS_DICT_FILE, "wb") as f:
+        pickle.dump(drug_to_effects_dict, f)
 
-        # Save drug effects
-        with open(util.DRUG_TO_EFFECTS_DICT_FILE, "wb") as f:
-            pickle.dump(drug_to_effects_dict, f)
+    erowid_drugs_to_scrape = PSYCHEDELICS["erowid_id"]
 
-        erowid_drugs_to_scrape = PSYCHEDELICS["erowid_id"][:24]
-
-    else:
-        erowid_drugs_to_scrape = PSYCHEDELICS["erowid_id"][24:]
-    
-
-    # Scrape trip reports from Erowid
-    drug_to_trip_reports_dict = {}
+    # Scrape trip reports from Erowid into the crawl store, fetching only reports not already stored
+    store = crawl.CrawlStore()
     for drug in erowid_drugs_to_scrape:    
         print(f"Collecting trip reports for {drug}...")
-        drug_to_trip_reports_dict[drug] = get_erowid_trip_reports(drug)
-        print(f"\tCollected {len(drug_to_trip_reports_dict[drug])} trip reports\n")
+        num_new = crawl_erowid_trip_reports(drug, store)
+        print(f"\tCollected {num_new} new trip reports\n")
+    drug_to_trip_reports_dict = store.get_drug_to_trip_reports_dict(erowid_drugs_to_scrape)
+    store.close()
+    drug_to_trip_reports_dict = {drug: [t for t in trip_reports if not is_spam_trip_report(t)] for drug, trip_reports in drug_to_trip_reports_dict.items()}
     drug_to_trip_reports_count_dict = {key : len(values) for key, values in drug_to_trip_reports_dict.items()}
     drug_to_trip_reports_count_dict = dict(sorted(drug_to_trip_reports_count_dict.items(), key=lambda x: x[1]))
     print(f"Total number of trip reports collected: {sum(drug_to_trip_reports_count_dict.values())}")
 
     # Remove non-English trip reports
     print("Removing non-English trip reports...")
-    non_english_count = 0
-    for drug, trip_reports in drug_to_trip_reports_dict.items():
-        print(f"\t\tChecking {drug}...")
-        trip_reports_english = trip_reports.copy()
-        for trip_report in trip_reports:
-            lang = langdetect.detect(trip_report)
-            if lang != "en":
-                print(f"\tDetected language: {lang}")
-                trip_reports_english.remove(trip_report)
-                non_english_count += 1
-        drug_to_trip_reports_dict[drug] = trip_reports_english 
+    drug_to_trip_reports_dict, language_stats = langfilter.filter_language(drug_to_trip_reports_dict)
+    langfilter.print_stats(language_stats)
+    non_english_count = sum(drug_stats["rejected"] for drug_stats in language_stats["drugs"].values())
     print(f"Removed {non_english_count} trip reports not written in English")
 
     # Save trip reports
     print("Saving trip reports...")
     csv_columns = ["drug", "trip_report"]
-    csv_file_phase_1 = util.TRIP_REPORTS_FILE.replace(".csv", "_phase_1.csv")
-    csv_file_phase_2 = util.TRIP_REPORTS_FILE.replace(".csv", "_phase_2.csv")
-    if PHASE == 1:
-        with open(csv_file_phase_1, 'w') as f:
-            writer = csv.DictWriter(f, fieldnames=csv_columns)
-            writer.writeheader()
-            for drug, trip_reports in drug_to_trip_reports_dict.items():
-                for trip_report in trip_reports:
-                    writer.writerow({
-                        csv_columns[0]: drug, 
-                        csv_columns[1]: trip_report
-                    })
-    else:
-        with open(csv_file_phase_2, 'w') as f:
-            writer = csv.DictWriter(f, fieldnames=csv_columns)
-            writer.writeheader()
-            for drug, trip_reports in drug_to_trip_reports_dict.items():
-                for trip_report in trip_reports:
-                    writer.writerow({
-                        csv_columns[0]: drug, 
-                        csv_columns[1]: trip_report
-                    })
-
-        # merge CSV files from both phases
-        trip_reports_phase_1 = pd.read_csv(csv_file_phase_1)
-        trip_reports_phase_2 = pd.read_csv(csv_file_phase_2)
-        trip_reports_merged = pd.concat([trip_reports_phase_1, trip_reports_phase_2]) 
-        trip_reports_merged.to_csv(util.TRIP_REPORTS_FILE, index=False)
+    with open(util.TRIP_REPORTS_FILE, 'w') as f:
+        writer = csv.DictWriter(f, fieldnames=csv_columns)
+        writer.writeheader()
+        for drug, trip_reports in drug_to_trip_reports_dict.items():
+            for trip_report in trip_reports:
+                writer.writerow({
+                    csv_columns[0]: drug, 
+                    csv_columns[1]: trip_report
+                })
+
+    # Per-stage timings, when run with PIPELINE_TRACE_FILE set
+    if instrument.is_enabled():
+        instrument.print_summary()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
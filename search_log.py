@@ -0,0 +1,53 @@
+import json
+import os
+
+import numpy as np
+
+
+"""
+JSON
+"""
+# json.dumps default= for the numpy scalars that end up in search records and parameter grids
+def to_builtin(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+
+"""
+Trial log
+"""
+class TrialLog:
+    # append-only JSON lines file with one record per scored fit or training session, flushed to disk record by record
+    # so that an interrupted search resumes from it; a doc2vec trial is finished once its "done" record has been written
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.records = []
+        if os.path.exists(filepath):
+            with open(filepath, "rb+") as f:
+                data = f.read()
+                complete_length = data.rfind(b"\n") + 1
+                if complete_length < len(data):
+                    # partially written last line from an interrupted run: cut it off, so that the next record is
+                    # appended on a line of its own instead of being glued onto the fragment
+                    f.truncate(complete_length)
+            for line in data[:complete_length].decode("utf-8").splitlines():
+                line = line.strip()
+                if not line: continue
+                try:
+                    self.records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    pass # a record glued onto a fragment by an older version
+
+    def append(self, record):
+        with open(self.filepath, "a") as f:
+            f.write(json.dumps(record, default=to_builtin) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.records.append(record)
+
+    def get_finished_trial_ids(self):
+        return set(record["trial_id"] for record in self.records if record.get("done"))
+
+    def get_session_records(self):
+        return [record for record in self.records if not record.get("done")]
@@ -0,0 +1,198 @@
+import util
+
+import json
+import os
+import tempfile
+
+import numpy as np
+
+
+"""
+Constants
+"""
+BLOCK_SIZE = 8192
+
+N_PROBE = 8
+
+METADATA_FILENAME = "metadata.json"
+VECTORS_FILENAME = "vectors.npy"
+
+
+"""
+Helpers
+"""
+def normalise_rows(X, dtype=np.float32):
+    X = np.asarray(X, dtype=dtype)
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return X / norms
+
+# a normalised float32 copy of X written block by block to an on-disk memmap (an anonymous temporary file unless
+# filepath is given, in which case it is a .npy file), so that only one block is ever normalised in memory
+def normalise_rows_to_memmap(X, filepath=None, block_size=BLOCK_SIZE, dtype=np.float32):
+    shape = (len(X), X.shape[1])
+    if shape[0] == 0:
+        return np.zeros(shape, dtype=dtype)
+    if filepath is None:
+        X_normalised = np.memmap(tempfile.TemporaryFile(), dtype=dtype, mode="w+", shape=shape)
+    else:
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        X_normalised = np.lib.format.open_memmap(filepath, mode="w+", dtype=dtype, shape=shape)
+    for start in range(0, len(X), block_size):
+        X_normalised[start:start+block_size] = normalise_rows(X[start:start+block_size], dtype)
+    X_normalised.flush()
+    return X_normalised
+
+def top_k(scores, ids, k):
+    # row-wise top-k of a (num_queries, num_candidates) score matrix, sorted by descending score
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.zeros((scores.shape[0], 0), dtype=ids.dtype), np.zeros((scores.shape[0], 0), dtype=scores.dtype)
+    partition = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, partition, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    partition = np.take_along_axis(partition, order, axis=1)
+    top_ids = ids[partition] if ids.ndim == 1 else np.take_along_axis(ids, partition, axis=1)
+    return top_ids, np.take_along_axis(top_scores, order, axis=1)
+
+
+"""
+Exact index
+"""
+class ExactIndex:
+    # cosine similarity top-k over pre-normalised float32 vectors, scanned in blocks so that the score matrix for a
+    # batch of queries never exceeds num_queries x block_size (the vectors may be a read-only memmap); unnormalised
+    # vectors are normalised block by block into an on-disk memmap at filepath (a temporary file by default)
+    def __init__(self, X, block_size=BLOCK_SIZE, normalised=False, filepath=None):
+        self.X = X if normalised else normalise_rows_to_memmap(X, filepath, block_size)
+        self.block_size = block_size
+
+    def __len__(self):
+        return len(self.X)
+
+    def search(self, queries, k=10, exclude_ids=None):
+        Q = normalise_rows(np.atleast_2d(queries))
+        num_queries = len(Q)
+        best_ids = np.zeros((num_queries, 0), dtype=np.int64)
+        best_scores = np.zeros((num_queries, 0), dtype=np.float32)
+        for start in range(0, len(self.X), self.block_size):
+            block = np.asarray(self.X[start:start+self.block_size])
+            scores = Q @ block.T
+            if exclude_ids is not None:
+                # never return a query document as its own neighbour
+                rows = np.flatnonzero((exclude_ids >= start) & (exclude_ids < start + len(block)))
+                scores[rows, exclude_ids[rows] - start] = -np.inf
+            block_ids, block_scores = top_k(scores, np.arange(start, start + len(block)), k)
+            best_ids, best_scores = top_k(np.hstack([best_scores, block_scores]), np.hstack([best_ids, block_ids]), k)
+        return best_ids, best_scores
+
+    def search_by_ids(self, doc_ids, k=10):
+        doc_ids = np.asarray(doc_ids)
+        return self.search(np.asarray(self.X[doc_ids]), k, exclude_ids=doc_ids)
+
+
+"""
+Approximate (IVF) index
+"""
+class IVFIndex:
+    # inverted-file index: KMeans partitions the normalised vectors into n_clusters lists, and a query is only scored
+    # exactly against the members of its n_probe most similar clusters
+    def __init__(self, X, centroids, list_ids, list_offsets, n_probe=N_PROBE, normalised=True):
+        self.X = X if normalised else normalise_rows_to_memmap(X)
+        self.centroids = centroids
+        self.list_ids = list_ids
+        self.list_offsets = list_offsets
+        self.n_probe = n_probe
+
+    def __len__(self):
+        return len(self.X)
+
+    # the normalised vectors go to an on-disk memmap at filepath (a temporary file by default); building with
+    # filepath=os.path.join(directory, VECTORS_FILENAME) lets save(directory) keep them in place instead of copying them
+    @classmethod
+    def build(cls, X, n_clusters=None, n_probe=N_PROBE, sample_size=100000, random_state=0, block_size=BLOCK_SIZE, filepath=None):
+        from sklearn.cluster import MiniBatchKMeans
+
+        X = normalise_rows_to_memmap(X, filepath, block_size)
+        n_clusters = n_clusters or max(1, int(np.sqrt(len(X))))
+        rng = np.random.RandomState(random_state)
+        sample = np.asarray(X[np.sort(rng.choice(len(X), min(sample_size, len(X)), replace=False))])
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=random_state, n_init=3).fit(sample)
+        centroids = normalise_rows(kmeans.cluster_centers_)
+
+        # assign every vector to its most similar centroid, block by block
+        assignments = np.empty(len(X), dtype=np.int32)
+        for start in range(0, len(X), block_size):
+            assignments[start:start+block_size] = np.argmax(np.asarray(X[start:start+block_size]) @ centroids.T, axis=1)
+        list_ids = np.argsort(assignments, kind="stable").astype(np.int64)
+        list_offsets = np.zeros(n_clusters + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=n_clusters), out=list_offsets[1:])
+        return cls(X, centroids, list_ids, list_offsets, n_probe)
+
+    def search(self, queries, k=10, n_probe=None, exclude_ids=None):
+        n_probe = min(n_probe or self.n_probe, len(self.centroids))
+        Q = normalise_rows(np.atleast_2d(queries))
+        probed, _ = top_k(Q @ self.centroids.T, np.arange(len(self.centroids)), n_probe)
+        all_ids = np.full((len(Q), k), -1, dtype=np.int64)
+        all_scores = np.full((len(Q), k), -np.inf, dtype=np.float32)
+        for i, clusters in enumerate(probed):
+            candidates = np.concatenate([self.list_ids[self.list_offsets[c]:self.list_offsets[c+1]] for c in clusters])
+            if exclude_ids is not None:
+                candidates = candidates[candidates != exclude_ids[i]]
+            if len(candidates) == 0: continue
+            candidates.sort() # sequential reads when X is memory-mapped
+            scores = (np.asarray(self.X[candidates]) @ Q[i])[None, :]
+            ids, top_scores = top_k(scores, candidates, k)
+            all_ids[i, :ids.shape[1]] = ids[0]
+            all_scores[i, :ids.shape[1]] = top_scores[0]
+        return all_ids, all_scores
+
+    def search_by_ids(self, doc_ids, k=10, n_probe=None):
+        doc_ids = np.asarray(doc_ids)
+        return self.search(np.asarray(self.X[doc_ids]), k, n_probe, exclude_ids=doc_ids)
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        vectors_filepath = os.path.join(directory, VECTORS_FILENAME)
+        X_filepath = getattr(self.X, "filename", None)
+        if X_filepath is None or not os.path.exists(vectors_filepath) or not os.path.samefile(X_filepath, vectors_filepath):
+            np.save(vectors_filepath, self.X)
+        np.save(os.path.join(directory, "centroids.npy"), self.centroids)
+        np.save(os.path.join(directory, "list_ids.npy"), self.list_ids)
+        np.save(os.path.join(directory, "list_offsets.npy"), self.list_offsets)
+        with open(os.path.join(directory, METADATA_FILENAME), "w") as f:
+            json.dump({"num_docs": len(self.X), "n_clusters": len(self.centroids), "n_probe": self.n_probe}, f, indent=4)
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        with open(os.path.join(directory, METADATA_FILENAME)) as f:
+            metadata = json.load(f)
+        return cls(
+            np.load(os.path.join(directory, VECTORS_FILENAME), mmap_mode=mmap_mode),
+            np.load(os.path.join(directory, "centroids.npy")),
+            np.load(os.path.join(directory, "list_ids.npy"), mmap_mode=mmap_mode),
+            np.load(os.path.join(directory, "list_offsets.npy")),
+            metadata["n_probe"]
+        )
+
+
+"""
+Construction from the feature store
+"""
+def build_index(name="dm", approximate=False, **kwargs):
+    import features
+
+    feature_store = features.load_feature_store(name)
+    if approximate:
+        return IVFIndex.build(feature_store.X, **kwargs)
+    return ExactIndex(feature_store.X, **kwargs)
+
+def infer_query_vectors(model, token_lists):
+    # newly inferred vectors for tokenized reports that are not part of the index
+    return np.vstack([model.infer_vector(tokens) for tokens in token_lists])
+
+def get_index_dir(name="dm"):
+    return os.path.join(util.SIMILARITY_INDEX_DIR, name)
+
+def get_index_vectors_filepath(name="dm"):
+    return os.path.join(get_index_dir(name), VECTORS_FILENAME)
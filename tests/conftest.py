@@ -0,0 +1,9 @@
+import os
+import sys
+
+# the modules live at the repository root, import each other by bare name (import util, import fetch...) and resolve
+# util's data paths relative to it, as when the notebooks and scripts are run from there
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+os.chdir(ROOT_DIR)
@@ -0,0 +1,62 @@
+import cache
+
+import os
+
+
+class FakePage:
+    def __init__(self, content, status_code=200, headers=None):
+        self.content = content
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def make_cache(directory, now, **kwargs):
+    return cache.ResponseCache(str(directory), url_prefix_ttls={"http://static/": None}, clock=lambda: now[0], **kwargs)
+
+def test_store_and_lookup_round_trip(tmp_path):
+    now = [0.0]
+    response_cache = make_cache(tmp_path, now, default_ttl=10)
+    response_cache.store("http://a/1", FakePage(b"body", headers={"ETag": '"v1"'}))
+    page, is_fresh, validator_headers = response_cache.lookup("http://a/1")
+    assert page.content == b"body" and page.status_code == 200 and is_fresh
+    assert validator_headers == {"If-None-Match": '"v1"'}
+    assert response_cache.lookup("http://a/missing") == (None, False, {})
+
+def test_ttl_expiry_refresh_and_prefix_ttls(tmp_path):
+    now = [0.0]
+    response_cache = make_cache(tmp_path, now, default_ttl=10)
+    response_cache.store("http://a/1", FakePage(b"body"))
+    response_cache.store("http://static/1", FakePage(b"body"))
+    now[0] = 20.0
+    assert not response_cache.lookup("http://a/1")[1]
+    assert response_cache.lookup("http://static/1")[1]
+    response_cache.refresh("http://a/1")
+    assert response_cache.lookup("http://a/1")[1]
+
+def test_identical_bodies_are_stored_once(tmp_path):
+    now = [0.0]
+    response_cache = make_cache(tmp_path, now)
+    response_cache.store("http://a/1", FakePage(b"same body"))
+    response_cache.store("http://a/2", FakePage(b"same body"))
+    objects = [name for _, _, names in os.walk(tmp_path / "objects") for name in names]
+    assert len(objects) == 1
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    now = [0.0]
+    response_cache = make_cache(tmp_path, now, max_size_bytes=2500)
+    for i in range(3):
+        now[0] += 1
+        response_cache.store(f"http://a/{i}", FakePage(os.urandom(1000)))
+    assert response_cache.size() <= 2500
+    assert response_cache.lookup("http://a/0")[0] is None
+    assert response_cache.lookup("http://a/2")[0] is not None
+
+def test_corrupt_object_is_a_miss(tmp_path):
+    now = [0.0]
+    response_cache = make_cache(tmp_path, now)
+    response_cache.store("http://a/1", FakePage(b"body"))
+    for directory, _, names in os.walk(tmp_path / "objects"):
+        for name in names:
+            with open(os.path.join(directory, name), "wb") as f:
+                f.write(b"not zlib")
+    assert response_cache.lookup("http://a/1") == (None, False, {})
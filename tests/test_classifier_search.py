@@ -0,0 +1,76 @@
+import classifier_search
+
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression
+from sklearn.naive_bayes import GaussianNB
+
+
+@pytest.fixture
+def data():
+    rng = np.random.RandomState(0)
+    y = np.repeat(np.array(["DMT", "LSD", "MDMA"]), 60)
+    X = rng.normal(size=(len(y), 5)) + (np.unique(y, return_inverse=True)[1].ravel()[:, None] == np.arange(5)) * 2.0
+    order = rng.permutation(len(y))
+    X, y = X[order], y[order]
+    return X[:150], X[150:], y[:150], y[150:]
+
+
+"""
+Fingerprints
+"""
+def test_fingerprint_covers_the_feature_matrices(data, tmp_path):
+    X_train, X_test, y_train, _ = data
+    fingerprint = classifier_search.get_search_fingerprint(X_train, X_test, y_train, 5, 0)
+    filepath = str(tmp_path / "X_train.npy")
+    np.save(filepath, X_train)
+    memmap_fingerprint = classifier_search.get_search_fingerprint(np.load(filepath, mmap_mode="r"), X_test, y_train, 5, 0)
+    assert memmap_fingerprint == fingerprint
+
+    # regenerated features with the same shape and labels must not reuse the cached scores
+    X_train_regenerated = X_train.copy()
+    X_train_regenerated[3, 2] += 1e-3
+    X_test_regenerated = X_test.copy()
+    X_test_regenerated[0, 0] = 0
+    assert classifier_search.get_search_fingerprint(X_train_regenerated, X_test, y_train, 5, 0) != fingerprint
+    assert classifier_search.get_search_fingerprint(X_train, X_test_regenerated, y_train, 5, 0) != fingerprint
+    assert classifier_search.get_search_fingerprint(X_train.astype(np.float32), X_test, y_train, 5, 0) != fingerprint
+    assert classifier_search.get_search_fingerprint(X_train, X_test, y_train, 4, 0) != fingerprint
+
+def test_module_does_not_import_the_doc2vec_search_stack():
+    code = "import sys, classifier_search; print(' '.join(sorted(m for m in ('doc2vec_search', 'corpus', 'features', 'gensim') if m in sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""
+
+
+"""
+Search
+"""
+def test_rung_resources():
+    assert classifier_search.get_rung_resources(9, 900, 30, eta=3) == [100, 300, 900]
+    assert classifier_search.get_rung_resources(9, 900, 200, eta=3) == [300, 900]
+    assert classifier_search.get_rung_resources(1, 900, 30, eta=3) == [900]
+
+def test_search_classifiers_resumes_from_the_trial_log(data, tmp_path, capsys):
+    X_train, X_test, y_train, y_test = data
+    clfs = [GaussianNB(), LogisticRegression(max_iter=1000)]
+    clf_to_gs_params_dict = {
+        GaussianNB: {"var_smoothing": [1e-9, 1e-3]},
+        LogisticRegression: {"C": [0.01, 0.1, 1.0]}
+    }
+    search_dir = str(tmp_path / "classifier_search")
+    kwargs = dict(cv=3, num_processes=2, search_dir=search_dir, verbose=False)
+
+    best_clf, best_f_score_avg, report, params, summary = classifier_search.search_classifiers(
+        X_train, X_test, y_train, y_test, clfs, clf_to_gs_params_dict, **kwargs)
+    assert set(summary["classifiers"]) == {"GaussianNB", "LogisticRegression"}
+    assert best_f_score_avg == max(result["test_f_score"] for result in summary["classifiers"].values())
+    assert summary["num_fits"] > 0 and summary["num_cached_fits"] == 0
+    assert params == summary["classifiers"][best_clf.__class__.__name__]["params"]
+
+    *_, resumed_summary = classifier_search.search_classifiers(X_train, X_test, y_train, y_test, clfs, clf_to_gs_params_dict, **kwargs)
+    assert resumed_summary["num_fits"] == 0 and resumed_summary["num_cached_fits"] == summary["num_fits"]
+    assert resumed_summary["classifiers"] == summary["classifiers"]
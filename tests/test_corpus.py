@@ -0,0 +1,34 @@
+import corpus
+
+import numpy as np
+
+
+TOKEN_LISTS = [["walls", "breathing", "music"], [], ["music", "geometry", "music", "café"]]
+LABELS = ["LSD", "DMT", "LSD"]
+TEXTS = ["The walls were breathing to the music.", "", "Music, geometry, more music at the café."]
+
+def test_round_trip(tmp_path):
+    corpus.write_corpus(TOKEN_LISTS, LABELS, TEXTS, directory=str(tmp_path))
+    loaded = corpus.load_corpus(str(tmp_path))
+    assert len(loaded) == 3
+    assert [loaded.get_tokens(i) for i in range(3)] == TOKEN_LISTS
+    assert [loaded.get_text(i) for i in range(3)] == TEXTS
+    assert list(loaded.labels) == LABELS
+    assert list(loaded.get_lengths()) == [3, 0, 4]
+    # one ID per distinct token, shared by every document that contains it
+    assert loaded.get_token_ids(0)[2] == loaded.get_token_ids(2)[0]
+
+def test_masks_and_tagged_documents(tmp_path):
+    corpus.write_corpus(TOKEN_LISTS, LABELS, directory=str(tmp_path))
+    loaded = corpus.load_corpus(str(tmp_path))
+    assert not loaded.metadata["has_texts"]
+    assert list(loaded.iter_documents(np.array([True, False, True]))) == [TOKEN_LISTS[0], TOKEN_LISTS[2]]
+    assert list(loaded.iter_documents([2])) == [TOKEN_LISTS[2]]
+    tagged = list(loaded.tagged_documents(np.array([False, True, True])))
+    assert [doc.tags for doc in tagged] == [["DOC_0"], ["DOC_1"]]
+    assert tagged[1].words == TOKEN_LISTS[2]
+
+def test_empty_corpus(tmp_path):
+    corpus.write_corpus([], [], directory=str(tmp_path))
+    loaded = corpus.load_corpus(str(tmp_path))
+    assert len(loaded) == 0 and list(loaded.iter_documents()) == []
@@ -0,0 +1,47 @@
+import crawl
+
+
+def test_reports_are_stored_once_and_linked_per_drug(tmp_path):
+    store = crawl.CrawlStore(str(tmp_path / "crawl.sqlite"))
+    store.append_report(1, "http://erowid/1", b"<html>one</html>", "one")
+    store.append_report(1, "http://erowid/1", b"<html>duplicate</html>", "duplicate")
+    store.append_report(2, "http://erowid/2", b"<html>two</html>", "two")
+    store.link_reports("LSD", [1, 2])
+    store.link_reports("DMT", [2])
+    assert store.get_report_ids() == {1, 2}
+    assert store.get_drug_report_ids("DMT") == {2}
+    assert store.get_raw_body(1) == b"<html>one</html>"
+    assert store.get_drug_to_trip_reports_dict() == {"DMT": ["two"], "LSD": ["one", "two"]}
+    assert store.get_drug_to_trip_reports_dict(["LSD", "MDMA"]) == {"LSD": ["one", "two"], "MDMA": []}
+
+def test_checkpointed_reports_survive_a_crash(tmp_path, monkeypatch):
+    monkeypatch.setattr(crawl, "CHECKPOINT_INTERVAL", 2)
+    filepath = str(tmp_path / "crawl.sqlite")
+    store = crawl.CrawlStore(filepath)
+    for report_id in range(3):
+        store.append_report(report_id, f"http://erowid/{report_id}", b"body", "text")
+    # the third report is past the last checkpoint and is lost with the connection
+    store.db.rollback()
+    reopened = crawl.CrawlStore(filepath)
+    assert reopened.get_report_ids() == {0, 1}
+
+def test_update_trip_report_and_iter_raw_bodies(tmp_path):
+    store = crawl.CrawlStore(str(tmp_path / "crawl.sqlite"))
+    store.append_report(5, "http://erowid/5", b"raw five", "old")
+    store.update_trip_report(5, "new")
+    store.link_reports("LSD", [5])
+    store.checkpoint()
+    assert list(store.iter_raw_bodies()) == [(5, b"raw five")]
+    assert store.get_drug_to_trip_reports_dict() == {"LSD": ["new"]}
+
+def test_iter_raw_bodies_pages_through_reports(tmp_path):
+    store = crawl.CrawlStore(str(tmp_path / "crawl.sqlite"))
+    for report_id in (9, 3, 0, 7, 4):
+        store.append_report(report_id, f"http://erowid/{report_id}", f"raw {report_id}".encode(), "")
+    store.link_reports("LSD", [0, 3, 4, 7, 9])
+    # the store stays usable between pages, e.g. to write back re-extracted reports
+    for report_id, raw_body in store.iter_raw_bodies(page_size=2):
+        store.update_trip_report(report_id, raw_body.decode())
+    store.checkpoint()
+    assert store.get_drug_to_trip_reports_dict() == {"LSD": ["raw 0", "raw 3", "raw 4", "raw 7", "raw 9"]}
+    assert [report_id for report_id, _ in store.iter_raw_bodies(page_size=5)] == [0, 3, 4, 7, 9]
@@ -0,0 +1,150 @@
+import corpus
+import doc2vec_search
+import search_log
+
+import os
+
+import numpy as np
+import pytest
+
+
+def test_split_is_reused_only_for_the_same_labelled_documents(tmp_path):
+    filepath = str(tmp_path / "split.npz")
+    y = np.array(["LSD", "DMT"] * 10)
+    train_indices, test_indices = doc2vec_search.load_or_create_train_test_split_indices(y, filepath=filepath, doc_indices=np.arange(20))
+    reused = doc2vec_search.load_or_create_train_test_split_indices(y, filepath=filepath, doc_indices=np.arange(20))
+    assert np.array_equal(reused[0], train_indices) and np.array_equal(reused[1], test_indices)
+
+    # same length, different labels (e.g. a reshuffled corpus): a new split is made and saved
+    reshuffled = np.array(["DMT", "LSD"] * 10)
+    assert doc2vec_search.get_labels_fingerprint(reshuffled) != doc2vec_search.get_labels_fingerprint(y)
+    doc2vec_search.load_or_create_train_test_split_indices(reshuffled, filepath=filepath, doc_indices=np.arange(20))
+    assert str(np.load(filepath)["fingerprint"]) == doc2vec_search.get_labels_fingerprint(reshuffled, np.arange(20))
+
+def test_trial_ids_include_the_training_schedule():
+    assert doc2vec_search.get_trial_id(0, 50, 3, 0.1, 0.0, 5, 5) != doc2vec_search.get_trial_id(0, 50, 3, 0.1, 0.0, 5, 3)
+    assert doc2vec_search.get_trial_id(0, 50, 3, 0.1, 0.0, 5, 5) != doc2vec_search.get_trial_id(0, 50, 3, 0.1, 0.0, 10, 5)
+
+def test_rung_sessions():
+    assert doc2vec_search.get_rung_sessions(5, eta=3) == [1, 3, 5]
+    assert doc2vec_search.get_rung_sessions(1) == [1]
+
+def test_load_best_model_without_a_best_model_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        doc2vec_search.load_best_model(str(tmp_path / "best_model.model"), dm=0, verbose=False)
+
+
+"""
+End to end
+"""
+def write_tiny_corpus(directory, num_docs=60, seed=0):
+    rng = np.random.RandomState(seed)
+    labels = ["LSD", "DMT"] * (num_docs // 2)
+    words = {"LSD": ["walls", "breathing", "music", "hours"], "DMT": ["entities", "hyperspace", "minutes", "breakthrough"]}
+    token_lists = [list(rng.choice(words[label] + ["the", "trip", "felt"], 30)) for label in labels]
+    corpus.write_corpus(token_lists, labels, directory=directory)
+    return np.array(labels)
+
+@pytest.mark.filterwarnings("ignore")
+def test_grid_search_resumes_and_restarts_for_new_data(tmp_path):
+    pytest.importorskip("gensim")
+    corpus_dir, trials_dir = str(tmp_path / "corpus"), str(tmp_path / "trials")
+    y = write_tiny_corpus(corpus_dir)
+    doc_indices = np.arange(len(y))
+    train_indices, test_indices = np.arange(0, 40), np.arange(40, 60)
+    args = (doc_indices, y, train_indices, test_indices, [8], [2], [(0.05, 0.0)], 1, 2)
+    model, f_score_avg, report, hyperparams = doc2vec_search.grid_search_doc2vec_models(
+        *args, dm=0, num_parallel_trials=1, corpus_dir=corpus_dir, trials_dir=trials_dir)
+    assert hyperparams["epochs_trained"] in (1, 2) and 0.0 <= f_score_avg <= 1.0
+
+    fingerprint = doc2vec_search.get_search_fingerprint(doc_indices, y, train_indices, test_indices, corpus_dir)
+    trial_log_file, _ = doc2vec_search.get_search_files(0, fingerprint, trials_dir)
+    num_records = len(search_log.TrialLog(trial_log_file).records)
+    assert num_records == 3  # two scored sessions and the "done" record
+
+    # the finished trial is not run again
+    doc2vec_search.grid_search_doc2vec_models(*args, dm=0, num_parallel_trials=1, corpus_dir=corpus_dir, trials_dir=trials_dir)
+    assert len(search_log.TrialLog(trial_log_file).records) == num_records
+
+    # another split of the same corpus gets its own trial log
+    other_args = (doc_indices, y, test_indices, train_indices) + args[4:]
+    doc2vec_search.grid_search_doc2vec_models(*other_args, dm=0, num_parallel_trials=1, corpus_dir=corpus_dir, trials_dir=trials_dir)
+    other_fingerprint = doc2vec_search.get_search_fingerprint(doc_indices, y, test_indices, train_indices, corpus_dir)
+    assert other_fingerprint != fingerprint
+    assert len(search_log.TrialLog(doc2vec_search.get_search_files(0, other_fingerprint, trials_dir)[0]).records) == 3
+
+@pytest.mark.filterwarnings("ignore")
+def test_successive_halving_promotes_and_resumes(tmp_path):
+    pytest.importorskip("gensim")
+    corpus_dir, trials_dir = str(tmp_path / "corpus"), str(tmp_path / "trials")
+    y = write_tiny_corpus(corpus_dir)
+    args = (np.arange(len(y)), y, np.arange(0, 40), np.arange(40, 60), [8, 12, 16], [2], [(0.05, 0.0)], 1, 3)
+    *_, summary = doc2vec_search.successive_halving_doc2vec_models(*args, dm=0, eta=3, num_parallel_trials=1,
+                                                                   corpus_dir=corpus_dir, trials_dir=trials_dir)
+    # three configurations for one session, then the best one alone for three
+    assert summary["epochs_trained"] == 3 * 1 + 1 * 2
+    trial_log_file, _ = doc2vec_search.get_search_files(0, summary["fingerprint"], trials_dir, search="halving")
+    records = search_log.TrialLog(trial_log_file).get_session_records()
+    assert sorted(record["sessions_trained"] for record in records) == [1, 1, 1, 3]
+
+    # every rung is already logged, so nothing is trained again
+    *_, resumed = doc2vec_search.successive_halving_doc2vec_models(*args, dm=0, eta=3, num_parallel_trials=1,
+                                                                   corpus_dir=corpus_dir, trials_dir=trials_dir)
+    assert resumed["epochs_trained"] == 0
+
+class Interrupted(Exception):
+    pass
+
+@pytest.mark.filterwarnings("ignore")
+def test_successive_halving_resumes_from_the_last_logged_checkpoint(tmp_path, monkeypatch):
+    pytest.importorskip("gensim")
+    corpus_dir, trials_dir = str(tmp_path / "corpus"), str(tmp_path / "trials")
+    y = write_tiny_corpus(corpus_dir)
+    args = (np.arange(len(y)), y, np.arange(0, 40), np.arange(40, 60), [8, 12, 16], [2], [(0.05, 0.0)], 1, 5)
+    kwargs = dict(dm=0, eta=3, num_parallel_trials=1, corpus_dir=corpus_dir, trials_dir=trials_dir)
+
+    # interrupted after the second rung's worker saved its checkpoint but before its record was logged
+    append = search_log.TrialLog.append
+    def interrupting_append(self, record):
+        if record.get("sessions_trained") == 3:
+            raise Interrupted()
+        append(self, record)
+    monkeypatch.setattr(search_log.TrialLog, "append", interrupting_append)
+    with pytest.raises(Interrupted):
+        doc2vec_search.successive_halving_doc2vec_models(*args, **kwargs)
+    monkeypatch.setattr(search_log.TrialLog, "append", append)
+    [checkpoints_dir] = [os.path.join(trials_dir, name) for name in os.listdir(trials_dir) if name.startswith("halving_checkpoints_")]
+    checkpoints = sorted(name for name in os.listdir(checkpoints_dir) if name.endswith(".model"))
+    assert [name.rsplit("_", 1)[1] for name in checkpoints] == ["after1.model", "after3.model"]
+
+    # the second rung is retrained from the one-session checkpoint, not continued from the unlogged three-session one
+    *_, summary = doc2vec_search.successive_halving_doc2vec_models(*args, **kwargs)
+    assert summary["epochs_trained"] == 2 + 2
+    trial_log_file, _ = doc2vec_search.get_search_files(0, summary["fingerprint"], trials_dir, search="halving")
+    records = search_log.TrialLog(trial_log_file).get_session_records()
+    assert sorted(record["sessions_trained"] for record in records) == [1, 1, 1, 3, 5]
+    assert os.listdir(checkpoints_dir) == []
+
+@pytest.mark.filterwarnings("ignore")
+def test_compare_with_grid_search_reports_wall_clock(tmp_path, capsys):
+    pytest.importorskip("gensim")
+    corpus_dir, trials_dir = str(tmp_path / "corpus"), str(tmp_path / "trials")
+    y = write_tiny_corpus(corpus_dir)
+    args = (np.arange(len(y)), y, np.arange(0, 40), np.arange(40, 60), [8, 12], [2], [(0.05, 0.0)], 1, 3)
+    kwargs = dict(dm=0, num_parallel_trials=2, corpus_dir=corpus_dir, trials_dir=trials_dir)
+    *_, summary = doc2vec_search.successive_halving_doc2vec_models(*args, eta=3, **kwargs)
+    assert doc2vec_search.compare_with_grid_search(summary, 0, trials_dir) is None
+
+    doc2vec_search.grid_search_doc2vec_models(*args, **kwargs)
+    # a resumed grid search trains nothing, so it adds no run
+    doc2vec_search.grid_search_doc2vec_models(*args, **kwargs)
+    trial_log_file, _ = doc2vec_search.get_search_files(0, summary["fingerprint"], trials_dir)
+    [run] = search_log.TrialLog(doc2vec_search.get_runs_file(trial_log_file)).records
+    assert run["num_trials"] == 2
+
+    capsys.readouterr()
+    grid_summary = doc2vec_search.compare_with_grid_search(summary, 0, trials_dir)
+    assert grid_summary["wall_clock_sec"] == run["wall_clock_sec"]
+    assert grid_summary["epochs_trained"] == 2 * 3
+    assert summary["total_wall_clock_sec"] == summary["wall_clock_sec"]
+    assert "Wall-clock speedup" in capsys.readouterr().out
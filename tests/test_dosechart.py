@@ -0,0 +1,93 @@
+import dosechart
+from benchmarks import dosechart_benchmark, synthetic
+
+import numpy as np
+import pytest
+from bs4 import BeautifulSoup
+
+
+# µg doses, a single-level chart, rows without a number or unit, a repeated label and a RowValues cell that is empty
+PAGE = """
+<div><table class="dosechart" data-roa="Oral"><tbody>
+<tr><td class="RowTitle"><a href="/wiki/Dosage_classification#Threshold">Threshold</a></td><td class="RowValues">20 µg</td></tr>
+<tr><td class="RowTitle"><a href="/wiki/Dosage_classification#Light">Light</a></td><td class="RowValues">25 - 75 µg</td></tr>
+<tr><td class="RowTitle"><a href="/wiki/Dosage_classification#Common">Common</a></td><td class="RowValues">75 - 150 µg</td></tr>
+<tr><td class="RowTitle"><a href="/wiki/Dosage_classification#Strong">Strong</a></td><td class="RowValues">unknown</td></tr>
+<tr><td class="RowTitle"><a href="/wiki/Dosage_classification#Heavy">Heavy</a></td><td class="RowValues">300 µg +</td></tr>
+<tr><td class="RowTitle"><a href="/wiki/Duration#Total">Total</a></td><td class="RowValues">8 - 12 hours</td></tr>
+<tr><td class="RowTitle"><a href="/wiki/Duration#Total">Total</a></td><td class="RowValues">1 - 2 days</td></tr>
+<tr><td class="RowTitle"><a href="/wiki/Duration#Onset">Onset</a></td><td class="RowValues">15 - 30 minutes</td></tr>
+<tr><td class="RowTitle"><a href="/wiki/Duration#Peak">Peak</a></td><td class="RowValues"></td></tr>
+</tbody></table></div>
+<div><table class="dosechart" data-roa="Smoked"><tbody>
+<tr><td class="RowTitle"><a href="/wiki/Dosage_classification#Common">Common</a></td><td class="RowValues">10 - 20 mg</td></tr>
+<tr><td class="RowTitle"><a href="/wiki/Duration#Total">Total</a></td><td class="RowValues">5 - 20 minutes</td></tr>
+<tr><td class="RowTitle"><a href="/wiki/Duration#Onset">Onset</a></td><td class="RowValues">15 - 60 seconds</td></tr>
+</tbody></table></div>
+"""
+
+@pytest.fixture
+def table():
+    soup = BeautifulSoup(PAGE, "html.parser")
+    return dosechart.build_table({"LSD": dosechart.parse_dosecharts(soup), "DMT": [dict(row, roa="vaporised") for row in dosechart.parse_dosecharts(soup)]})
+
+
+"""
+Parsing
+"""
+def test_single_pass_parser_matches_per_label_parser_on_synthetic_pages():
+    drug_to_dosechart_info_dict = synthetic.load_dosechart_info()
+    assert "LSA" in drug_to_dosechart_info_dict
+    pages = synthetic.generate_psychonaut_wiki_drug_pages(drug_to_dosechart_info_dict)
+    for drug, page in pages.items():
+        soup = BeautifulSoup(page, "html.parser")
+        dosechart_info_dict = dosechart_benchmark.parse_single_pass(soup)
+        assert dosechart_info_dict == dosechart_benchmark.parse_per_label(soup), drug
+        assert dosechart_info_dict == drug_to_dosechart_info_dict[drug], drug
+
+def test_parse_dosecharts_edge_cases():
+    rows = dosechart.parse_dosecharts(BeautifulSoup(PAGE, "html.parser"))
+    oral = {(row["kind"], row["level"]): (row["low"], row["high"], row["unit"]) for row in rows if row["roa"] == "oral"}
+    assert oral == {
+        ("dosage", "threshold"): (20.0, None, "µg"),
+        ("dosage", "light"): (25.0, 75.0, "µg"),
+        ("dosage", "common"): (75.0, 150.0, "µg"),
+        ("dosage", "heavy"): (300.0, None, "µg"),
+        ("duration", "total"): (8.0, 12.0, "hours"),
+        ("duration", "onset"): (15.0, 30.0, "minutes")
+    }
+    # a single dosage level gives the upper end of its range to the next level, as scrape.get_dosage_dict does
+    assert dosechart.to_dosechart_info_dict(rows)["smoked"]["dosage"] == {"common": (10.0, "mg"), "strong": (20.0, "mg")}
+
+def test_parse_row_value():
+    assert dosechart.parse_row_value("dosage", "1.5 - 2.5 mg") == (1.5, 2.5, "mg")
+    assert dosechart.parse_row_value("dosage", "10 mg") == (10.0, None, "mg")
+    assert dosechart.parse_row_value("dosage", "10 - 20") is None
+    assert dosechart.parse_row_value("duration", "1 - 2 - 3 hours") is None
+
+
+"""
+Table
+"""
+def test_table_values_are_in_one_unit_per_kind(table):
+    assert set(table["unit"][table["kind"] == "dosage"]) == {"mg"}
+    assert set(table["unit"][table["kind"] == "duration"]) == {"minutes"}
+    light = dosechart.select(table, drug="LSD", roa="oral", kind="dosage", level="light")
+    np.testing.assert_allclose([light["low"][0], light["high"][0]], [0.025, 0.075])
+    onset = dosechart.select(table, drug="LSD", roa="smoked", level="onset")
+    np.testing.assert_allclose([onset["low"][0], onset["high"][0]], [0.25, 1.0])
+    assert np.isnan(dosechart.select(table, drug="LSD", roa="oral", level="heavy")["high"][0])
+    assert len(dosechart.select(table, drug="DMT")) == len(dosechart.select(table, drug="LSD"))
+
+def test_pivot(table):
+    charts, matrix = dosechart.pivot(table, "duration", "high")
+    assert [tuple(chart) for chart in charts] == [("DMT", "vaporised"), ("LSD", "oral"), ("LSD", "smoked")]
+    assert matrix.shape == (3, len(dosechart.DURATION_TYPES))
+    np.testing.assert_allclose(matrix[1], [720, 30, np.nan, np.nan, np.nan, np.nan])
+    np.testing.assert_allclose(matrix[2], [20, 1, np.nan, np.nan, np.nan, np.nan])
+
+def test_save_and_load_table(table, tmp_path):
+    filepath = dosechart.save_table(table, str(tmp_path / "dosechart_table.npy"))
+    loaded_table = dosechart.load_table(filepath, mmap_mode="r")
+    assert loaded_table.dtype == dosechart.DOSECHART_DTYPE
+    assert loaded_table.tobytes() == table.tobytes()
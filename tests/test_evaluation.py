@@ -0,0 +1,75 @@
+import evaluation
+
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import confusion_matrix, precision_recall_fscore_support, top_k_accuracy_score
+
+
+CLASSES = np.array(["2C-B", "DMT", "LSD", "MDMA", "Psilocybin"])
+
+@pytest.fixture
+def rng():
+    return np.random.RandomState(0)
+
+
+"""
+Metrics
+"""
+@pytest.mark.parametrize("labels", [CLASSES, CLASSES[[4, 0, 2]], np.array(["LSD", "Ketamine", "DMT"])])
+def test_scores_match_sklearn(rng, labels):
+    for _ in range(20):
+        y_true = rng.choice(CLASSES, size=200)
+        y_pred = np.where(rng.rand(200) < 0.5, y_true, rng.choice(CLASSES, size=200))
+
+        cm = evaluation.get_confusion_matrix(y_true, y_pred, labels)
+        np.testing.assert_array_equal(cm, confusion_matrix(y_true, y_pred, labels=labels))
+
+        support, predicted = evaluation.get_label_counts(y_true, labels), evaluation.get_label_counts(y_pred, labels)
+        report = evaluation.get_per_class_scores(cm, labels, support, predicted)
+        expected = precision_recall_fscore_support(y_true, y_pred, labels=labels, average=None, zero_division=0)
+        for column, expected_scores in zip(("precision", "recall", "f_score", "support"), expected):
+            np.testing.assert_allclose(report[column].values, expected_scores)
+
+def test_top_k_accuracies_match_sklearn(rng):
+    probs = rng.dirichlet(np.ones(len(CLASSES)), size=300)
+    y_true = rng.choice(CLASSES, size=300)
+    accuracies = evaluation.get_top_k_accuracies(probs, CLASSES, y_true, max_k=4)
+    expected = [top_k_accuracy_score(y_true, probs, k=k, labels=CLASSES) for k in range(1, 5)]
+    np.testing.assert_allclose(accuracies, expected)
+
+def test_normalised_confusion_matrix_leaves_absent_classes_zero():
+    cm = evaluation.normalise_confusion_matrix(np.array([[1, 3], [0, 0]]))
+    np.testing.assert_allclose(cm, [[0.25, 0.75], [0, 0]])
+
+
+"""
+Evaluation
+"""
+def test_evaluate_classifier_and_test_classifier(rng, capsys):
+    X = rng.normal(size=(200, 4)) + np.repeat(np.arange(4), 50)[:, None]
+    y = np.repeat(CLASSES[:4], 50)
+    clf = LogisticRegression(max_iter=1000).fit(X, y)
+    labels = CLASSES[:3]
+
+    result = evaluation.evaluate_classifier(clf, X, y, labels, max_k=3)
+    expected = precision_recall_fscore_support(y, clf.predict(X), labels=labels, average=None, zero_division=0)
+    np.testing.assert_allclose(result["report"]["precision"].values, expected[0])
+    assert result["num_samples"] == 200 and len(result["top_k_accuracy"]) == 3
+
+    report = evaluation.test_classifier(clf, X, y, labels, top_n=3, show_top_n_accuracy=True)
+    assert capsys.readouterr().out == f"Top-3 accuracy: {result['top_k_accuracy'][-1]}\n"
+    np.testing.assert_allclose(report["recall"].values, expected[1])
+
+def test_aggregate_folds():
+    labels = CLASSES[:2]
+    results = [
+        evaluation.evaluate_classifier(type("Constant", (), {"predict": lambda self, X: np.array(y_pred)})(),
+                                       None, y_true, labels, max_k=0)
+        for y_true, y_pred in ((["2C-B", "DMT"], ["2C-B", "2C-B"]), (["DMT", "DMT"], ["DMT", "DMT"]))
+    ]
+    aggregate = evaluation.aggregate_folds(results, labels)
+    np.testing.assert_allclose(aggregate["report"]["precision_mean"].values, [0.25, 0.5])
+    np.testing.assert_array_equal(aggregate["report"]["support"].values, [1, 3])
+    np.testing.assert_allclose(aggregate["confusion_matrix"], [[1, 0], [1 / 3, 2 / 3]])
+    assert aggregate["top_k_accuracy"] is None
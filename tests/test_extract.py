@@ -0,0 +1,38 @@
+import extract
+from benchmarks import extract_benchmark
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def pages_and_references():
+    pages = extract_benchmark.load_fixtures() + extract_benchmark.load_synthetic_pages(20)
+    assert len(pages) > 20
+    return [(page, extract.extract_trip_report(page, backend="reference")) for page in pages]
+
+@pytest.mark.parametrize("backend", ["fast", "html.parser"])
+def test_backend_matches_reference_exactly(pages_and_references, backend):
+    for page, reference in pages_and_references:
+        assert extract.extract_trip_report(page, backend=backend) == reference
+
+def test_lxml_matches_reference_up_to_whitespace(pages_and_references):
+    pytest.importorskip("lxml")
+    for page, reference in pages_and_references:
+        assert extract.extract_trip_report(page, backend="lxml").split() == reference.split()
+
+def make_page(body):
+    return b"<html><body><!-- Start Body -->" + body + b"<!-- End Body --></body></html>"
+
+@pytest.mark.parametrize("backend", ["fast", "html.parser"])
+def test_bare_angle_brackets_are_text(backend):
+    page = make_page(b"Temp was 3 < 5 degrees and x > y, dose <3.5g")
+    assert extract.extract_trip_report(page, backend=backend) == "Temp was 3 < 5 degrees and x > y, dose <3.5g"
+
+@pytest.mark.parametrize("backend", ["fast", "html.parser", "lxml"])
+def test_script_and_style_contents_are_dropped(backend):
+    page = make_page(b"before<SCRIPT>if (a < b) { x(); }</SCRIPT> middle<style>p { color: red; }</style> after")
+    assert extract.extract_trip_report(page, backend=backend).split() == ["before", "middle", "after"]
+
+def test_charset_is_detected_from_meta():
+    page = '<meta charset="windows-1252"><!-- Start Body -->café – ok<!-- End Body -->'.encode("cp1252")
+    assert extract.extract_trip_report(page) == "café – ok"
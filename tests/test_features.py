@@ -0,0 +1,40 @@
+import features
+
+import numpy as np
+import pytest
+
+
+class FakeDocVectors:
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+class FakeModel:
+    def __init__(self, vectors):
+        self.dv = FakeDocVectors(vectors)
+
+def test_feature_store_round_trip(tmp_path):
+    X = np.random.RandomState(0).rand(6, 4).astype(np.float32)
+    y = ["LSD", "DMT", "LSD", "DMT", "LSD", "DMT"]
+    # the corpus mask the model was trained on: six of its eight documents, one per row
+    mask = [True, True, False, True, True, False, True, True]
+    features.write_feature_store(FakeModel(X), y, mask, [0, 1, 2, 3], [4, 5], "dbow", hyperparams={"window": 3},
+                                 features_dir=str(tmp_path))
+    store = features.load_feature_store("dbow", features_dir=str(tmp_path))
+    assert isinstance(store.X, np.memmap) and np.array_equal(store.X, X)
+    assert len(store) == 6 and list(store.labels) == ["DMT", "LSD"]
+    assert store.metadata["vector_size"] == 4 and store.metadata["hyperparams"] == {"window": 3}
+    X_train, X_test, y_train, y_test = store.get_train_test_split()
+    assert np.array_equal(X_train, X[:4]) and np.array_equal(X_test, X[4:])
+    assert list(y_test) == ["LSD", "DMT"]
+    assert list(store.mask) == mask
+
+@pytest.mark.parametrize("mask, y", [
+    ([True, False, True], ["LSD", "DMT"] * 3),
+    ([True] * 7, ["LSD", "DMT"] * 3),
+    ([True] * 6, ["LSD", "DMT"] * 2)
+])
+def test_inconsistent_inputs_are_rejected(tmp_path, mask, y):
+    X = np.zeros((6, 4), dtype=np.float32)
+    with pytest.raises(ValueError):
+        features.write_feature_store(FakeModel(X), y, mask, [0, 1, 2, 3], [4, 5], "dbow", features_dir=str(tmp_path))
+    assert not (tmp_path / "dbow").exists()
@@ -0,0 +1,107 @@
+import cache
+import fetch
+
+import http.server
+import threading
+import time
+
+import pytest
+
+
+"""
+Local stand-in server
+"""
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    # /page/<n> serves "page <n>" with an ETag and answers If-None-Match with 304; /slow/<n> takes a while
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        if self.path.startswith("/slow/"):
+            time.sleep(0.2)
+        etag = f'"{self.path}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = f"page {self.path.rsplit('/', 1)[-1]}".encode()
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.paths = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def make_fetcher(response_cache=None, **kwargs):
+    rate_limiter = fetch.RateLimiter(host_limits={}, default_host_limits=(None, None, None, None))
+    return fetch.Fetcher(num_workers=4, rate_limiter=rate_limiter, response_cache=response_cache, **kwargs)
+
+
+"""
+Tests
+"""
+def test_map_yields_pages_in_order(server):
+    fetcher = make_fetcher()
+    urls = [f"{server.base_url}/page/{i}" for i in range(20)]
+    results = list(fetcher.map(urls))
+    assert [url for url, _ in results] == urls
+    assert [page.content for _, page in results] == [f"page {i}".encode() for i in range(20)]
+
+def test_map_closed_early_cancels_pending_requests(server):
+    fetcher = make_fetcher(max_in_flight=2)
+    urls = [f"{server.base_url}/slow/{i}" for i in range(50)]
+    pages = fetcher.map(urls)
+    next(pages)
+    pages.close()
+    # only the bounded window ahead of the consumer was ever requested
+    assert len(server.paths) <= 4
+
+def test_cache_hit_skips_network_and_stale_entries_revalidate(server, tmp_path):
+    now = [1000.0]
+    response_cache = cache.ResponseCache(str(tmp_path), default_ttl=60, url_prefix_ttls={}, clock=lambda: now[0])
+    fetcher = make_fetcher(response_cache)
+    url = f"{server.base_url}/page/1"
+    assert fetcher.get(url).content == b"page 1"
+    assert fetcher.get(url).content == b"page 1"
+    assert len(server.paths) == 1 and fetcher.stats["cache_hit"] == 1
+
+    now[0] += 120
+    assert fetcher.get(url).content == b"page 1"
+    assert len(server.paths) == 2 and fetcher.stats["cache_revalidated"] == 1
+
+def test_host_budget_persists_across_restarts(tmp_path):
+    now = [1000.0]
+    sleeps = []
+    response_cache = cache.ResponseCache(str(tmp_path))
+    budget = fetch.HostBudget("example.org", 3, 60, response_cache, clock=lambda: now[0])
+    for _ in range(3):
+        budget.acquire()
+    response_cache.close()
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+    restarted = fetch.HostBudget("example.org", 3, 60, cache.ResponseCache(str(tmp_path)), clock=lambda: now[0], sleep=sleep)
+    restarted.acquire()
+    assert sleeps == [60]
+    assert restarted.count == 1
+
+def test_token_bucket_limits_rate():
+    now = [0.0]
+    def sleep(seconds):
+        now[0] += seconds
+    bucket = fetch.TokenBucket(rate=2.0, capacity=2, clock=lambda: now[0], sleep=sleep)
+    for _ in range(6):
+        bucket.acquire()
+    assert now[0] == pytest.approx(2.0)
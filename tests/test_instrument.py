@@ -0,0 +1,163 @@
+import instrument
+
+import csv
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def state():
+    yield
+    instrument.disable()
+    instrument.clear_records()
+    instrument._state.trace_file = None
+    instrument._state.profile_dir = None
+    instrument._state.profile_counts.clear()
+
+def get_sampler_threads():
+    return [thread for thread in threading.enumerate() if thread.name == "rss-sampler"]
+
+
+"""
+Stages
+"""
+def test_stage_records_time_items_and_errors():
+    with instrument.Stage("work", num_items=3, profile=False, answer=42) as stage:
+        stage.add_items(2)
+        time.sleep(0.02)
+    assert stage.result["stage"] == "work" and stage.result["num_items"] == 5 and stage.result["attrs"] == {"answer": 42}
+    assert stage.result["wall_sec"] >= 0.02 and stage.result["items_per_sec"] == pytest.approx(5 / stage.result["wall_sec"])
+    assert stage.result["children_max_rss_mb"] >= 0 and "children_peak_rss_mb" not in stage.result
+
+    with pytest.raises(ValueError):
+        with instrument.Stage("failing", profile=False) as stage:
+            raise ValueError()
+    assert stage.result["error"] == "ValueError"
+
+def test_disabled_instrumentation_is_a_no_op():
+    assert instrument.stage("work") is instrument._NULL_STAGE
+    with instrument.stage("work") as stage:
+        stage.attrs["num_cached"] = 3
+        stage.result["f_score_mean"] = 0.5
+    assert instrument.stage("other").attrs == {} and instrument.stage("other").result == {}
+    traced = instrument.traced(count=instrument.count_result)(lambda n: list(range(n)))
+    assert traced(3) == [0, 1, 2] and instrument.get_records() == []
+
+def test_traced_records_enabled_calls(tmp_path):
+    instrument.enable(trace_file=str(tmp_path / "trace.jsonl"), sample_memory=False)
+    traced = instrument.traced(name="count_up", count=instrument.count_first_arg)(lambda items: sum(items))
+    assert traced([1, 2, 3]) == 6
+    records = instrument.get_records()
+    assert [(record["stage"], record["num_items"], record["peak_rss_mb"]) for record in records] == [("count_up", 3, None)]
+    with open(tmp_path / "trace.jsonl") as f:
+        assert [json.loads(line)["stage"] for line in f] == ["count_up"]
+
+
+"""
+Memory
+"""
+def test_one_sampler_thread_serves_nested_and_concurrent_stages():
+    assert get_sampler_threads() == []
+    barrier = threading.Barrier(4)
+    num_sampler_threads = []
+
+    def run():
+        with instrument.Stage("outer", profile=False):
+            with instrument.Stage("inner", profile=False):
+                barrier.wait()
+                num_sampler_threads.append(len(get_sampler_threads()))
+                barrier.wait()
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert num_sampler_threads == [1, 1, 1, 1]
+    assert get_sampler_threads() == []
+
+def test_peak_rss_includes_memory_freed_before_the_stage_ends():
+    with instrument.Stage("allocate", profile=False) as stage:
+        before_mb = instrument.get_rss_bytes() / 2**20
+        X = np.ones(128 * 2**20 // 8)
+        time.sleep(5 * instrument.RSS_SAMPLE_INTERVAL_SEC)
+        del X
+    assert stage.result["peak_rss_mb"] >= before_mb + 100
+
+
+"""
+Profiling
+"""
+def test_only_the_outermost_stage_across_threads_is_profiled(tmp_path):
+    profile_dir = tmp_path / "profiles"
+    instrument.enable(profile_dir=str(profile_dir), sample_memory=False)
+    barrier = threading.Barrier(8)
+
+    def run():
+        barrier.wait()
+        with instrument.stage("concurrent"):
+            with instrument.stage("nested"):
+                time.sleep(0.01)
+
+    threads = [threading.Thread(target=run) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(instrument.get_records()) == 16
+    assert not instrument._state.profiling
+    profiles = os.listdir(profile_dir)
+    assert len(profiles) >= 1 and all(profile.startswith("concurrent_") for profile in profiles)
+
+
+def _run_profiled_stage_in_child():
+    with instrument.stage("in_child"):
+        sum(range(1000))
+
+def test_a_child_forked_inside_a_profiled_stage_profiles_its_own_stages(tmp_path):
+    import multiprocessing
+
+    profile_dir = tmp_path / "profiles"
+    instrument.enable(profile_dir=str(profile_dir), sample_memory=False)
+    with instrument.stage("parent"):
+        process = multiprocessing.get_context("fork").Process(target=_run_profiled_stage_in_child)
+        process.start()
+        process.join()
+    assert process.exitcode == 0
+    profiles = sorted(os.listdir(profile_dir))
+    assert profiles == sorted([f"in_child_{process.pid}_0.prof", f"parent_{os.getpid()}_0.prof"])
+
+
+"""
+Traces
+"""
+def test_write_trace_and_summarise(tmp_path):
+    records = [
+        {"stage": "a", "started_at": 0, "wall_sec": 1.0, "cpu_sec": 0.5, "num_items": 2, "items_per_sec": 2.0, "peak_rss_mb": 10.0, "pid": 1, "attrs": {"k": 1}},
+        {"stage": "b", "started_at": 0, "wall_sec": 3.0, "cpu_sec": 1.0, "num_items": None, "items_per_sec": None, "peak_rss_mb": None, "pid": 1, "attrs": {}},
+        {"stage": "a", "started_at": 1, "wall_sec": 1.5, "cpu_sec": 0.5, "num_items": 3, "items_per_sec": 2.0, "peak_rss_mb": 20.0, "pid": 1, "attrs": {}}
+    ]
+    records[1].update(children_cpu_sec=2.5, children_max_rss_mb=64.0, error="ValueError")
+    with open(instrument.write_trace(str(tmp_path / "trace.csv"), records), newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["stage"] for row in rows] == ["a", "b", "a"] and json.loads(rows[0]["attrs"]) == {"k": 1}
+    assert (rows[1]["children_cpu_sec"], rows[1]["children_max_rss_mb"], rows[1]["error"]) == ("2.5", "64.0", "ValueError")
+    assert rows[0]["error"] == ""
+
+    # stages appended as they end keep the same fields
+    instrument.enable(trace_file=str(tmp_path / "appended.csv"), sample_memory=False)
+    with pytest.raises(ValueError):
+        with instrument.stage("failing", profile=False):
+            raise ValueError()
+    with open(tmp_path / "appended.csv", newline="") as f:
+        [row] = list(csv.DictReader(f))
+    assert row["error"] == "ValueError" and float(row["children_cpu_sec"]) >= 0 and float(row["children_max_rss_mb"]) >= 0
+
+    summary = instrument.summarise(records)
+    assert list(summary) == ["b", "a"]
+    assert summary["a"] == {"calls": 2, "wall_sec": 2.5, "cpu_sec": 1.0, "num_items": 5, "peak_rss_mb": 20.0}
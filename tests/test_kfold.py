@@ -0,0 +1,63 @@
+import kfold
+import evaluation
+
+import os
+
+import numpy as np
+import pytest
+from sklearn.base import clone
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import StratifiedKFold
+
+
+@pytest.fixture
+def data():
+    rng = np.random.RandomState(0)
+    y = np.repeat(np.array(["DMT", "LSD", "MDMA"]), 40)
+    X = rng.normal(size=(len(y), 6)) + (np.unique(y, return_inverse=True)[1].ravel()[:, None] == np.arange(6)) * 1.5
+    return X, y
+
+# the plain sequential loop over folds that run_k_fold replaces
+def run_k_fold_reference(X, y, clf_untrained, k_fold):
+    labels = np.unique(y)
+    results = []
+    for train_indices, test_indices in StratifiedKFold(n_splits=k_fold).split(X, y):
+        clf = clone(clf_untrained).fit(X[train_indices], y[train_indices])
+        results.append(evaluation.evaluate_classifier(clf, X[test_indices], y[test_indices], labels, max_k=2))
+    return evaluation.aggregate_folds(results, labels)
+
+
+"""
+Shared feature matrix
+"""
+def test_publish_array_reuses_npy_memmaps(data, tmp_path):
+    X, _ = data
+    filepath, directory = kfold.publish_array(X, temp_dir=str(tmp_path))
+    assert directory is not None and os.path.dirname(filepath) == directory
+    np.testing.assert_array_equal(np.load(filepath), X)
+
+    npy_filepath = str(tmp_path / "X.npy")
+    np.save(npy_filepath, X)
+    assert kfold.publish_array(np.load(npy_filepath, mmap_mode="r"), temp_dir=str(tmp_path)) == (npy_filepath, None)
+    # a slice of the memmap is not the whole file, so it has to be published
+    assert kfold.get_npy_source(np.load(npy_filepath, mmap_mode="r")[10:]) is None
+
+
+"""
+Runner
+"""
+@pytest.mark.parametrize("num_processes", [1, 3])
+def test_run_k_fold_matches_sequential_loop(data, tmp_path, num_processes):
+    X, y = data
+    clf = LogisticRegression(max_iter=1000)
+    aggregate = kfold.run_k_fold(X, y, clf, k_fold=4, num_processes=num_processes, max_k=2, temp_dir=str(tmp_path))
+    expected = run_k_fold_reference(X, y, clf, k_fold=4)
+
+    assert len(aggregate["folds"]) == 4
+    np.testing.assert_allclose(aggregate["report"].drop(columns="class").values, expected["report"].drop(columns="class").values)
+    np.testing.assert_allclose(aggregate["confusion_matrix"], expected["confusion_matrix"])
+    np.testing.assert_allclose(aggregate["top_k_accuracy"], expected["top_k_accuracy"])
+    assert aggregate["f_score_mean"] == pytest.approx(expected["f_score_mean"])
+    # the published copy of X is removed, and nothing is left behind in this process
+    assert os.listdir(tmp_path) == []
+    assert kfold._worker_state == {}
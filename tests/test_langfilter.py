@@ -0,0 +1,32 @@
+import langfilter
+
+import pytest
+
+
+pytest.importorskip("langdetect")
+
+ENGLISH = "After about forty minutes the walls started breathing and I felt a warm rush through my whole body while the music played."
+SPANISH = "La experiencia fue muy intensa y sentí que el tiempo se detenía por completo durante horas con mis amigos."
+GERMAN = "Ich hatte das Gefühl, dass die Musik durch meinen Körper floss und alles um mich herum leuchtete und atmete."
+
+def test_filter_language_keeps_english_and_counts_rejections():
+    drug_to_trip_reports_dict = {"LSD": [ENGLISH, SPANISH], "DMT": [GERMAN, ENGLISH + " Again."]}
+    filtered_dict, stats = langfilter.filter_language(drug_to_trip_reports_dict, num_processes=2, use_cache=False)
+    assert filtered_dict == {"LSD": [ENGLISH], "DMT": [ENGLISH + " Again."]}
+    assert stats["drugs"]["LSD"] == {"total": 2, "rejected": 1, "rejected_languages": {"es": 1}}
+    assert stats["drugs"]["DMT"]["rejected_languages"] == {"de": 1}
+
+def test_cached_verdicts_are_reused(tmp_path):
+    language_cache = langfilter.LanguageCache(str(tmp_path / "languages.sqlite"))
+    texts = [ENGLISH, SPANISH, "1234 5678"]
+    verdicts, num_cached = langfilter.detect_languages(texts, num_processes=2, language_cache=language_cache)
+    assert num_cached == 0
+    assert verdicts[langfilter.hash_text("1234 5678")] == langfilter.UNKNOWN_LANGUAGE
+    cached_verdicts, num_cached = langfilter.detect_languages(texts, num_processes=2, language_cache=language_cache)
+    assert num_cached == len(texts) and cached_verdicts == verdicts
+
+def test_verdicts_are_reproducible_for_a_seed():
+    texts = [ENGLISH, SPANISH, GERMAN, "ok ok ok"]
+    first, _ = langfilter.detect_languages(texts, num_processes=2, batch_size=1)
+    second, _ = langfilter.detect_languages(texts, num_processes=1, batch_size=3)
+    assert first == second
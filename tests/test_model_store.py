@@ -0,0 +1,30 @@
+import model_store
+
+import numpy as np
+import pytest
+
+
+gensim = pytest.importorskip("gensim")
+
+@pytest.fixture
+def model():
+    docs = [gensim.models.doc2vec.TaggedDocument(["walls", "breathing", "music", f"w{i % 5}"], [f"DOC_{i}"]) for i in range(20)]
+    return gensim.models.doc2vec.Doc2Vec(docs, vector_size=8, min_count=1, epochs=2, workers=1, seed=0)
+
+def test_arrays_are_saved_separately_and_memory_mapped(tmp_path, model):
+    filepath = str(tmp_path / "model.model")
+    model_store.save_doc2vec_model(model, filepath, hyperparams={"window": 5})
+    metadata = model_store.read_model_metadata(filepath)
+    assert metadata["vector_size"] == 8 and metadata["corpus_count"] == 20 and metadata["hyperparams"] == {"window": 5}
+    assert len(metadata["array_files"]) > 0
+    loaded = model_store.load_doc2vec_model(filepath)
+    assert isinstance(loaded.dv.vectors, np.memmap)
+    assert np.array_equal(loaded.dv.vectors, model.dv.vectors)
+
+def test_lazy_model_loads_on_first_use(tmp_path, model):
+    filepath = str(tmp_path / "model.model")
+    model_store.save_doc2vec_model(model, filepath)
+    lazy = model_store.open_doc2vec_model(filepath)
+    assert not lazy.is_loaded and lazy.metadata["vector_size"] == 8
+    assert np.array_equal(lazy.dv.vectors, model.dv.vectors)
+    assert lazy.is_loaded
@@ -0,0 +1,23 @@
+import json
+import subprocess
+import sys
+
+
+# runs in a fresh interpreter with spaCy made unimportable, so that a tokenization stage that hangs instead of
+# falling back (e.g. worker initializers failing and respawning forever) fails the test through the timeout
+BENCHMARK_CODE = """
+import json, sys
+sys.modules["spacy"] = None
+from benchmarks import pipeline_benchmark
+results = pipeline_benchmark.run_benchmark(num_docs=60, num_epochs=1, k_fold=2, num_processes=2, verbose=False)
+print(json.dumps(results, default=str))
+"""
+
+def test_benchmark_runs_without_spacy():
+    result = subprocess.run([sys.executable, "-c", BENCHMARK_CODE], capture_output=True, text=True, timeout=240)
+    assert result.returncode == 0, result.stderr
+    results = json.loads(result.stdout.strip().splitlines()[-1])
+    assert "spacy" in results["tokenization"]["attrs"]["skipped"]
+    for name in ("extraction", "language_filter", "vocabulary", "doc2vec_epoch_1", "feature_extraction", "k_fold"):
+        assert results[name]["wall_sec"] >= 0
+    assert results["tokenization"]["num_items"] > 0 and results["vocabulary"]["vocabulary_size"] > 0
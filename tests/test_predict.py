@@ -0,0 +1,127 @@
+import predict
+
+import http.client
+import json
+import threading
+
+import numpy as np
+import pytest
+
+
+class FakePredictor:
+    # ranks drugs by how often their name occurs in the text; "crash" makes the whole batch fail
+    classes = ["DMT", "LSD", "Psilocybin"]
+
+    def __init__(self):
+        self.vector_cache = predict.VectorCache()
+
+    def predict(self, texts, top_n=predict.TOP_N):
+        if any("crash" in text for text in texts):
+            raise RuntimeError("model exploded")
+        predictions = []
+        for text in texts:
+            counts = [text.count(drug) for drug in self.classes]
+            order = sorted(range(len(self.classes)), key=lambda j: (-counts[j], j))[:top_n]
+            predictions.append([{"drug": self.classes[j], "probability": counts[j] / max(1, sum(counts))} for j in order])
+        return predictions
+
+@pytest.fixture
+def server():
+    batcher = predict.MicroBatcher(FakePredictor(), max_wait_sec=0.001, num_workers=2)
+    server = predict.create_server(batcher, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def request(server, method, path, body=None):
+    connection = http.client.HTTPConnection(*server.server_address, timeout=10)
+    connection.request(method, path, body=json.dumps(body) if isinstance(body, (dict, list)) else body)
+    response = connection.getresponse()
+    result = response.status, json.loads(response.read())
+    connection.close()
+    return result
+
+
+"""
+Server
+"""
+def test_predict_single_and_batch(server):
+    status, body = request(server, "POST", "/predict", {"text": "LSD LSD DMT"})
+    assert status == 200
+    assert [p["drug"] for p in body["predictions"][0]] == ["LSD", "DMT", "Psilocybin"]
+    status, body = request(server, "POST", "/predict", {"texts": ["DMT", "Psilocybin"], "top_n": 1})
+    assert status == 200 and [[p["drug"] for p in ps] for ps in body["predictions"]] == [["DMT"], ["Psilocybin"]]
+
+@pytest.mark.parametrize("body", [
+    "not json",
+    {"txt": "LSD"},
+    {"texts": "LSD"},
+    {"texts": ["LSD", 3]},
+    {"text": "LSD", "top_n": 0},
+    {"text": "LSD", "top_n": -2},
+    {"text": "LSD", "top_n": 1.5},
+    {"text": "LSD", "top_n": "3"},
+    {"text": "LSD", "top_n": True},
+    ["LSD"]
+])
+def test_invalid_requests_are_rejected(server, body):
+    status, response = request(server, "POST", "/predict", body)
+    assert status == 400 and "error" in response
+
+def test_prediction_errors_return_500(server):
+    status, body = request(server, "POST", "/predict", {"texts": ["crash", "LSD"]})
+    assert status == 500 and "model exploded" in body["error"]
+    # the server keeps serving afterwards
+    assert request(server, "POST", "/predict", {"text": "LSD"})[0] == 200
+
+def test_health_stats_and_not_found(server):
+    assert request(server, "GET", "/health") == (200, {"status": "ok"})
+    request(server, "POST", "/predict", {"text": "LSD"})
+    status, stats = request(server, "GET", "/stats")
+    assert status == 200 and stats["num_requests"] >= 1 and "latency_p50_ms" in stats
+    assert request(server, "GET", "/nothing")[0] == 404
+    assert request(server, "POST", "/nothing", {})[0] == 404
+
+
+"""
+Predictor
+"""
+class FakeSpacyPipeline:
+    def __init__(self):
+        self.texts = []
+
+    def pipe(self, texts):
+        self.texts.extend(texts)
+        return [text.split() for text in texts]
+
+class FakeDoc2Vec:
+    def infer_vector(self, tokens):
+        return np.array([len(tokens), sum(map(len, tokens))], dtype=np.float32)
+
+def test_predictor_preprocesses_like_training_and_caches_vectors(monkeypatch):
+    monkeypatch.setattr(predict.preprocessing, "tokenize", lambda doc, spacy_pipeline, custom_stop_words: doc)
+    predictor = predict.Predictor.__new__(predict.Predictor)
+    predictor.spacy_pipeline = FakeSpacyPipeline()
+    predictor.spacy_lock = threading.Lock()
+    predictor.custom_stop_words = frozenset()
+    predictor.model = FakeDoc2Vec()
+    predictor.vector_cache = predict.VectorCache()
+
+    X = predictor.infer_vectors(["walls  breathing​\n", "colours"])
+    # whitespace is left as is (only zero-width spaces are replaced), as in notebook 1
+    assert predictor.spacy_pipeline.texts == ["walls  breathing \n", "colours"]
+    assert X.tolist() == [[2, 14], [1, 7]]
+    X = predictor.infer_vectors(["colours", "walls  breathing​\n"])
+    assert X.tolist() == [[1, 7], [2, 14]]
+    assert len(predictor.spacy_pipeline.texts) == 2
+    assert predictor.vector_cache.hits == 2 and predictor.vector_cache.misses == 2
+
+def test_vector_cache_evicts_least_recently_used():
+    vector_cache = predict.VectorCache(max_size=2)
+    vector_cache.put("a", 1)
+    vector_cache.put("b", 2)
+    vector_cache.get("a")
+    vector_cache.put("c", 3)
+    assert vector_cache.get("b") is None and vector_cache.get("a") == 1
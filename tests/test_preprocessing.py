@@ -0,0 +1,66 @@
+import preprocessing
+
+import concurrent.futures
+import multiprocessing
+
+import pytest
+
+
+class FakeToken:
+    def __init__(self, text):
+        self.text = text
+
+class FakePipeline:
+    # splits on whitespace, standing in for a loaded spaCy pipeline
+    def pipe(self, texts, batch_size):
+        for text in texts:
+            yield [FakeToken(word) for word in text.split()]
+
+def fake_tokenize(doc, spacy_pipeline, custom_stop_words):
+    return [token.text.lower() for token in doc if token.text.lower() not in custom_stop_words]
+
+@pytest.fixture
+def fake_spacy(monkeypatch):
+    monkeypatch.setattr(preprocessing, "create_spacy_pipeline", lambda model, disable: FakePipeline())
+    monkeypatch.setattr(preprocessing, "tokenize", fake_tokenize)
+
+fork_only = pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(),
+                               reason="the fake pipeline only reaches the workers through fork")
+
+def test_preprocess_removes_zero_width_spaces():
+    assert preprocessing.preprocess("a\u200bb") == "a b"
+
+def test_missing_model_fails_fast(monkeypatch):
+    def create_spacy_pipeline(model, disable):
+        raise OSError(f"Can't find model '{model}'")
+    monkeypatch.setattr(preprocessing, "create_spacy_pipeline", create_spacy_pipeline)
+    with pytest.raises(OSError):
+        list(preprocessing.tokenize_trip_reports(["some text"], [], n_process=2))
+
+def test_missing_spacy_raises_instead_of_hanging():
+    try:
+        import spacy
+        pytest.skip("spaCy is installed")
+    except ImportError:
+        pass
+    with pytest.raises(ImportError):
+        list(preprocessing.tokenize_trip_reports(["some text"], [], n_process=2))
+
+def test_single_process_tokenization(fake_spacy):
+    texts = ["The walls Breathing", "music LSD music"]
+    assert list(preprocessing.tokenize_trip_reports(texts, ["lsd"])) == [["the", "walls", "breathing"], ["music", "music"]]
+
+@fork_only
+def test_multi_process_tokenization_keeps_order(fake_spacy):
+    texts = [f"doc {i} word{i}" for i in range(100)]
+    token_lists = list(preprocessing.tokenize_trip_reports(texts, ["doc"], n_process=2, batch_size=7))
+    assert token_lists == [[str(i), f"word{i}"] for i in range(100)]
+
+def _failing_init_worker(*args):
+    raise ImportError("No module named 'spacy'")
+
+@fork_only
+def test_worker_initializer_failure_raises(fake_spacy, monkeypatch):
+    monkeypatch.setattr(preprocessing, "_init_worker", _failing_init_worker)
+    with pytest.raises(concurrent.futures.process.BrokenProcessPool):
+        list(preprocessing.tokenize_trip_reports(["a b", "c d"], [], n_process=2, batch_size=1))
@@ -0,0 +1,79 @@
+import projection
+
+import os
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def data():
+    rng = np.random.RandomState(0)
+    y = np.repeat(np.array(["DMT", "LSD", "2C-B/2C-I"]), 15)
+    X = rng.normal(size=(len(y), 8)) + (np.unique(y, return_inverse=True)[1].ravel()[:, None] == np.arange(8)) * 3.0
+    return X, y
+
+
+"""
+Projection
+"""
+def test_projection_is_cached_by_vectors_and_parameters(data, tmp_path, monkeypatch):
+    X, _ = data
+    cache_dir = str(tmp_path / "projections")
+    X_projected, indices = projection.project(X, cache_dir=cache_dir, verbose=False, perplexity=5.0)
+    assert X_projected.shape == (len(X), 2) and indices.tolist() == list(range(len(X)))
+    assert len(os.listdir(cache_dir)) == 1
+
+    import sklearn.manifold
+
+    class FailingTSNE:
+        def __init__(self, **kwargs):
+            raise AssertionError("t-SNE should not run again")
+
+    monkeypatch.setattr(sklearn.manifold, "TSNE", FailingTSNE)
+    X_cached, _ = projection.project(X, cache_dir=cache_dir, verbose=False, perplexity=5.0)
+    np.testing.assert_array_equal(X_cached, X_projected)
+
+    # other vectors or parameters miss the cache
+    X_other = X.copy()
+    X_other[0, 0] += 1
+    for args, kwargs in (((X_other,), {"perplexity": 5.0}), ((X,), {"perplexity": 6.0}), ((X,), {"perplexity": 5.0, "max_samples": 20})):
+        with pytest.raises(AssertionError):
+            projection.project(*args, cache_dir=cache_dir, verbose=False, **kwargs)
+
+def test_subsample_indices():
+    assert projection.get_subsample_indices(5, None).tolist() == [0, 1, 2, 3, 4]
+    assert projection.get_subsample_indices(5, 10).tolist() == [0, 1, 2, 3, 4]
+    indices = projection.get_subsample_indices(100, 10)
+    assert len(set(indices)) == 10 and (np.diff(indices) > 0).all()
+    np.testing.assert_array_equal(indices, projection.get_subsample_indices(100, 10))
+
+
+"""
+Batch rendering
+"""
+@pytest.mark.parametrize("num_processes", [1, 2])
+def test_render_drug_scatters(data, tmp_path, num_processes):
+    X, y = data
+    output_dir = str(tmp_path / "scatters")
+    filepaths = projection.render_drug_scatters(X[:, :2], y, ["DMT", "2C-B/2C-I"], output_dir=output_dir,
+                                                num_processes=num_processes, figsize=(4, 4), dpi=20)
+    assert [os.path.basename(filepath) for filepath in filepaths] == ["DMT.png", "2C-B_2C-I.png"]
+    assert all(os.path.getsize(filepath) > 0 for filepath in filepaths)
+    assert projection._worker_state == {}
+
+def test_rendering_in_process_leaves_the_callers_backend_and_figures_alone(data, tmp_path):
+    import matplotlib
+    import matplotlib.pyplot as plt
+
+    X, y = data
+    backend = matplotlib.get_backend()
+    matplotlib.use("svg")
+    try:
+        figure = plt.figure()
+        projection.render_drug_scatters(X[:, :2], y, ["LSD"], output_dir=str(tmp_path), num_processes=1, figsize=(4, 4), dpi=20)
+        assert matplotlib.get_backend() == "svg"
+        assert plt.fignum_exists(figure.number) and plt.get_fignums() == [figure.number]
+    finally:
+        plt.close("all")
+        matplotlib.use(backend)
@@ -0,0 +1,31 @@
+import search_log
+
+import json
+
+import numpy as np
+import pytest
+
+
+def test_to_builtin_converts_numpy_scalars():
+    assert json.dumps({"C": np.float64(0.5), "n": np.int32(3)}, default=search_log.to_builtin) == '{"C": 0.5, "n": 3}'
+    with pytest.raises(TypeError):
+        json.dumps({"X": np.zeros(2)}, default=search_log.to_builtin)
+
+def test_trial_log_resumes_and_skips_a_partially_written_line(tmp_path):
+    filepath = str(tmp_path / "trials.jsonl")
+    trial_log = search_log.TrialLog(filepath)
+    trial_log.append({"trial_id": "a", "f_score": np.float32(0.5)})
+    trial_log.append({"trial_id": "a", "done": True})
+    trial_log.append({"trial_id": "b", "f_score": 0.25})
+    with open(filepath, "a") as f:
+        f.write('{"trial_id": "b", "do')
+
+    resumed = search_log.TrialLog(filepath)
+    assert resumed.records == [{"trial_id": "a", "f_score": 0.5}, {"trial_id": "a", "done": True}, {"trial_id": "b", "f_score": 0.25}]
+    assert resumed.get_finished_trial_ids() == {"a"}
+    assert [record["trial_id"] for record in resumed.get_session_records()] == ["a", "b"]
+
+    # the fragment is gone, so a record appended after resuming survives the next resume
+    resumed.append({"trial_id": "b", "done": True})
+    assert search_log.TrialLog(filepath).records == resumed.records
+    assert search_log.TrialLog(filepath).get_finished_trial_ids() == {"a", "b"}
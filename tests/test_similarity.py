@@ -0,0 +1,86 @@
+import similarity
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def X():
+    return np.random.RandomState(0).normal(size=(300, 16))
+
+def brute_force_top_k(X, queries, k):
+    X = X / np.linalg.norm(X, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    scores = queries @ X.T
+    return np.argsort(-scores, axis=1, kind="stable")[:, :k], np.sort(scores, axis=1)[:, ::-1][:, :k]
+
+
+"""
+Normalisation
+"""
+def test_normalise_rows_to_memmap_matches_in_memory_normalisation(X, tmp_path):
+    expected = similarity.normalise_rows(X)
+    X_normalised = similarity.normalise_rows_to_memmap(X, block_size=7)
+    assert isinstance(X_normalised, np.memmap) and X_normalised.dtype == np.float32
+    np.testing.assert_allclose(X_normalised, expected, rtol=1e-6)
+
+    filepath = tmp_path / "index" / similarity.VECTORS_FILENAME
+    similarity.normalise_rows_to_memmap(X, filepath=str(filepath), block_size=7)
+    np.testing.assert_allclose(np.load(filepath), expected, rtol=1e-6)
+
+def test_zero_rows_are_left_as_zeros():
+    X_normalised = similarity.normalise_rows_to_memmap(np.array([[0.0, 0.0], [3.0, 4.0]]))
+    np.testing.assert_allclose(X_normalised, [[0.0, 0.0], [0.6, 0.8]])
+
+
+"""
+Exact index
+"""
+def test_exact_search_matches_brute_force(X):
+    queries = np.random.RandomState(1).normal(size=(5, 16))
+    index = similarity.ExactIndex(X, block_size=64)
+    ids, scores = index.search(queries, k=10)
+    expected_ids, expected_scores = brute_force_top_k(X, queries, 10)
+    np.testing.assert_array_equal(ids, expected_ids)
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+
+def test_search_by_ids_excludes_the_query_documents(X):
+    index = similarity.ExactIndex(X, block_size=64)
+    doc_ids = np.array([0, 150, 299])
+    ids, _ = index.search_by_ids(doc_ids, k=5)
+    assert not (ids == doc_ids[:, None]).any()
+    expected_ids, _ = brute_force_top_k(X, X[doc_ids], 6)
+    np.testing.assert_array_equal(ids, expected_ids[:, 1:])
+
+
+"""
+Approximate (IVF) index
+"""
+def test_ivf_probing_every_cluster_is_exact(X):
+    queries = np.random.RandomState(1).normal(size=(5, 16))
+    index = similarity.IVFIndex.build(X, n_clusters=8, block_size=64)
+    assert sorted(index.list_ids.tolist()) == list(range(len(X)))
+    ids, _ = index.search(queries, k=10, n_probe=8)
+    np.testing.assert_array_equal(ids, brute_force_top_k(X, queries, 10)[0])
+
+def test_ivf_recall(X):
+    queries = np.random.RandomState(1).normal(size=(20, 16))
+    index = similarity.IVFIndex.build(X, n_clusters=8, n_probe=4)
+    ids, _ = index.search(queries, k=10)
+    expected_ids, _ = brute_force_top_k(X, queries, 10)
+    recall = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(ids, expected_ids)])
+    assert recall >= 0.7
+
+def test_ivf_save_and_load(X, tmp_path):
+    directory = tmp_path / "dm"
+    index = similarity.IVFIndex.build(X, n_clusters=8, filepath=str(directory / similarity.VECTORS_FILENAME))
+    index.save(str(directory))
+    loaded_index = similarity.IVFIndex.load(str(directory))
+    assert isinstance(loaded_index.X, np.memmap) and len(loaded_index) == len(X)
+    np.testing.assert_array_equal(loaded_index.X, index.X)
+    np.testing.assert_array_equal(loaded_index.search_by_ids([3, 4])[0], index.search_by_ids([3, 4])[0])
+
+    # an index built on a temporary memmap is copied into the directory
+    other_directory = tmp_path / "other"
+    similarity.IVFIndex.build(X, n_clusters=8).save(str(other_directory))
+    np.testing.assert_array_equal(similarity.IVFIndex.load(str(other_directory)).X, index.X)
@@ -0,0 +1,27 @@
+import util
+import evaluation
+import plotting
+from benchmarks import import_time
+
+import pytest
+
+
+"""
+Lazy attributes
+"""
+def test_moved_functions_resolve_lazily():
+    assert util.test_classifier is evaluation.test_classifier
+    assert util.train_and_test_classifier_k_fold is evaluation.train_and_test_classifier_k_fold
+    assert util.plot_confusion_matrix is plotting.plot_confusion_matrix
+    with pytest.raises(AttributeError):
+        util.not_an_attribute
+
+
+"""
+Import time
+"""
+@pytest.mark.parametrize("module", sorted(import_time.IMPORT_TIME_BUDGETS_MS))
+def test_entry_points_do_not_import_the_scientific_stack(module):
+    import_times = import_time.get_import_times(module, repeat=1)
+    assert module in import_times
+    assert not [name for name in import_times if name.split(".")[0] in import_time.FORBIDDEN_MODULES]
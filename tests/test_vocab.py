@@ -0,0 +1,43 @@
+import vocab
+import corpus
+
+
+TOKEN_LISTS = [["music", "walls", "music"], ["walls", "geometry"], ["music"]]
+
+def test_counts_and_first_seen_ids():
+    vocabulary = vocab.Vocabulary().add_documents(TOKEN_LISTS)
+    assert vocabulary.id_to_token == ["music", "walls", "geometry"]
+    assert vocabulary.get_ids(["geometry", "music"]) == [2, 0]
+    assert vocabulary.get_count("music") == 3 and vocabulary.num_docs == 3
+    assert vocabulary.get_kept_tokens(min_count=2) == {"music", "walls"}
+    assert vocabulary.filter_tokens(["geometry", "walls", "music"], min_count=2) == ["walls", "music"]
+
+def test_incremental_updates_match_a_single_pass():
+    incremental = vocab.Vocabulary().add_documents(TOKEN_LISTS[:1])
+    assert incremental.get_kept_tokens(min_count=2) == {"music"}
+    incremental.add_documents(TOKEN_LISTS[1:])
+    single_pass = vocab.Vocabulary().add_documents(TOKEN_LISTS)
+    assert incremental.counts == single_pass.counts and incremental.id_to_token == single_pass.id_to_token
+    assert incremental.get_kept_tokens(min_count=2) == {"music", "walls"}
+
+def test_keyed_documents_are_counted_once_across_save_and_load(tmp_path):
+    filepath = str(tmp_path / "vocabulary.tsv")
+    vocabulary = vocab.Vocabulary().add_documents(TOKEN_LISTS[:2], keys=["a", "b"])
+    vocabulary.save(filepath)
+    loaded = vocab.load_or_create_vocabulary(filepath)
+    loaded.add_documents(TOKEN_LISTS, keys=["a", "b", "c"])
+    assert loaded.counts == vocab.Vocabulary().add_documents(TOKEN_LISTS).counts
+    assert loaded.num_docs == 3 and loaded.id_to_token == vocabulary.id_to_token
+    assert vocab.load_or_create_vocabulary(str(tmp_path / "missing.tsv")).num_docs == 0
+
+def test_corpus_shares_the_vocabulary_id_space(tmp_path):
+    vocabulary = vocab.Vocabulary().add_documents(TOKEN_LISTS)
+    corpus.write_corpus([["geometry", "music"], ["new_token"]], ["LSD", "DMT"], directory=str(tmp_path), vocabulary=vocabulary)
+    loaded = corpus.load_corpus(str(tmp_path))
+    assert list(loaded.get_token_ids(0)) == vocabulary.get_ids(["geometry", "music"])
+    assert loaded.vocabulary == vocabulary.id_to_token
+    assert vocabulary.get_id("new_token") == 3 and vocabulary.get_count("new_token") == 0
+
+def test_augmented_custom_stop_words():
+    stop_words = vocab.augment_custom_stop_words(["lsd"])
+    assert {"lsd", "lsds", "pre-lsd", "lsd-like", "lsd-likes"} <= stop_words
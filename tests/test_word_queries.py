@@ -0,0 +1,63 @@
+import word_queries
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def keyed_vectors():
+    from gensim.models import KeyedVectors
+
+    rng = np.random.RandomState(0)
+    keyed_vectors = KeyedVectors(vector_size=8)
+    keyed_vectors.add_vectors([f"w{i}" for i in range(50)], rng.normal(size=(50, 8)).astype(np.float32))
+    return keyed_vectors
+
+@pytest.fixture
+def engine(keyed_vectors):
+    return word_queries.WordQueryEngine(keyed_vectors.index_to_key, keyed_vectors.vectors, query_batch_size=3)
+
+
+"""
+Drug centroids
+"""
+def test_drug_centroids_match_per_drug_means():
+    rng = np.random.RandomState(0)
+    X = rng.normal(size=(40, 5))
+    y = rng.choice(["LSD", "DMT", "MDMA"], size=40)
+    avg_doc_vec = X.mean(axis=0)
+    for sigma in (0, 0.5):
+        drugs, centroids = word_queries.get_drug_centroids(X, y, sigma)
+        assert drugs.tolist() == ["DMT", "LSD", "MDMA"]
+        for drug, centroid in zip(drugs, centroids):
+            mean = X[y == drug].mean(axis=0)
+            np.testing.assert_allclose(centroid, mean + (mean - avg_doc_vec) * sigma, rtol=1e-5, atol=1e-6)
+
+
+"""
+Word vector queries
+"""
+def test_most_similar_matches_gensim(engine, keyed_vectors):
+    words = ["w0", "w7", "w42", "w3"]
+    for word, results in zip(words, engine.most_similar(words, k=5)):
+        expected = keyed_vectors.most_similar(word, topn=5)
+        assert [w for w, _ in results] == [w for w, _ in expected]
+        np.testing.assert_allclose([s for _, s in results], [s for _, s in expected], rtol=1e-5)
+
+def test_analogy_matches_gensim(engine, keyed_vectors):
+    questions = [("w0", "w1", "w2"), ("w5", "w9", "w11"), ("w20", "w30", "w40"), ("w3", "w4", "w8")]
+    for (a, b, c), results in zip(questions, engine.analogy(questions, k=3)):
+        expected = keyed_vectors.most_similar(positive=[b, c], negative=[a], topn=3)
+        assert [w for w, _ in results] == [w for w, _ in expected]
+
+def test_evaluate_analogies_skips_out_of_vocabulary_questions(engine, keyed_vectors, tmp_path):
+    answer = keyed_vectors.most_similar(positive=["w1", "w2"], negative=["w0"], topn=1)[0][0]
+    wrong = next(w for w in keyed_vectors.index_to_key if w not in ("w0", "w1", "w2", answer))
+    filepath = tmp_path / "questions-words.txt"
+    filepath.write_text(f": section-a\nW0 W1 W2 {answer.upper()}\nw0 w1 w2 {wrong}\n: section-b\nw0 w1 nope w2\n")
+
+    sections = word_queries.read_analogy_questions(str(filepath))
+    assert [name for name, _ in sections] == ["section-a", "section-b"]
+    results = word_queries.evaluate_analogies(engine, sections)
+    assert results["num_questions"] == 3 and results["num_in_vocabulary"] == 2
+    assert results["accuracy"] == 0.5
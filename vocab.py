@@ -0,0 +1,150 @@
+import util
+
+import collections
+import itertools
+import os
+
+
+"""
+Constants
+"""
+MIN_WORD_COUNT = 10
+
+
+"""
+Custom stop words
+"""
+def augment_custom_stop_words(custom_stop_words):
+
+    # add versions of stop words with prefixes and suffixes
+    additions = []
+    for prefix in ["pre-", "mid-", "post-"]:
+        additions += [prefix + w for w in custom_stop_words]
+    for suffix in ["-like", "-type", "-esque"]:
+        additions += [w + suffix for w in custom_stop_words]
+    custom_stop_words += additions
+
+    # add an -s suffix to all custom stop words to catch plurals
+    custom_stop_words += [w + 's' for w in custom_stop_words]
+
+    # reduce to unique elements
+    custom_stop_words = set(custom_stop_words)
+
+    return custom_stop_words
+
+# read the custom stop words file and build the augmented lookup once, as a frozenset for O(1) membership tests
+def load_custom_stop_words(filepath=util.CUSTOM_STOP_WORDS_FILE):
+    with open(filepath) as f:
+        custom_stop_words = [w.strip() for w in f.readlines()]
+    custom_stop_words = [w for w in custom_stop_words if w]
+    return frozenset(augment_custom_stop_words(custom_stop_words))
+
+
+"""
+Vocabulary
+"""
+class Vocabulary:
+    # integer IDs are assigned in first-seen order and never change, so IDs stay valid as new reports are added.
+    # corpus.CorpusWriter takes its token IDs from here, so the corpus and the vocabulary share one ID space
+    def __init__(self):
+        self.token_to_id_dict = {}
+        self.id_to_token = []
+        self.counts = collections.Counter()
+        self.num_docs = 0
+        self.document_keys = set()
+        self._kept_tokens_cache = {}
+
+    def __len__(self):
+        return len(self.id_to_token)
+
+    def __contains__(self, token):
+        return token in self.token_to_id_dict
+
+    # the token's ID, assigning the next one if the token is new (without counting it)
+    def add_token(self, token):
+        token_id = self.token_to_id_dict.get(token)
+        if token_id is None:
+            token_id = len(self.id_to_token)
+            self.token_to_id_dict[token] = token_id
+            self.id_to_token.append(token)
+        return token_id
+
+    # count token frequencies in a single streaming pass, only looking up the distinct tokens of each document. With
+    # keys (e.g. langfilter.hash_text of each report), documents counted by an earlier call or session are skipped,
+    # so a loaded vocabulary can be updated with the whole corpus and only counts the new reports
+    def add_documents(self, token_lists, keys=None):
+        counts = self.counts
+        token_to_id_dict = self.token_to_id_dict
+        keys = keys if keys is not None else itertools.repeat(None)
+        for tokens, key in zip(token_lists, keys):
+            if key is not None:
+                if key in self.document_keys: continue
+                self.document_keys.add(key)
+            document_counts = collections.Counter(tokens)
+            for token in document_counts:
+                if token not in token_to_id_dict:
+                    self.add_token(token)
+            counts.update(document_counts)
+            self.num_docs += 1
+        self._kept_tokens_cache.clear()
+        return self
+
+    def get_id(self, token):
+        return self.token_to_id_dict[token]
+
+    def get_ids(self, tokens):
+        token_to_id_dict = self.token_to_id_dict
+        return [token_to_id_dict[token] for token in tokens]
+
+    def get_count(self, token):
+        return self.counts[token]
+
+    def get_kept_tokens(self, min_count=MIN_WORD_COUNT):
+        if min_count not in self._kept_tokens_cache:
+            self._kept_tokens_cache[min_count] = frozenset(token for token, count in self.counts.items() if count >= min_count)
+        return self._kept_tokens_cache[min_count]
+
+    def filter_tokens(self, tokens, min_count=MIN_WORD_COUNT):
+        kept_tokens = self.get_kept_tokens(min_count)
+        return [token for token in tokens if token in kept_tokens]
+
+    def most_common(self, n=None):
+        return self.counts.most_common(n)
+
+    def save(self, filepath=util.VOCABULARY_FILE):
+        tmp_filepath = filepath + ".tmp"
+        with open(tmp_filepath, "w", encoding="utf-8") as f:
+            f.write(f"#num_docs\t{self.num_docs}\n")
+            for token in self.id_to_token:
+                f.write(f"{token}\t{self.counts[token]}\n")
+        os.replace(tmp_filepath, filepath)
+        keys_filepath = get_document_keys_filepath(filepath)
+        with open(keys_filepath + ".tmp", "w", encoding="utf-8") as f:
+            f.writelines(f"{key}\n" for key in sorted(self.document_keys))
+        os.replace(keys_filepath + ".tmp", keys_filepath)
+
+    @classmethod
+    def load(cls, filepath=util.VOCABULARY_FILE):
+        vocabulary = cls()
+        with open(filepath, encoding="utf-8") as f:
+            header = f.readline().rstrip("\n").split("\t")
+            vocabulary.num_docs = int(header[1])
+            for line in f:
+                token, count = line.rstrip("\n").rsplit("\t", 1)
+                vocabulary.token_to_id_dict[token] = len(vocabulary.id_to_token)
+                vocabulary.id_to_token.append(token)
+                vocabulary.counts[token] = int(count)
+        keys_filepath = get_document_keys_filepath(filepath)
+        if os.path.exists(keys_filepath):
+            with open(keys_filepath, encoding="utf-8") as f:
+                vocabulary.document_keys = set(line.rstrip("\n") for line in f)
+        return vocabulary
+
+# the keys of the documents a saved vocabulary has counted, next to its token counts
+def get_document_keys_filepath(filepath=util.VOCABULARY_FILE):
+    return os.path.splitext(filepath)[0] + "_documents.txt"
+
+def load_or_create_vocabulary(filepath=util.VOCABULARY_FILE):
+    if os.path.exists(filepath):
+        return Vocabulary.load(filepath)
+    return Vocabulary()
@@ -0,0 +1,136 @@
+import similarity
+
+import time
+
+import numpy as np
+
+
+"""
+Constants
+"""
+# how far each drug centroid is pushed away from the average doc vec (0 leaves it at the plain mean of its doc vecs)
+SIGMA = 0
+
+TOP_K = 10
+
+# queries scored per matrix product, bounding the score matrix to QUERY_BATCH_SIZE x vocabulary size
+QUERY_BATCH_SIZE = 1024
+
+
+"""
+Drug centroids
+"""
+# assign a psych vec to each drug by adding the difference between the mean of the drug's doc vecs and the average doc
+# vec to the mean of the drug's doc vecs, making it more extreme in the ways it already differs from the other drugs;
+# all centroids come out of a single sparse one-hot group-by instead of a python loop over documents
+def get_drug_centroids(X, y, sigma=SIGMA):
+    import scipy.sparse
+
+    drugs, inverse = np.unique(np.asarray(y), return_inverse=True)
+    X = np.asarray(X, dtype=np.float32)
+    one_hot = scipy.sparse.csr_matrix((np.ones(len(inverse), dtype=np.float32), (inverse, np.arange(len(inverse)))),
+                                      shape=(len(drugs), len(inverse)))
+    counts = np.bincount(inverse, minlength=len(drugs)).astype(np.float32)
+    centroids = np.asarray(one_hot @ X) / counts[:, None]
+    avg_doc_vec = X.mean(axis=0)
+    return drugs, centroids + (centroids - avg_doc_vec) * sigma
+
+
+"""
+Word vector queries
+"""
+def get_word_vectors(model):
+    wv = model.wv
+    if hasattr(wv, "index_to_key"):
+        return list(wv.index_to_key), wv.vectors
+    return list(wv.index2word), wv.vectors
+
+
+class WordQueryEngine:
+    # caches the unit-normalised word vector matrix once, then answers batches of most-similar and analogy queries with
+    # one matrix product and a top-k selection per batch instead of one model.wv.most_similar call per query
+    def __init__(self, words, vectors, query_batch_size=QUERY_BATCH_SIZE):
+        self.words = np.asarray(words, dtype=object)
+        self.word_to_index = {word: i for i, word in enumerate(words)}
+        self.vectors = similarity.normalise_rows(vectors)
+        self.query_batch_size = query_batch_size
+
+    @classmethod
+    def from_model(cls, model, **kwargs):
+        words, vectors = get_word_vectors(model)
+        return cls(words, vectors, **kwargs)
+
+    def __contains__(self, word):
+        return word in self.word_to_index
+
+    def get_indices(self, words):
+        return np.array([self.word_to_index[word] for word in words], dtype=np.int64)
+
+    def search(self, queries, k=TOP_K, exclude=None):
+        # queries: (num_queries, vector_size); exclude: optional (num_queries, m) word indices never returned, -1 padded
+        queries = similarity.normalise_rows(np.atleast_2d(queries))
+        all_ids, all_scores = [], []
+        for start in range(0, len(queries), self.query_batch_size):
+            scores = queries[start:start+self.query_batch_size] @ self.vectors.T
+            if exclude is not None:
+                rows, cols = np.nonzero(exclude[start:start+self.query_batch_size] >= 0)
+                scores[rows, exclude[start:start+self.query_batch_size][rows, cols]] = -np.inf
+            ids, top_scores = similarity.top_k(scores, np.arange(len(self.vectors)), k)
+            all_ids.append(ids)
+            all_scores.append(top_scores)
+        return np.vstack(all_ids), np.vstack(all_scores)
+
+    def _to_results(self, ids, scores):
+        return [[(self.words[i], float(s)) for i, s in zip(row_ids, row_scores)] for row_ids, row_scores in zip(ids, scores)]
+
+    def most_similar_to_vectors(self, vectors, k=TOP_K):
+        return self._to_results(*self.search(vectors, k))
+
+    def most_similar(self, words, k=TOP_K):
+        indices = self.get_indices(words)
+        return self._to_results(*self.search(self.vectors[indices], k, exclude=indices[:, None]))
+
+    def analogy_ids(self, questions, k=1):
+        # 3CosAdd over unit vectors, as gensim does: a is to b as c is to ? -> nearest to b - a + c, excluding a, b and c
+        indices = np.array([[self.word_to_index[word] for word in question] for question in questions], dtype=np.int64)
+        a, b, c = self.vectors[indices[:, 0]], self.vectors[indices[:, 1]], self.vectors[indices[:, 2]]
+        return self.search(b - a + c, k, exclude=indices)
+
+    def analogy(self, questions, k=1):
+        return self._to_results(*self.analogy_ids(questions, k))
+
+
+"""
+Analogy evaluation
+"""
+# the standard word2vec analogy set ("Athens Greece Baghdad Iraq" lines grouped under ": section" headers)
+def read_analogy_questions(filepath=None, lowercase=True):
+    if filepath is None:
+        from gensim.test.utils import datapath
+        filepath = datapath("questions-words.txt")
+    sections = []
+    with open(filepath) as f:
+        for line in f:
+            if line.startswith(":"):
+                sections.append((line[1:].strip(), []))
+            elif line.strip():
+                words = line.lower().split() if lowercase else line.split()
+                sections[-1][1].append(tuple(words))
+    return sections
+
+def evaluate_analogies(engine, sections):
+    questions = [question for _, section_questions in sections for question in section_questions
+                 if all(word in engine for word in question)]
+    num_questions = sum(len(section_questions) for _, section_questions in sections)
+    if len(questions) == 0:
+        return {"num_questions": num_questions, "num_in_vocabulary": 0, "accuracy": None, "queries_per_sec": None}
+    start = time.perf_counter()
+    ids, _ = engine.analogy_ids([question[:3] for question in questions], k=1)
+    elapsed = time.perf_counter() - start
+    answers = engine.get_indices([question[3] for question in questions])
+    return {
+        "num_questions": num_questions,
+        "num_in_vocabulary": len(questions),
+        "accuracy": float(np.mean(ids[:, 0] == answers)),
+        "queries_per_sec": len(questions) / elapsed
+    }